@@ -1,10 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Dict, List, Any, Optional
 import logging
+import os
+import tempfile
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.services.ai_agent import AIAgentService
 from app.core.database import get_db
+from app.core.llm import get_llm_metrics
+from app.core.serialization import InvalidFieldsError, parse_fields
+from app.core.sqlite_writer import sqlite_writer
+from app.services.template_renderer import template_engine
+from app.services.lead_persistence import lead_persistence
+from app.services.lead_dedup import lead_dedup_index
+from app.services.blacklist import blacklist_registry
+from app.services.enrichment import enrichment_service
+from app.services.lead_repository import lead_repository, InvalidCursorError
+from app.services.profile_repository import profile_repository, ProfileNotFoundError
+from app.services.interaction_log import interaction_log, LeadNotFoundError
+from app.services.factory_stats import factory_stats_service
+from app.services.follow_up_scheduler import follow_up_scheduler
+from app.services.lead_search import lead_search, InvalidSearchQueryError
+from app.services.lead_transfer import (
+    EXPORT_FORMATS, PARQUET_MEDIA_TYPE, ExportFormatUnavailableError, LeadImporter, LeadImportError,
+    export_parquet, parquet_available, stream_export
+)
 from app.models.factory import Factory
 from app.models.lead import Lead
 
@@ -68,6 +92,8 @@ async def confirm_factory_profile(factory_data: Dict[str, Any]):
                 detail=result["message"]
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"确认工厂档案失败: {e}")
         raise HTTPException(
@@ -161,19 +187,22 @@ async def get_development_progress(factory_id: int):
 
 
 @api_router.get("/factories")
-async def get_factories():
+async def get_factories(db: AsyncSession = Depends(get_db)):
     """获取所有工厂列表"""
     try:
-        # 这里应该从数据库获取工厂列表
-        # 暂时返回模拟数据
+        rows = (await db.execute(
+            select(Factory.id, Factory.name, Factory.website, Factory.location, Factory.is_active)
+            .order_by(Factory.id)
+        )).all()
         factories = [
             {
-                "id": 1,
-                "name": "优质制造工厂",
-                "website": "https://example.com",
-                "location": "中国深圳",
-                "status": "active"
+                "id": row.id,
+                "name": row.name,
+                "website": row.website,
+                "location": row.location,
+                "status": "active" if row.is_active else "inactive"
             }
+            for row in rows
         ]
         
         return JSONResponse(
@@ -196,18 +225,7 @@ async def get_factories():
 async def get_factory(factory_id: int):
     """获取特定工厂信息"""
     try:
-        # 这里应该从数据库获取工厂信息
-        # 暂时返回模拟数据
-        factory = {
-            "id": factory_id,
-            "name": "优质制造工厂",
-            "website": "https://example.com",
-            "description": "专业的制造业工厂",
-            "location": "中国深圳",
-            "main_products": ["电子产品", "家居用品"],
-            "core_advantages": ["高质量", "快速交付"],
-            "status": "active"
-        }
+        factory = await profile_repository.get_factory(factory_id)
         
         return JSONResponse(
             status_code=status.HTTP_200_OK,
@@ -217,6 +235,11 @@ async def get_factory(factory_id: int):
             }
         )
         
+    except ProfileNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"获取工厂信息失败: {e}")
         raise HTTPException(
@@ -226,80 +249,219 @@ async def get_factory(factory_id: int):
 
 
 @api_router.get("/leads")
-async def get_leads(factory_id: Optional[int] = None, status: Optional[str] = None):
-    """获取潜在客户列表"""
+async def get_leads(
+    factory_id: Optional[int] = None,
+    qualification_status: Optional[str] = Query(None, alias="status"),
+    engagement_level: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，如 id,company_name,lead_score"),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取潜在客户列表（按评分降序，游标分页）"""
     try:
-        # 这里应该从数据库获取潜在客户列表
-        # 暂时返回模拟数据
-        leads = [
-            {
-                "id": 1,
-                "company_name": "创新科技公司",
-                "industry": "消费电子",
-                "location": "北美",
-                "lead_score": 85,
-                "status": "qualified"
-            },
-            {
-                "id": 2,
-                "company_name": "绿色家居公司",
-                "industry": "家居用品",
-                "location": "欧洲",
-                "lead_score": 78,
-                "status": "qualified"
+        leads, next_cursor = await lead_repository.list_leads(
+            db,
+            factory_id=factory_id,
+            qualification_status=qualification_status,
+            engagement_level=engagement_level,
+            limit=limit,
+            cursor=cursor,
+            fields=parse_fields(fields)
+        )
+        
+        return ORJSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "message": "获取潜在客户列表成功",
+                "data": leads,
+                "pagination": {
+                    "limit": limit,
+                    "next_cursor": next_cursor,
+                    "has_more": next_cursor is not None
+                }
             }
-        ]
+        )
         
-        # 应用筛选条件
-        if factory_id:
-            leads = [lead for lead in leads if lead.get("factory_id") == factory_id]
+    except (InvalidCursorError, InvalidFieldsError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"获取潜在客户列表失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取潜在客户列表失败: {str(e)}"
+        )
+
+
+@api_router.get("/leads/export")
+async def export_leads(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv|parquet)$"),
+    factory_id: Optional[int] = None,
+    fields: Optional[str] = Query(None, description="逗号分隔的导出字段，默认全部"),
+):
+    """流式导出潜在客户（NDJSON/CSV），服务端按主键分页读取，内存占用与数据量无关
+
+    Parquet 先写入临时文件再返回，需要安装可选依赖 pyarrow，未安装时返回400。
+    """
+    filename = f"leads_{factory_id or 'all'}.{export_format}"
+    if export_format == "parquet":
+        return await _export_parquet_file(filename, factory_id, fields)
+
+    try:
+        body = stream_export(export_format, factory_id=factory_id, fields=parse_fields(fields))
+    except InvalidFieldsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+async def _export_parquet_file(filename: str, factory_id: Optional[int], fields: Optional[str]) -> FileResponse:
+    if not parquet_available():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parquet导出不可用：需要安装可选依赖 pyarrow"
+        )
+
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        await export_parquet(path, factory_id=factory_id, fields=parse_fields(fields))
+    except (InvalidFieldsError, ExportFormatUnavailableError) as e:
+        os.unlink(path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        os.unlink(path)
+        logger.error(f"导出Parquet失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"导出Parquet失败: {str(e)}"
+        )
+
+    return FileResponse(
+        path,
+        media_type=PARQUET_MEDIA_TYPE,
+        filename=filename,
+        background=BackgroundTask(os.unlink, path)
+    )
+
+
+@api_router.post("/leads/import")
+async def import_leads(
+    request: Request,
+    factory_id: int,
+    import_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+):
+    """流式导入潜在客户，请求体为原始NDJSON或CSV（首行为表头），边接收边去重写入"""
+    try:
+        logger.info(f"开始导入潜在客户，工厂ID: {factory_id}，格式: {import_format}")
         
-        if status:
-            leads = [lead for lead in leads if lead.get("status") == status]
+        result = await LeadImporter(factory_id, import_format).run(request.stream())
         
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content={
-                "message": "获取潜在客户列表成功",
-                "data": leads
+                "message": "潜在客户导入完成",
+                "data": result
             }
         )
         
+    except LeadImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
-        logger.error(f"获取潜在客户列表失败: {e}")
+        logger.error(f"导入潜在客户失败: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"获取潜在客户列表失败: {str(e)}"
+            detail=f"导入潜在客户失败: {str(e)}"
+        )
+
+
+@api_router.get("/leads/search")
+async def search_leads(
+    q: str = Query(..., min_length=1, max_length=200),
+    factory_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段"),
+    db: AsyncSession = Depends(get_db)
+):
+    """全文检索潜在客户（公司名称、业务需求、产品需求及互动内容），按相关度排序"""
+    try:
+        leads, next_cursor = await lead_search.search(
+            db,
+            q,
+            factory_id=factory_id,
+            limit=limit,
+            cursor=cursor,
+            fields=parse_fields(fields)
+        )
+        
+        return ORJSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "message": "检索潜在客户成功",
+                "data": leads,
+                "pagination": {
+                    "limit": limit,
+                    "next_cursor": next_cursor,
+                    "has_more": next_cursor is not None
+                }
+            }
+        )
+        
+    except (InvalidSearchQueryError, InvalidCursorError, InvalidFieldsError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"检索潜在客户失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"检索潜在客户失败: {str(e)}"
         )
 
 
 @api_router.get("/leads/{lead_id}")
-async def get_lead(lead_id: int):
-    """获取特定潜在客户信息"""
+async def get_lead(lead_id: int, db: AsyncSession = Depends(get_db)):
+    """获取特定潜在客户信息（含所属工厂和互动记录）"""
     try:
-        # 这里应该从数据库获取潜在客户信息
-        # 暂时返回模拟数据
-        lead = {
-            "id": lead_id,
-            "company_name": "创新科技公司",
-            "industry": "消费电子",
-            "company_size": "100-500人",
-            "location": "北美",
-            "contact_name": "John Smith",
-            "contact_title": "采购经理",
-            "contact_email": "john@example.com",
-            "lead_score": 85,
-            "status": "qualified"
-        }
+        lead = await lead_repository.get_lead(db, lead_id)
+        if lead is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"潜在客户 {lead_id} 不存在"
+            )
         
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content={
                 "message": "获取潜在客户信息成功",
-                "data": lead
+                "data": {
+                    **lead.to_dict(),
+                    "factory": {"id": lead.factory.id, "name": lead.factory.name} if lead.factory else None,
+                    "interactions": [interaction.to_dict() for interaction in lead.interactions]
+                }
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取潜在客户信息失败: {e}")
         raise HTTPException(
@@ -309,13 +471,16 @@ async def get_lead(lead_id: int):
 
 
 @api_router.post("/leads/{lead_id}/interact")
-async def create_lead_interaction(lead_id: int, interaction_data: Dict[str, Any]):
+async def create_lead_interaction(
+    lead_id: int,
+    interaction_data: Dict[str, Any],
+    db: AsyncSession = Depends(get_db)
+):
     """创建客户互动记录"""
     try:
         logger.info(f"创建客户互动记录，客户ID: {lead_id}")
         
-        # 这里应该保存到数据库
-        # 暂时返回成功响应
+        interaction = await interaction_log.record(db, lead_id, interaction_data)
         
         return JSONResponse(
             status_code=status.HTTP_201_CREATED,
@@ -323,13 +488,18 @@ async def create_lead_interaction(lead_id: int, interaction_data: Dict[str, Any]
                 "message": "客户互动记录创建成功",
                 "data": {
                     "lead_id": lead_id,
-                    "interaction_id": 1,
-                    "interaction_type": interaction_data.get("type"),
+                    "interaction_id": interaction.id,
+                    "interaction_type": interaction.interaction_type,
                     "status": "created"
                 }
             }
         )
         
+    except LeadNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"创建客户互动记录失败: {e}")
         raise HTTPException(
@@ -338,22 +508,59 @@ async def create_lead_interaction(lead_id: int, interaction_data: Dict[str, Any]
         )
 
 
+@api_router.get("/leads/{lead_id}/interactions")
+async def get_lead_interactions(
+    lead_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    before_id: Optional[int] = None,
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段"),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取客户互动记录（按时间倒序分页）"""
+    try:
+        field_names = parse_fields(fields)
+        if field_names is not None and "id" not in field_names:
+            # 分页需要记录ID
+            field_names.insert(0, "id")
+        interactions = await interaction_log.list_interactions(
+            db, lead_id, limit=limit, before_id=before_id, fields=field_names
+        )
+        
+        return ORJSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "message": "获取客户互动记录成功",
+                "data": interactions,
+                "pagination": {
+                    "limit": limit,
+                    "next_before_id": interactions[-1]["id"] if len(interactions) == limit else None
+                }
+            }
+        )
+        
+    except InvalidFieldsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"获取客户互动记录失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取客户互动记录失败: {str(e)}"
+        )
+
+
 @api_router.get("/analytics/summary")
-async def get_analytics_summary(factory_id: Optional[int] = None):
-    """获取分析摘要"""
+async def get_analytics_summary(factory_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """获取分析摘要（读取增量维护的工厂统计）"""
     try:
-        # 这里应该从数据库获取分析数据
-        # 暂时返回模拟数据
-        summary = {
-            "total_factories": 1,
-            "total_leads": 150,
-            "qualified_leads": 45,
-            "conversion_rate": 0.23,
-            "total_interactions": 320,
-            "response_rate": 0.18,
-            "top_industries": ["消费电子", "家居用品", "汽车"],
-            "top_markets": ["北美", "欧洲", "东南亚"]
-        }
+        summary = await factory_stats_service.get_summary(db, factory_id)
+        if summary is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"工厂 {factory_id} 不存在"
+            )
         
         return JSONResponse(
             status_code=status.HTTP_200_OK,
@@ -363,6 +570,8 @@ async def get_analytics_summary(factory_id: Optional[int] = None):
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取分析摘要失败: {e}")
         raise HTTPException(
@@ -371,6 +580,92 @@ async def get_analytics_summary(factory_id: Optional[int] = None):
         )
 
 
+@api_router.get("/analytics/sources")
+async def get_lead_source_stats(db: AsyncSession = Depends(get_db)):
+    """获取各客户来源的效果统计"""
+    try:
+        sources = await factory_stats_service.list_source_stats(db)
+        
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "message": "获取客户来源统计成功",
+                "data": sources
+            }
+        )
+        
+    except Exception as e:
+        logger.error(f"获取客户来源统计失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取客户来源统计失败: {str(e)}"
+        )
+
+
+@api_router.get("/analytics/sources/{source_name}")
+async def get_lead_source(source_name: str, db: AsyncSession = Depends(get_db)):
+    """获取单个客户来源的效果统计"""
+    try:
+        source = await factory_stats_service.get_source_stats(db, source_name)
+        if source is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"客户来源 {source_name} 不存在"
+            )
+        
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "message": "获取客户来源统计成功",
+                "data": source
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取客户来源统计失败: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取客户来源统计失败: {str(e)}"
+        )
+
+
+@api_router.get("/llm/metrics")
+async def get_llm_layer_metrics():
+    """获取LLM调用层指标"""
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "获取LLM指标成功",
+            "data": {
+                **get_llm_metrics(),
+                "template_rendering": template_engine.get_metrics()
+            }
+        }
+    )
+
+
+@api_router.get("/pipeline/metrics")
+async def get_lead_pipeline_metrics():
+    """获取潜在客户处理管道指标（黑名单、去重、数据丰富、批量写入、SQLite写队列、跟进调度、档案缓存）"""
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "获取管道指标成功",
+            "data": {
+                "blacklist": blacklist_registry.get_metrics(),
+                "dedup": lead_dedup_index.get_metrics(),
+                "enrichment": enrichment_service.get_metrics(),
+                "persistence": lead_persistence.get_metrics(),
+                "sqlite_writer": sqlite_writer.get_metrics(),
+                "follow_up": follow_up_scheduler.get_metrics(),
+                "profiles": profile_repository.get_metrics()
+            }
+        }
+    )
+
+
 @api_router.get("/health")
 async def health_check():
     """健康检查"""
@@ -0,0 +1,172 @@
+import time
+from collections import deque
+from typing import Dict, Any, Hashable
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """按错误率和延迟SLO熔断的断路器
+
+    最近窗口内的失败率或超过延迟SLO的比例达到阈值时打开，打开期间请求立即失败，
+    由调用方走降级逻辑；冷却后进入半开状态，放行少量探测请求，全部成功后恢复。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int,
+        min_requests: int,
+        error_rate_threshold: float,
+        slow_rate_threshold: float,
+        latency_slo_s: float,
+        cooldown_s: float,
+        half_open_probes: int
+    ):
+        self.name = name
+        self.window_size = window_size
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_rate_threshold = slow_rate_threshold
+        self.latency_slo_s = latency_slo_s
+        self.cooldown_s = cooldown_s
+        self.half_open_probes = half_open_probes
+
+        self.state = STATE_CLOSED
+        self.outcomes: deque = deque(maxlen=window_size)  # (是否失败, 是否超过SLO)
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+
+        # 指标
+        self.times_opened = 0
+        self.rejected = 0
+
+    def is_open(self) -> bool:
+        """熔断器打开且仍在冷却期内"""
+        return self.state == STATE_OPEN and time.monotonic() - self.opened_at < self.cooldown_s
+
+    def allow_request(self) -> bool:
+        """判断是否放行请求"""
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown_s:
+                self.rejected += 1
+                return False
+            self._transition(STATE_HALF_OPEN)
+
+        if self.state == STATE_HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+
+        return True
+
+    def record_success(self, latency: float):
+        slow = latency > self.latency_slo_s
+
+        if self.state == STATE_HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if slow:
+                self._trip(f"探测请求耗时 {latency:.1f}s 超过SLO")
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.half_open_probes:
+                self._transition(STATE_CLOSED)
+            return
+
+        self.outcomes.append((False, slow))
+        self._evaluate()
+
+    def record_failure(self):
+        if self.state == STATE_HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            self._trip("探测请求失败")
+            return
+
+        self.outcomes.append((True, False))
+        self._evaluate()
+
+    def record_cancelled(self):
+        """请求被取消（例如对冲请求落败）时归还探测名额，不计入统计"""
+        if self.state == STATE_HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def _evaluate(self):
+        if self.state != STATE_CLOSED or len(self.outcomes) < self.min_requests:
+            return
+
+        total = len(self.outcomes)
+        error_rate = sum(1 for failed, _ in self.outcomes if failed) / total
+        slow_rate = sum(1 for _, slow in self.outcomes if slow) / total
+
+        if error_rate >= self.error_rate_threshold:
+            self._trip(f"错误率 {error_rate:.0%}")
+        elif slow_rate >= self.slow_rate_threshold:
+            self._trip(f"{slow_rate:.0%} 的请求超过延迟SLO {self.latency_slo_s}s")
+
+    def _trip(self, reason: str):
+        logger.warning(f"LLM熔断器 {self.name} 打开: {reason}")
+        self.times_opened += 1
+        self.opened_at = time.monotonic()
+        self._transition(STATE_OPEN)
+
+    def _transition(self, state: str):
+        if state != STATE_OPEN:
+            logger.info(f"LLM熔断器 {self.name} 状态: {self.state} -> {state}")
+        self.state = state
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        if state == STATE_CLOSED:
+            self.outcomes.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "window_requests": len(self.outcomes),
+            "window_errors": sum(1 for failed, _ in self.outcomes if failed),
+            "window_slow": sum(1 for _, slow in self.outcomes if slow),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+
+class CircuitBreakerRegistry:
+    """按 模型/接口地址 维护熔断器"""
+
+    def __init__(self):
+        self.breakers: Dict[Hashable, CircuitBreaker] = {}
+
+    def get(self, endpoint: str, model: str) -> CircuitBreaker:
+        key = (endpoint, model)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name=f"{model}@{endpoint}",
+                window_size=settings.LLM_BREAKER_WINDOW,
+                min_requests=settings.LLM_BREAKER_MIN_REQUESTS,
+                error_rate_threshold=settings.LLM_BREAKER_ERROR_RATE,
+                slow_rate_threshold=settings.LLM_BREAKER_SLOW_RATE,
+                latency_slo_s=settings.LLM_LATENCY_SLO_S,
+                cooldown_s=settings.LLM_BREAKER_COOLDOWN_S,
+                half_open_probes=settings.LLM_BREAKER_HALF_OPEN_PROBES
+            )
+            self.breakers[key] = breaker
+        return breaker
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {breaker.name: breaker.get_metrics() for breaker in self.breakers.values()}
+
+
+circuit_breakers = CircuitBreakerRegistry()
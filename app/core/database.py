@@ -1,45 +1,169 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 import asyncio
-from typing import Generator
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Generator, AsyncGenerator, Dict, Any, Iterator, List, Optional
 
 from app.core.config import settings
 
-# 数据库引擎
-engine = create_engine(
-    settings.DATABASE_URL,
-    poolclass=StaticPool,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """把同步数据库地址转换为对应的异步驱动地址"""
+    scheme, separator, rest = database_url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{separator}{rest}"
+
+
+def is_sqlite_file(database_url: str) -> bool:
+    """是否为SQLite文件数据库（内存数据库不适用WAL和写线程）"""
+    return database_url.startswith("sqlite") and not (
+        ":memory:" in database_url or database_url.rstrip("/").endswith(":")
+    )
+
+
+def _engine_options(database_url: str) -> Dict[str, Any]:
+    """连接池配置：内存SQLite只能共享单个连接，其余数据库使用可调的连接池"""
+    if database_url.startswith("sqlite"):
+        options: Dict[str, Any] = {"connect_args": {"check_same_thread": False}}
+        if not is_sqlite_file(database_url):
+            options["poolclass"] = StaticPool
+        return options
+
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_S,
+        "pool_recycle": settings.DB_POOL_RECYCLE_S,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+# 同步数据库引擎（后台线程、离线脚本使用）
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 
 # 会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步数据库引擎（API请求使用，不阻塞事件循环）
+async_engine = create_async_engine(
+    get_async_database_url(settings.DATABASE_URL),
+    **_engine_options(settings.DATABASE_URL)
+)
+
+# 异步会话工厂
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 基础模型类
 Base = declarative_base()
 
 
-def get_db() -> Generator[Session, None, None]:
-    """获取数据库会话"""
-    db = SessionLocal()
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """SQLite连接参数，每个新连接执行一次"""
+    cursor = dbapi_connection.cursor()
     try:
-        yield db
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    finally:
+        cursor.close()
+
+
+if is_sqlite_file(settings.DATABASE_URL):
+    event.listen(engine, "connect", _configure_sqlite_connection)
+    event.listen(async_engine.sync_engine, "connect", _configure_sqlite_connection)
+
+
+class QueryCount:
+    """一次请求（或代码块）内执行的SQL语句计数"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+        # 写线程和请求所在线程可能同时计数
+        self.lock = threading.Lock()
+
+    def add(self, statement: str):
+        with self.lock:
+            self.count += 1
+            if len(self.statements) < 50:
+                self.statements.append(statement)
+
+
+class TooManyQueriesError(RuntimeError):
+    """单个请求执行的SQL语句超过上限，通常说明存在逐行加载关系的N+1查询"""
+
+
+_query_count: ContextVar[Optional[QueryCount]] = ContextVar("db_query_count", default=None)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCount]:
+    """统计代码块内在同步、异步引擎上执行的SQL语句
+
+    包括其中创建的任务、asyncio.to_thread 线程，以及交给 sqlite_writer 写线程执行的写操作
+    （它们继承调用方的 contextvars）；自行创建的 threading.Thread 不计入。
+    """
+    counter = QueryCount()
+    token = _query_count.set(counter)
+    try:
+        yield counter
     finally:
-        db.close()
+        _query_count.reset(token)
+
+
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_count.get()
+    if counter is not None:
+        counter.add(statement)
+
+
+event.listen(engine, "before_cursor_execute", _record_query)
+event.listen(async_engine.sync_engine, "before_cursor_execute", _record_query)
+
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """获取异步数据库会话（FastAPI依赖）"""
+    async with AsyncSessionLocal() as db:
+        yield db
 
 
 async def init_db():
     """初始化数据库"""
     try:
         # 创建所有表
-        Base.metadata.create_all(bind=engine)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
         print("✅ 数据库初始化成功")
     except Exception as e:
         print(f"❌ 数据库初始化失败: {e}")
 
 
+async def close_db():
+    """关闭连接池"""
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def get_pool_status() -> Dict[str, str]:
+    """连接池状态"""
+    return {
+        "sync": engine.pool.status(),
+        "async": async_engine.pool.status()
+    }
+
+
 def get_db_sync() -> Session:
     """获取同步数据库会话"""
     return SessionLocal()
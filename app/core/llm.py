@@ -0,0 +1,237 @@
+import openai
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Any, Optional
+import logging
+
+from app.core.config import settings
+from app.core.semantic_cache import get_semantic_cache_metrics
+from app.core.llm_scheduler import llm_scheduler, get_request_context
+from app.core.circuit_breaker import circuit_breakers, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """滚动窗口内的请求延迟统计"""
+
+    def __init__(self, window_size: int):
+        self.samples: deque = deque(maxlen=window_size)
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """返回窗口内的延迟分位数，没有样本时返回None"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100.0))
+        return ordered[index]
+
+
+class HedgingPolicy:
+    """对冲请求策略
+
+    请求耗时超过历史延迟分位数后再发出一个重复请求，取先返回的结果。
+    对冲请求数量受预算比例限制，避免在服务整体变慢时成倍放大流量。
+    """
+
+    def __init__(
+        self,
+        percentile: float,
+        budget_ratio: float,
+        min_delay_s: float,
+        min_samples: int,
+        window_size: int
+    ):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_delay_s = min_delay_s
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.trackers: Dict[str, LatencyTracker] = {}
+
+        # 指标
+        self.eligible_requests = 0
+        self.hedges_issued = 0
+        self.hedge_wins = 0
+        self.budget_rejections = 0
+
+    def record_latency(self, model: str, latency: float):
+        tracker = self.trackers.setdefault(model, LatencyTracker(self.window_size))
+        tracker.record(latency)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """返回发出对冲请求前的等待时间，样本不足时不对冲"""
+        tracker = self.trackers.get(model)
+        if tracker is None or len(tracker.samples) < self.min_samples:
+            return None
+        return max(self.min_delay_s, tracker.percentile(self.percentile))
+
+    def try_acquire_budget(self) -> bool:
+        """检查对冲预算，已发出的对冲请求不得超过合格请求数的预算比例"""
+        if self.hedges_issued + 1 > self.eligible_requests * self.budget_ratio:
+            self.budget_rejections += 1
+            return False
+        self.hedges_issued += 1
+        return True
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "eligible_requests": self.eligible_requests,
+            "hedges_issued": self.hedges_issued,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": self.hedge_wins / self.hedges_issued if self.hedges_issued else 0.0,
+            "budget_rejections": self.budget_rejections,
+            "hedge_delay_s": {model: self.hedge_delay(model) for model in self.trackers}
+        }
+
+
+hedging_policy = HedgingPolicy(
+    percentile=settings.LLM_HEDGE_PERCENTILE,
+    budget_ratio=settings.LLM_HEDGE_BUDGET_RATIO,
+    min_delay_s=settings.LLM_HEDGE_MIN_DELAY_MS / 1000.0,
+    min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+    window_size=settings.LLM_LATENCY_WINDOW
+)
+
+
+_client: Optional[openai.AsyncOpenAI] = None
+
+
+def get_llm_client() -> openai.AsyncOpenAI:
+    """共享的异步客户端，首次调用时按配置创建
+
+    配置了 OPENAI_API_BASE 时请求发往该地址（例如本地模拟服务器）。
+    重试由熔断器和对冲请求负责，客户端本身不重试。
+    """
+    global _client
+    if _client is None:
+        _client = openai.AsyncOpenAI(
+            base_url=settings.OPENAI_API_BASE or None,
+            api_key=settings.OPENAI_API_KEY,
+            timeout=settings.LLM_REQUEST_TIMEOUT_S,
+            max_retries=0
+        )
+    return _client
+
+
+def reset_llm_client():
+    """丢弃已创建的客户端，修改接口地址或密钥后调用"""
+    global _client
+    _client = None
+
+
+def _get_breaker(request_kwargs: Dict[str, Any]):
+    return circuit_breakers.get(settings.OPENAI_API_BASE or "openai", request_kwargs["model"])
+
+
+async def _timed_call(request_kwargs: Dict[str, Any]) -> Any:
+    """经调度器获取槽位后发出请求，记录延迟并上报熔断器"""
+    context = get_request_context()
+    breaker = _get_breaker(request_kwargs)
+    async with llm_scheduler.slot(
+        priority=context.get("priority"),
+        flow=context.get("factory_id"),
+        deadline_s=context.get("deadline_s")
+    ):
+        # 排队期间熔断器可能已经打开
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"LLM熔断器 {breaker.name} 已打开")
+
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                get_llm_client().chat.completions.create(**request_kwargs),
+                timeout=settings.LLM_REQUEST_TIMEOUT_S
+            )
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+
+        latency = time.monotonic() - started
+        breaker.record_success(latency)
+        hedging_policy.record_latency(request_kwargs["model"], latency)
+        return response
+
+
+async def _hedged_call(request_kwargs: Dict[str, Any]) -> Any:
+    """带对冲的请求：主请求超过阈值仍未返回时发出重复请求，取先成功的结果"""
+    hedging_policy.eligible_requests += 1
+    primary = asyncio.ensure_future(_timed_call(request_kwargs))
+
+    delay = hedging_policy.hedge_delay(request_kwargs["model"])
+    if delay is None:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done or not hedging_policy.try_acquire_budget():
+        return await primary
+
+    logger.info(f"LLM请求超过 {delay:.2f}s 未返回，发出对冲请求")
+    hedge = asyncio.ensure_future(_timed_call(request_kwargs))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        hedging_policy.hedge_wins += 1
+                    return task.result()
+        # 两个请求都失败时抛出主请求的异常
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def chat_completion(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    hedge: bool = False,
+    **kwargs: Any
+) -> Any:
+    """统一的LLM对话补全调用入口
+
+    所有服务都通过这里访问LLM，配置了 OPENAI_API_BASE 时请求会发往该地址
+    （例如本地模拟服务器），否则使用OpenAI官方接口。
+    交互式调用可传入 hedge=True，在开启 LLM_HEDGING_ENABLED 时使用对冲请求降低尾延迟；
+    批量调用保持默认关闭。
+    请求的优先级和所属工厂由调用方通过 llm_request_context 设置，交给调度器排队。
+    对应接口的熔断器打开时立即抛出 CircuitOpenError，调用方应直接走降级逻辑。
+    """
+    request_kwargs: Dict[str, Any] = {
+        "model": model or settings.OPENAI_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens or settings.OPENAI_MAX_TOKENS,
+        "temperature": settings.OPENAI_TEMPERATURE if temperature is None else temperature,
+    }
+    request_kwargs.update(kwargs)
+
+    breaker = _get_breaker(request_kwargs)
+    if breaker.is_open():
+        breaker.rejected += 1
+        raise CircuitOpenError(f"LLM熔断器 {breaker.name} 已打开")
+
+    if hedge and settings.LLM_HEDGING_ENABLED:
+        return await _hedged_call(request_kwargs)
+
+    return await _timed_call(request_kwargs)
+
+
+def get_llm_metrics() -> Dict[str, Any]:
+    """获取LLM调用层指标"""
+    return {
+        "scheduler": llm_scheduler.get_metrics(),
+        "hedging": hedging_policy.get_metrics(),
+        "circuit_breakers": circuit_breakers.get_metrics(),
+        "semantic_cache": get_semantic_cache_metrics()
+    }
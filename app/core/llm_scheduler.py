@@ -0,0 +1,225 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Any, Optional, Hashable
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先调度
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BATCH = "batch"
+
+PRIORITY_LEVELS = {
+    PRIORITY_INTERACTIVE: 0,
+    PRIORITY_NORMAL: 1,
+    PRIORITY_BATCH: 2,
+}
+
+
+class LLMDeadlineExceeded(Exception):
+    """请求在队列中等待超过截止时间，被调度器丢弃"""
+
+
+_request_context: contextvars.ContextVar = contextvars.ContextVar("llm_request_context", default={})
+
+
+@contextmanager
+def llm_request_context(
+    priority: Optional[str] = None,
+    factory_id: Optional[Hashable] = None,
+    deadline_s: Optional[float] = None
+):
+    """为当前调用链上的所有LLM请求设置优先级、所属工厂和排队截止时间"""
+    current = dict(_request_context.get())
+    if priority is not None:
+        current["priority"] = priority
+    if factory_id is not None:
+        current["factory_id"] = factory_id
+    if deadline_s is not None:
+        current["deadline_s"] = deadline_s
+
+    token = _request_context.set(current)
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+def get_request_context() -> Dict[str, Any]:
+    return _request_context.get()
+
+
+class _QueuedRequest:
+    __slots__ = ("priority", "flow", "deadline", "future", "enqueued_at")
+
+    def __init__(self, priority: str, flow: Hashable, deadline: float, future: asyncio.Future):
+        self.priority = priority
+        self.flow = flow
+        self.deadline = deadline
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class LLMRequestScheduler:
+    """LLM请求调度器
+
+    - 按优先级分类调度，交互式请求始终排在批量请求前面
+    - 为交互式请求预留并发槽位，批量请求只能使用剩余容量
+    - 同一优先级内按工厂做加权公平排队（虚拟完成时间），避免单个大批量任务独占
+    - 排队超过截止时间的请求直接丢弃，不再占用配额
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        interactive_reserved: int,
+        default_deadlines: Dict[str, float],
+        flow_weights: Optional[Dict[Hashable, float]] = None
+    ):
+        self.max_concurrency = max_concurrency
+        self.interactive_reserved = min(interactive_reserved, max_concurrency - 1)
+        self.default_deadlines = default_deadlines
+        self.flow_weights = flow_weights or {}
+
+        self.queue: List[tuple] = []
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.in_flight_by_priority: Dict[str, int] = {p: 0 for p in PRIORITY_LEVELS}
+
+        # 每个优先级独立的虚拟时间和各工厂的上次完成标签
+        self.virtual_time: Dict[str, float] = {p: 0.0 for p in PRIORITY_LEVELS}
+        self.flow_finish: Dict[tuple, float] = {}
+
+        # 指标
+        self.queue_depth: Dict[str, int] = {p: 0 for p in PRIORITY_LEVELS}
+        self.dispatched: Dict[str, int] = {p: 0 for p in PRIORITY_LEVELS}
+        self.dropped: Dict[str, int] = {p: 0 for p in PRIORITY_LEVELS}
+        self.total_wait_s: Dict[str, float] = {p: 0.0 for p in PRIORITY_LEVELS}
+
+    def set_flow_weight(self, flow: Hashable, weight: float):
+        """设置工厂的调度权重，权重越大分到的批量容量越多"""
+        self.flow_weights[flow] = weight
+
+    def _can_dispatch(self, priority: str) -> bool:
+        if priority == PRIORITY_INTERACTIVE:
+            return self.in_flight < self.max_concurrency
+        return self.in_flight < self.max_concurrency - self.interactive_reserved
+
+    def _dispatch(self):
+        """在容量允许时按顺序放行排队请求"""
+        now = time.monotonic()
+        while self.queue:
+            _, finish_tag, _, request = self.queue[0]
+
+            if request.future.done():
+                # 调用方已取消
+                heapq.heappop(self.queue)
+                self.queue_depth[request.priority] -= 1
+                continue
+
+            if request.deadline < now:
+                heapq.heappop(self.queue)
+                self.queue_depth[request.priority] -= 1
+                self.dropped[request.priority] += 1
+                request.future.set_exception(LLMDeadlineExceeded(
+                    f"LLM请求排队 {now - request.enqueued_at:.1f}s 超过截止时间，已丢弃"
+                ))
+                continue
+
+            if not self._can_dispatch(request.priority):
+                break
+
+            heapq.heappop(self.queue)
+            self.queue_depth[request.priority] -= 1
+            self.virtual_time[request.priority] = max(self.virtual_time[request.priority], finish_tag)
+            self.in_flight += 1
+            self.in_flight_by_priority[request.priority] += 1
+            self.dispatched[request.priority] += 1
+            self.total_wait_s[request.priority] += now - request.enqueued_at
+            request.future.set_result(None)
+
+    def _enqueue(self, priority: str, flow: Hashable, deadline: float) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        request = _QueuedRequest(priority, flow, deadline, future)
+
+        flow_key = (priority, flow)
+        weight = self.flow_weights.get(flow, 1.0)
+        start_tag = max(self.virtual_time[priority], self.flow_finish.get(flow_key, 0.0))
+        finish_tag = start_tag + 1.0 / weight
+        self.flow_finish[flow_key] = finish_tag
+
+        heapq.heappush(self.queue, (PRIORITY_LEVELS[priority], finish_tag, next(self.sequence), request))
+        self.queue_depth[priority] += 1
+        self._dispatch()
+        return future
+
+    def _release(self, priority: str):
+        self.in_flight -= 1
+        self.in_flight_by_priority[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: str = PRIORITY_NORMAL,
+        flow: Hashable = None,
+        deadline_s: Optional[float] = None
+    ):
+        """排队获取一个LLM并发槽位，退出时释放"""
+        if priority not in PRIORITY_LEVELS:
+            priority = PRIORITY_NORMAL
+        if deadline_s is None:
+            deadline_s = self.default_deadlines[priority]
+
+        future = self._enqueue(priority, flow, time.monotonic() + deadline_s)
+        try:
+            # 超时只作为兜底，正常情况下由调度器在出队时判断截止时间
+            await asyncio.wait_for(asyncio.shield(future), timeout=deadline_s + 1.0)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self.dropped[priority] += 1
+            raise LLMDeadlineExceeded(f"LLM请求排队超过 {deadline_s}s，已丢弃")
+        except BaseException:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 已分配槽位但调用方被取消，归还槽位
+                self._release(priority)
+            else:
+                future.cancel()
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "interactive_reserved": self.interactive_reserved,
+            "in_flight": dict(self.in_flight_by_priority),
+            "queue_depth": dict(self.queue_depth),
+            "dispatched": dict(self.dispatched),
+            "dropped": dict(self.dropped),
+            "avg_wait_s": {
+                p: self.total_wait_s[p] / self.dispatched[p] if self.dispatched[p] else 0.0
+                for p in PRIORITY_LEVELS
+            }
+        }
+
+
+llm_scheduler = LLMRequestScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    interactive_reserved=settings.LLM_INTERACTIVE_RESERVED_SLOTS,
+    default_deadlines={
+        PRIORITY_INTERACTIVE: settings.LLM_INTERACTIVE_DEADLINE_S,
+        PRIORITY_NORMAL: settings.LLM_NORMAL_DEADLINE_S,
+        PRIORITY_BATCH: settings.LLM_BATCH_DEADLINE_S,
+    }
+)
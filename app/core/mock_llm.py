@@ -0,0 +1,299 @@
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, List, Any, Optional
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+
+import uvicorn
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MockLLMConfig:
+    """模拟LLM服务器配置"""
+    latency_median_ms: float = settings.MOCK_LLM_LATENCY_MEDIAN_MS
+    latency_sigma: float = settings.MOCK_LLM_LATENCY_SIGMA
+    tokens_per_second: float = settings.MOCK_LLM_TOKENS_PER_SECOND
+    error_rate: float = settings.MOCK_LLM_ERROR_RATE
+    timeout_rate: float = settings.MOCK_LLM_TIMEOUT_RATE
+    timeout_delay_s: float = 120.0
+    seed: int = settings.MOCK_LLM_SEED
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """按字段名更新配置，忽略未知字段"""
+        for field in fields(self):
+            if field.name in values:
+                setattr(self, field.name, type(getattr(self, field.name))(values[field.name]))
+
+
+# 按 (匹配位置, 关键词, 提示类型) 识别服务中的各类Prompt，顺序即优先级
+PROMPT_TYPE_RULES = [
+    ("system", "B2B客户画像分析师", "customer_profiles"),
+    ("system", "B2B潜在客户生成专家", "leads_for_profile"),
+    ("system", "B2B个性化营销专家", "personalized_email"),
+    ("system", "LinkedIn个性化营销专家", "personalized_linkedin"),
+    ("system", "产品推荐专家", "product_recommendation"),
+    ("system", "客户跟进专家", "follow_up_sequence"),
+    ("system", "B2B营销文案专家", "email_template"),
+    ("system", "LinkedIn营销专家", "linkedin_template"),
+    ("system", "产品文案专家", "product_content"),
+    ("system", "公司介绍文案专家", "company_content"),
+    ("user", "请按照以下格式提取信息", "extract_factory_info"),
+    ("user", "引导对话", "onboarding_conversation"),
+]
+
+INDUSTRIES = ["消费电子", "家居用品", "汽车", "医疗设备", "工业设备"]
+COMPANY_SIZES = ["50-200人", "100-500人", "200-500人", "500+人", "1000+人"]
+REGIONS = ["北美", "欧洲", "东南亚", "中东", "南美"]
+BUDGETS = ["中等", "中高", "高"]
+TIMELINES = ["3-6个月", "6-12个月", "12个月以上"]
+ROLES = ["采购经理", "产品经理", "供应链总监", "运营副总裁"]
+PAIN_POINTS = ["成本控制", "质量保证", "交付周期", "可持续发展", "设计创新"]
+NAME_PREFIXES = ["Nova", "Apex", "Blue", "Green", "Summit", "Bright", "Vertex", "Pioneer", "Atlas", "Harbor"]
+NAME_SUFFIXES = ["Tech", "Home", "Supply", "Industries", "Labs", "Trading", "Systems", "Goods"]
+CONTACT_NAMES = ["John Smith", "Emma Brown", "Lucas Müller", "Sofia Rossi", "Liam Wilson", "Chloe Martin"]
+
+
+def classify_prompt(messages: List[Dict[str, Any]]) -> str:
+    """识别Prompt类型"""
+    system_text = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    user_text = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+
+    for target, keyword, prompt_type in PROMPT_TYPE_RULES:
+        text = system_text if target == "system" else user_text
+        if keyword in text:
+            return prompt_type
+
+    return "generic"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数量"""
+    return max(1, len(text) // 2)
+
+
+class CannedResponder:
+    """按Prompt类型生成确定性的结构化输出
+
+    同一Prompt在同一种子下总是得到相同的输出，格式与各服务的解析逻辑保持一致。
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+
+    def respond(self, prompt_type: str, messages: List[Dict[str, Any]]) -> str:
+        digest = hashlib.sha256(
+            f"{self.seed}:{prompt_type}:{messages[-1].get('content', '') if messages else ''}".encode("utf-8")
+        ).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+
+        handler = getattr(self, f"_render_{prompt_type}", self._render_generic)
+        return handler(rng)
+
+    def _render_customer_profiles(self, rng: random.Random) -> str:
+        sections = []
+        for _ in range(rng.randint(5, 8)):
+            sections.append("\n".join([
+                f"行业类型: {rng.choice(INDUSTRIES)}",
+                f"公司规模: {rng.choice(COMPANY_SIZES)}",
+                f"地理位置: {rng.choice(REGIONS)}",
+                f"业务需求: 稳定可靠的{rng.choice(INDUSTRIES)}代工",
+                f"决策者角色: {rng.choice(ROLES)}",
+                f"预算范围: {rng.choice(BUDGETS)}",
+                f"采购时间线: {rng.choice(TIMELINES)}",
+                f"关键痛点: {'、'.join(rng.sample(PAIN_POINTS, 2))}",
+            ]))
+        return "\n\n".join(sections)
+
+    def _render_leads_for_profile(self, rng: random.Random) -> str:
+        sections = []
+        for _ in range(rng.randint(3, 5)):
+            name = f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_SUFFIXES)}"
+            domain = f"{name.lower().replace(' ', '')}.com"
+            contact = rng.choice(CONTACT_NAMES)
+            sections.append("\n".join([
+                f"公司名称: {name}",
+                f"网站域名: {domain}",
+                f"具体业务描述: {name} 专注于中高端市场的产品分销",
+                f"联系人姓名和职位: {contact} - {rng.choice(ROLES)}",
+                f"联系邮箱: {contact.split()[0].lower()}@{domain}",
+                f"公司地址: {rng.choice(REGIONS)}",
+                f"具体产品需求: {rng.choice(INDUSTRIES)}定制产品",
+                f"预期订单规模: {rng.choice(['10万美元/年', '50万美元/年', '100万美元/年'])}",
+            ]))
+        return "\n\n".join(sections)
+
+    def _render_extract_factory_info(self, rng: random.Random) -> str:
+        return "\n".join([
+            f"工厂名称: {rng.choice(NAME_PREFIXES)}制造有限公司",
+            f"主营产品: {'、'.join(rng.sample(INDUSTRIES, 2))}",
+            f"核心优势: {'、'.join(rng.sample(['高质量', '快速交付', '成本优势', '柔性生产'], 2))}",
+            "已发现的认证: ISO9001、CE认证",
+            "公司描述: 专业的OEM/ODM制造商",
+            "地理位置: 中国深圳",
+            f"成立年份: {rng.randint(1995, 2018)}",
+            f"员工规模: {rng.choice(COMPANY_SIZES)}",
+        ])
+
+    def _render_onboarding_conversation(self, rng: random.Random) -> str:
+        return "\n".join([
+            "感谢您提供网站信息，我们已经整理出以下工厂概况，请您确认。",
+            "",
+            "您的理想客户主要分布在哪些市场?",
+            "您希望优先开发哪些行业的客户?",
+            "您的最小起订量是多少?",
+            f"您是否有{rng.choice(['环保', '质量', '安全'])}相关的新认证?",
+        ])
+
+    def _render_follow_up_sequence(self, rng: random.Random) -> str:
+        methods = ["邮件", "LinkedIn", "电话"]
+        sections = []
+        for step in range(rng.randint(3, 5)):
+            sections.append("\n".join([
+                f"第{step + 1}步",
+                f"时间: {3 * (step + 1)}天后",
+                f"方式: {rng.choice(methods)}",
+                "目标: 逐步加深合作关系",
+            ]))
+        return "\n\n".join(sections)
+
+    def _render_generic(self, rng: random.Random) -> str:
+        return (
+            f"您好，我们是一家专注于{rng.choice(INDUSTRIES)}的制造商，"
+            f"拥有{rng.choice(['高质量', '快速交付', '成本优势'])}等核心优势，"
+            "期待与贵司探讨合作机会。"
+        )
+
+    _render_email_template = _render_generic
+    _render_linkedin_template = _render_generic
+    _render_product_content = _render_generic
+    _render_company_content = _render_generic
+    _render_personalized_email = _render_generic
+    _render_personalized_linkedin = _render_generic
+    _render_product_recommendation = _render_generic
+
+
+def create_mock_llm_app(config: Optional[MockLLMConfig] = None) -> FastAPI:
+    """创建OpenAI兼容的模拟LLM服务"""
+    config = config or MockLLMConfig()
+    app = FastAPI(title="AIBD-FactoryLink Mock LLM")
+    latency_rng = random.Random(config.seed)
+    stats: Dict[str, Any] = {"requests": 0, "errors": 0, "timeouts": 0, "by_prompt_type": {}}
+
+    def sample_latency(completion_tokens: int) -> float:
+        """首token延迟（对数正态）加上按生成速率计算的耗时，单位秒"""
+        latency = config.latency_median_ms / 1000.0
+        if config.latency_sigma > 0:
+            latency *= math.exp(latency_rng.gauss(0.0, config.latency_sigma))
+        if config.tokens_per_second > 0:
+            latency += completion_tokens / config.tokens_per_second
+        return latency
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt_type = classify_prompt(messages)
+
+        stats["requests"] += 1
+        stats["by_prompt_type"][prompt_type] = stats["by_prompt_type"].get(prompt_type, 0) + 1
+
+        roll = latency_rng.random()
+        if roll < config.error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(sample_latency(0))
+            status_code = latency_rng.choice([429, 500, 503])
+            return JSONResponse(
+                status_code=status_code,
+                content={"error": {"message": "mock injected error", "type": "server_error", "code": status_code}}
+            )
+        if roll < config.error_rate + config.timeout_rate:
+            stats["timeouts"] += 1
+            await asyncio.sleep(config.timeout_delay_s)
+
+        content = CannedResponder(config.seed).respond(prompt_type, messages)
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = estimate_tokens(content)
+
+        await asyncio.sleep(sample_latency(completion_tokens))
+
+        return {
+            "id": f"chatcmpl-mock-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", settings.OPENAI_MODEL),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {
+            "object": "list",
+            "data": [{"id": settings.OPENAI_MODEL, "object": "model", "owned_by": "mock"}]
+        }
+
+    @app.get("/mock/config")
+    async def get_config():
+        return asdict(config)
+
+    @app.post("/mock/config")
+    async def update_config(values: Dict[str, Any]):
+        """运行时调整延迟、错误注入等参数，便于压测中途切换场景"""
+        config.update(values)
+        logger.info(f"模拟LLM配置已更新: {asdict(config)}")
+        return asdict(config)
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+class MockLLMServer:
+    """在后台线程中运行模拟LLM服务（测试和自检脚本使用）"""
+
+    def __init__(self, config: Optional[MockLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockLLMConfig()
+        self.server = uvicorn.Server(uvicorn.Config(
+            create_mock_llm_app(self.config), host=host, port=port, log_level="warning"
+        ))
+        self.thread: Optional[threading.Thread] = None
+        self.base_url = ""
+
+    def start(self, timeout_s: float = 10.0) -> str:
+        """启动服务并返回 OPENAI_API_BASE 地址（port=0 时自动选择空闲端口）"""
+        self.thread = threading.Thread(target=self.server.run, name="mock-llm", daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + timeout_s
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("模拟LLM服务启动失败")
+            time.sleep(0.01)
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        self.base_url = f"http://{host}:{port}/v1"
+        return self.base_url
+
+    def stop(self):
+        self.server.should_exit = True
+        if self.thread is not None:
+            self.thread.join(5.0)
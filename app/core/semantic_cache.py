@@ -0,0 +1,134 @@
+import numpy as np
+import threading
+import zlib
+from typing import Dict, List, Any, Optional, Hashable
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HashingVectorizer:
+    """基于字符n-gram哈希的本地文本向量化
+
+    不依赖网络和模型文件，对中文短文本同样适用。
+    """
+
+    def __init__(self, dim: int, ngram_range: tuple = (2, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def transform(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = " ".join(text.lower().split())
+
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(max(0, len(text) - n + 1)):
+                h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                # 用哈希值的最高位决定符号，减少哈希冲突带来的偏差
+                vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+
+class SemanticCache:
+    """近似重复Prompt的语义缓存
+
+    向量保存在按需扩容的NumPy矩阵中，查询时一次矩阵乘法求出全部余弦相似度。
+    条目按scope隔离（例如按工厂），容量满后按写入顺序覆盖最旧的条目。
+    """
+
+    def __init__(self, name: str, threshold: float, max_entries: int, dim: int):
+        self.name = name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.vectorizer = HashingVectorizer(dim)
+        self.vectors = np.zeros((min(256, max_entries), dim), dtype=np.float32)
+        self.entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self.size = 0
+        self.cursor = 0
+        self.lock = threading.Lock()
+
+        # 指标
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, text: str, scope: Hashable = None, threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """查找相似度不低于阈值的最近邻，返回缓存条目（含 value、metadata、similarity）"""
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return None
+
+        query = self.vectorizer.transform(text)
+        threshold = self.threshold if threshold is None else threshold
+
+        with self.lock:
+            if self.size == 0:
+                self.misses += 1
+                return None
+
+            similarities = self.vectors[:self.size] @ query
+            # 按相似度从高到低检查，跳过其他scope的条目
+            for index in np.argsort(similarities)[::-1]:
+                similarity = float(similarities[index])
+                if similarity < threshold:
+                    break
+                entry = self.entries[index]
+                if entry["scope"] == scope:
+                    self.hits += 1
+                    return {**entry, "similarity": similarity}
+
+            self.misses += 1
+            return None
+
+    def store(self, text: str, value: Any, scope: Hashable = None, metadata: Optional[Dict[str, Any]] = None):
+        """写入缓存条目"""
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return
+
+        vector = self.vectorizer.transform(text)
+
+        with self.lock:
+            if self.cursor >= len(self.vectors):
+                # 按需倍增矩阵容量，避免一开始就占满内存
+                grown = np.zeros((min(len(self.vectors) * 2, self.max_entries), self.vectors.shape[1]), dtype=np.float32)
+                grown[:len(self.vectors)] = self.vectors
+                self.vectors = grown
+            self.vectors[self.cursor] = vector
+            self.entries[self.cursor] = {"scope": scope, "value": value, "metadata": metadata or {}}
+            self.cursor = (self.cursor + 1) % self.max_entries
+            self.size = min(self.size + 1, self.max_entries)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+# 市场分析 -> 客户画像（跨工厂共享的scope），客户画像 -> 潜在客户生成结果（按工厂ID隔离）
+lead_prompt_cache = SemanticCache(
+    name="lead_generation",
+    threshold=settings.SEMANTIC_CACHE_LEAD_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    dim=settings.SEMANTIC_CACHE_DIM
+)
+
+# 潜在客户特征 -> 个性化内容。内容包含工厂信息，只在同一工厂内复用
+content_prompt_cache = SemanticCache(
+    name="personalized_content",
+    threshold=settings.SEMANTIC_CACHE_CONTENT_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    dim=settings.SEMANTIC_CACHE_DIM
+)
+
+
+def get_semantic_cache_metrics() -> Dict[str, Any]:
+    """获取语义缓存指标"""
+    return {cache.name: cache.get_metrics() for cache in (lead_prompt_cache, content_prompt_cache)}
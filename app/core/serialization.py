@@ -0,0 +1,60 @@
+from typing import Dict, List, Any, Optional, Sequence, Iterable
+
+from sqlalchemy import Column
+
+from app.core.database import Base
+
+
+class InvalidFieldsError(ValueError):
+    """fields 参数包含不存在或不允许输出的字段"""
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """解析逗号分隔的 fields 查询参数，未指定时返回None"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    return list(dict.fromkeys(names)) or None
+
+
+class ModelSerializer:
+    """按列批量序列化模型
+
+    只查询需要的列，结果行直接按列名组装为字典，不实例化ORM对象，也不逐个调用
+    isoformat()；时间、JSON等类型交给 orjson（ORJSONResponse）编码。
+    """
+
+    def __init__(self, model: Base, exclude: Iterable[str] = ()):
+        self.model = model
+        self.columns: Dict[str, Column] = {
+            column.name: getattr(model, column.key)
+            for column in model.__table__.columns
+            if column.name not in set(exclude)
+        }
+
+    @property
+    def field_names(self) -> List[str]:
+        return list(self.columns)
+
+    def select_columns(self, fields: Optional[Sequence[str]] = None, required: Sequence[str] = ()) -> List[Any]:
+        """返回要查询的列；required 中的列（如分页游标所需）总是查询"""
+        if fields is None:
+            names = self.field_names
+        else:
+            unknown = [name for name in fields if name not in self.columns]
+            if unknown:
+                raise InvalidFieldsError(f"不支持的字段: {', '.join(unknown)}")
+            names = list(fields)
+        names += [name for name in required if name not in names]
+        return [self.columns[name].label(name) for name in names]
+
+    @staticmethod
+    def rows_to_dicts(rows: Sequence[Any], fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """把结果行转为字典；指定 fields 时只保留这些字段（去掉仅用于分页的列）"""
+        if not rows:
+            return []
+        names = list(rows[0]._fields)
+        if fields is None or list(fields) == names:
+            return [dict(zip(names, row)) for row in rows]
+        positions = [names.index(name) for name in fields]
+        return [{name: row[position] for name, position in zip(fields, positions)} for row in rows]
@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Any, Callable, Optional, Tuple, TypeVar
+import logging
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal, is_sqlite_file
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+WriteJob = Callable[[Session], Any]
+
+
+class SQLiteWriter:
+    """SQLite单写入者队列
+
+    SQLite 同一时间只允许一个写事务，多个请求并发写入时会互相等待写锁甚至报 database is locked。
+    开启后所有经过这里的写操作交给一个专用写线程：线程每次取出队列中已积累的写操作（最多
+    batch_size 个），用同一个会话依次执行后只提交一次。写操作本身不提交；某个写操作失败时整批回滚，
+    再逐个重新执行，只有失败的那个返回异常。每个写操作在提交它的调用方的上下文（contextvars）中执行，
+    调用方的SQL语句计数等上下文状态对写线程同样有效。
+
+    未开启（PostgreSQL、内存数据库或关闭配置）时 write() 直接用独立会话执行并提交。
+    """
+
+    def __init__(self, enabled: bool, batch_size: int):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.queue: "queue.Queue[Optional[Tuple[WriteJob, Future, contextvars.Context]]]" = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+        # 指标
+        self.jobs = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.failed = 0
+        self.retried_batches = 0
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self.thread.start()
+
+    def submit(self, job: Callable[[Session], T]) -> "Future[T]":
+        """把写操作放入队列，返回结果的 Future"""
+        future: Future = Future()
+        self.queue.put((job, future, contextvars.copy_context()))
+        self._ensure_started()
+        return future
+
+    def write(self, job: Callable[[Session], T]) -> T:
+        """执行写操作并等待提交（同步，在线程中调用）"""
+        if self.enabled:
+            return self.submit(job).result()
+
+        db = SessionLocal()
+        try:
+            result = job(db)
+            db.commit()
+            return result
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def write_async(self, job: Callable[[Session], T]) -> T:
+        """执行写操作并等待提交（异步）"""
+        if self.enabled:
+            return await asyncio.wrap_future(self.submit(job))
+        return await asyncio.to_thread(self.write, job)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._execute(batch)
+            if stopping:
+                return
+
+    def _execute(self, batch: List[Tuple[WriteJob, Future, contextvars.Context]]):
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            results = [context.run(job, db) for job, _, context in batch]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            if len(batch) == 1:
+                self.failed += 1
+                batch[0][1].set_exception(e)
+            else:
+                # 找出失败的写操作，其余照常提交
+                self.retried_batches += 1
+                for item in batch:
+                    self._execute([item])
+            return
+        finally:
+            db.close()
+
+        self.jobs += len(batch)
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def stop(self, timeout_s: float = 30.0):
+        """处理完队列中的写操作后停止写线程"""
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join(timeout_s)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": self.queue.qsize(),
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "avg_batch": round(self.jobs / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "failed": self.failed,
+            "retried_batches": self.retried_batches
+        }
+
+
+sqlite_writer = SQLiteWriter(
+    enabled=settings.SQLITE_WRITE_QUEUE_ENABLED and is_sqlite_file(settings.DATABASE_URL),
+    batch_size=settings.SQLITE_WRITE_BATCH_SIZE
+)
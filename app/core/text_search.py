@@ -0,0 +1,51 @@
+import re
+from typing import List, Any, Iterable
+
+# 拉丁字母/数字词，或连续的中日韩字符
+_TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_LATIN_PATTERN = re.compile(r"[0-9a-z]")
+
+
+def _flatten(value: Any) -> Iterable[str]:
+    if value is None:
+        return
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _flatten(item)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            yield from _flatten(item)
+    else:
+        yield str(value)
+
+
+def search_tokens(text: str) -> List[str]:
+    """切分检索词元
+
+    拉丁文本按词切分并转小写；中文等不以空格分词的文字切分为重叠的二元组
+    （"汽车零件" -> 汽车 车零 零件），单字保留原样。SQLite FTS5 与 PostgreSQL
+    tsvector 都只需按空格切分这些词元，两种数据库的匹配行为一致。
+    """
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if _LATIN_PATTERN.match(run) or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def build_search_text(*values: Any) -> str:
+    """把若干字段（字符串、JSON列表/字典）拼接为写入检索列的词元文本"""
+    tokens = []
+    for value in values:
+        for text in _flatten(value):
+            tokens.extend(search_tokens(text))
+    return " ".join(tokens)
+
+
+def query_tokens(query: str) -> List[str]:
+    """检索语句的词元（去重，保持顺序），各词元之间为"与"关系并按前缀匹配"""
+    return list(dict.fromkeys(search_tokens(query or "")))
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set
+import asyncio
 import json
 import logging
 
@@ -11,6 +12,7 @@ websocket_router = APIRouter()
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        self.factory_subscriptions: Dict[int, Set[WebSocket]] = {}
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -20,6 +22,8 @@ class ConnectionManager:
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        for factory_id in list(self.factory_subscriptions):
+            self.unsubscribe(websocket, factory_id)
         logger.info(f"WebSocket连接断开，当前连接数: {len(self.active_connections)}")
     
     async def send_personal_message(self, message: str, websocket: WebSocket):
@@ -42,6 +46,32 @@ class ConnectionManager:
         # 移除断开的连接
         for connection in disconnected:
             self.disconnect(connection)
+    
+    def subscribe(self, websocket: WebSocket, factory_id: int):
+        """订阅工厂的实时事件"""
+        self.factory_subscriptions.setdefault(factory_id, set()).add(websocket)
+    
+    def unsubscribe(self, websocket: WebSocket, factory_id: int):
+        subscribers = self.factory_subscriptions.get(factory_id)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.factory_subscriptions[factory_id]
+    
+    async def send_to_factory(self, factory_id: int, message: str):
+        """并发发送消息给订阅该工厂的连接"""
+        subscribers = list(self.factory_subscriptions.get(factory_id, ()))
+        if not subscribers:
+            return
+        
+        results = await asyncio.gather(
+            *(connection.send_text(message) for connection in subscribers),
+            return_exceptions=True
+        )
+        for connection, result in zip(subscribers, results):
+            if isinstance(result, Exception):
+                logger.error(f"推送工厂 {factory_id} 消息失败: {result}")
+                self.disconnect(connection)
 
 manager = ConnectionManager()
 
@@ -70,6 +100,9 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 # 处理不同类型的消息
                 await handle_websocket_message(websocket, message, client_id)
                 
+            except WebSocketDisconnect:
+                # 交给外层处理，清理连接和订阅
+                raise
             except json.JSONDecodeError:
                 await manager.send_personal_message(
                     json.dumps({
@@ -107,6 +140,31 @@ async def handle_websocket_message(websocket: WebSocket, message: Dict[str, Any]
             websocket
         )
     
+    elif message_type in ("subscribe_factory", "unsubscribe_factory"):
+        # 订阅/取消订阅工厂的实时事件（如潜在客户生成进度）
+        factory_id = message.get("factory_id")
+        if factory_id is None:
+            await manager.send_personal_message(
+                json.dumps({
+                    "type": "error",
+                    "message": "缺少工厂ID"
+                }),
+                websocket
+            )
+            return
+        
+        if message_type == "subscribe_factory":
+            manager.subscribe(websocket, int(factory_id))
+        else:
+            manager.unsubscribe(websocket, int(factory_id))
+        await manager.send_personal_message(
+            json.dumps({
+                "type": f"{message_type}_ok",
+                "factory_id": factory_id
+            }),
+            websocket
+        )
+    
     elif message_type == "start_onboarding":
         # 开始引导流程
         website_url = message.get("website_url")
@@ -154,6 +212,7 @@ async def handle_websocket_message(websocket: WebSocket, message: Dict[str, Any]
         # 启动业务开发
         factory_id = message.get("factory_id")
         if factory_id:
+            manager.subscribe(websocket, int(factory_id))
             response = {
                 "type": "business_development_started",
                 "factory_id": factory_id,
@@ -283,3 +342,15 @@ async def broadcast_notification(notification_type: str, data: Dict[str, Any]):
     }
     
     await manager.broadcast(json.dumps(message))
+
+
+async def push_factory_event(factory_id: int, event_type: str, data: Dict[str, Any]):
+    """推送工厂事件给订阅的客户端"""
+    message = {
+        "type": event_type,
+        "factory_id": factory_id,
+        "data": data,
+        "timestamp": asyncio.get_event_loop().time()
+    }
+    
+    await manager.send_to_factory(factory_id, json.dumps(message, ensure_ascii=False, default=str))
@@ -2,14 +2,23 @@ from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
+import logging
 import uvicorn
 from typing import Dict, Any
 
 from app.core.config import settings
-from app.core.database import init_db
-from app.api.v1.api import api_router
+from app.core.database import init_db, close_db, count_queries, TooManyQueriesError
+from app.core.sqlite_writer import sqlite_writer
+from app.api.v1.api import api_router, ai_agent
 from app.core.websocket import websocket_router
 from app.services.ai_agent import AIAgentService
+from app.services.factory_stats import factory_stats_service
+from app.services.follow_up_scheduler import follow_up_scheduler
+from app.services.interaction_log import interaction_log
+from app.services.schema_upgrade import schema_upgrade
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -17,9 +26,28 @@ async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时初始化
     await init_db()
+    # 旧版本创建的数据库先升级表结构，再把 leads.communication_history 中的沟通历史迁移为互动记录
+    try:
+        await asyncio.to_thread(schema_upgrade.upgrade)
+        await asyncio.to_thread(interaction_log.migrate_communication_history)
+    except Exception as e:
+        logger.error(f"升级数据库失败: {e}")
+    reconcile_task = None
+    if settings.ANALYTICS_RECONCILE_INTERVAL_S > 0:
+        reconcile_task = asyncio.create_task(
+            factory_stats_service.run_reconciliation(settings.ANALYTICS_RECONCILE_INTERVAL_S)
+        )
+    follow_up_task = None
+    if settings.FOLLOW_UP_SCHEDULER_ENABLED:
+        follow_up_task = asyncio.create_task(follow_up_scheduler.run(ai_agent.dispatch_follow_ups))
     print("🚀 AIBD-FactoryLink 启动成功!")
     yield
     # 关闭时清理
+    for task in (reconcile_task, follow_up_task):
+        if task is not None:
+            task.cancel()
+    await asyncio.to_thread(sqlite_writer.stop)
+    await close_db()
     print("👋 AIBD-FactoryLink 正在关闭...")
 
 
@@ -39,6 +67,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 测试环境的N+1查询防护：单个请求执行的SQL语句数超过上限时直接失败
+# DEBUG 下抛出 TooManyQueriesError，测试客户端会直接报错；否则返回500
+@app.middleware("http")
+async def query_count_guard(request, call_next):
+    if not settings.DB_QUERY_GUARD_ENABLED:
+        return await call_next(request)
+
+    with count_queries() as counter:
+        response = await call_next(request)
+    limit = settings.DB_QUERY_GUARD_MAX_QUERIES
+    if counter.count > limit:
+        message = f"{request.url.path} 执行了 {counter.count} 条SQL语句，超过上限 {limit}"
+        logger.error(f"{message}:\n" + "\n".join(counter.statements[:limit + 1]))
+        if settings.DEBUG:
+            raise TooManyQueriesError(message)
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": f"请求执行了 {counter.count} 条SQL语句，超过上限 {limit}",
+                "status_code": 500
+            }
+        )
+    response.headers["X-DB-Query-Count"] = str(counter.count)
+    return response
+
 # 注册路由
 app.include_router(api_router, prefix="/api/v1")
 app.include_router(websocket_router, prefix="/ws")
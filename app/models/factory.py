@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, JSON, Index
 from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
 from app.core.database import Base
 from typing import Optional, List, Dict, Any
 
@@ -50,6 +51,9 @@ class Factory(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # 关系（禁止隐式懒加载，按 app/models/loading.py 中的加载方案显式加载）
+    leads = relationship("Lead", back_populates="factory", lazy="raise_on_sql")
+    
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
         return {
@@ -109,3 +113,54 @@ class FactoryProfile(Base):
     # 时间戳
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class FactoryStats(Base):
+    """工厂业务开发统计（增量维护，见 app/services/factory_stats.py）"""
+    __tablename__ = "factory_stats"
+    
+    factory_id = Column(Integer, primary_key=True)
+    
+    # 潜在客户
+    total_leads = Column(Integer, nullable=False, default=0)
+    qualified_leads = Column(Integer, nullable=False, default=0)  # qualified + hot
+    hot_leads = Column(Integer, nullable=False, default=0)
+    conversions = Column(Integer, nullable=False, default=0)
+    
+    # 互动
+    total_interactions = Column(Integer, nullable=False, default=0)
+    outbound_interactions = Column(Integer, nullable=False, default=0)
+    responses = Column(Integer, nullable=False, default=0)
+    
+    # 时间戳
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    reconciled_at = Column(DateTime(timezone=True), nullable=True)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "factory_id": self.factory_id,
+            "total_leads": self.total_leads,
+            "qualified_leads": self.qualified_leads,
+            "hot_leads": self.hot_leads,
+            "conversions": self.conversions,
+            "total_interactions": self.total_interactions,
+            "outbound_interactions": self.outbound_interactions,
+            "responses": self.responses,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "reconciled_at": self.reconciled_at.isoformat() if self.reconciled_at else None
+        }
+
+
+class FactoryStatsBucket(Base):
+    """工厂潜在客户分布计数（行业、市场）"""
+    __tablename__ = "factory_stats_buckets"
+    __table_args__ = (
+        # 读取 Top N 时按计数倒序扫描
+        Index("ix_factory_stats_buckets_rank", "factory_id", "dimension", "lead_count"),
+    )
+    
+    factory_id = Column(Integer, primary_key=True)
+    dimension = Column(String(50), primary_key=True)  # industry, market
+    value = Column(String(255), primary_key=True)
+    lead_count = Column(Integer, nullable=False, default=0)
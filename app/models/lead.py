@@ -1,20 +1,36 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, JSON, ForeignKey
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, JSON, ForeignKey, Index, DDL, event
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 from app.core.database import Base
+from app.core.text_search import build_search_text
 from typing import Optional, List, Dict, Any
 
 
 class Lead(Base):
     """潜在客户模型"""
     __tablename__ = "leads"
+    __table_args__ = (
+        # 去重键，批量写入时按此做 upsert
+        Index("ix_leads_factory_company_key", "factory_id", "company_key", unique=True),
+        Index("ix_leads_factory_website_domain", "factory_id", "website_domain"),
+        # 列表键集分页按 (lead_score DESC, id DESC) 排序，反向扫描升序索引即可
+        Index("ix_leads_factory_score_id", "factory_id", "lead_score", "id"),
+        Index("ix_leads_factory_status_score_id", "factory_id", "qualification_status", "lead_score", "id"),
+        Index("ix_leads_factory_engagement_score_id", "factory_id", "engagement_level", "lead_score", "id"),
+        # 按工厂导出时按主键键集分页
+        Index("ix_leads_factory_id_id", "factory_id", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    factory_id = Column(Integer, ForeignKey("factories.id"), nullable=False, index=True)
+    factory_id = Column(Integer, ForeignKey("factories.id"), nullable=False)
     
     # 基本信息
     company_name = Column(String(255), nullable=False, index=True)
     website = Column(String(500), nullable=True)
+    
+    # 去重标识（见 app/services/lead_dedup.py）
+    company_key = Column(String(255), nullable=True)  # 归一化公司名称
+    website_domain = Column(String(255), nullable=True)
     industry = Column(String(255), nullable=True)
     company_size = Column(String(100), nullable=True)
     location = Column(String(255), nullable=True)
@@ -29,7 +45,8 @@ class Lead(Base):
     # 业务信息
     business_needs = Column(Text, nullable=True)
     product_requirements = Column(JSON, nullable=True)
-    budget_range = Column(String(100), nullable=True)
+    budget_range = Column(String(100), nullable=True)  # 客户画像的预算范围，参与评分
+    expected_order_size = Column(String(100), nullable=True)  # 生成时给出的预期订单规模，仅供参考
     timeline = Column(String(100), nullable=True)
     
     # 评分和状态
@@ -37,8 +54,12 @@ class Lead(Base):
     qualification_status = Column(String(50), default="unqualified")  # unqualified, qualified, hot
     engagement_level = Column(String(50), default="cold")  # cold, warm, hot
     
-    # 沟通历史
-    communication_history = Column(JSON, nullable=True)  # 沟通记录
+    # 沟通历史（明细只追加写入 lead_interactions，这里保存列表页使用的摘要）
+    interaction_count = Column(Integer, default=0)
+    response_count = Column(Integer, default=0)
+    last_interaction_at = Column(DateTime(timezone=True), nullable=True)
+    last_interaction_type = Column(String(100), nullable=True)
+    last_response_sentiment = Column(String(50), nullable=True)
     last_contact_date = Column(DateTime(timezone=True), nullable=True)
     next_follow_up_date = Column(DateTime(timezone=True), nullable=True)
     
@@ -46,6 +67,9 @@ class Lead(Base):
     lead_source = Column(String(100), nullable=True)  # 客户来源
     discovery_method = Column(String(100), nullable=True)  # 发现方式
     
+    # 全文检索词元（公司名称、业务需求、产品需求），见 app/services/lead_search.py
+    search_text = Column(Text, nullable=True)
+    
     # 状态信息
     is_active = Column(Boolean, default=True)
     is_converted = Column(Boolean, default=False)  # 是否已转化
@@ -54,9 +78,14 @@ class Lead(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
-    # 关系
-    factory = relationship("Factory", back_populates="leads")
-    interactions = relationship("LeadInteraction", back_populates="lead")
+    # 关系（禁止隐式懒加载，按 app/models/loading.py 中的加载方案显式加载）
+    factory = relationship("Factory", back_populates="leads", lazy="raise_on_sql")
+    interactions = relationship(
+        "LeadInteraction",
+        back_populates="lead",
+        lazy="raise_on_sql",
+        order_by="desc(LeadInteraction.created_at), desc(LeadInteraction.id)"
+    )
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -65,6 +94,8 @@ class Lead(Base):
             "factory_id": self.factory_id,
             "company_name": self.company_name,
             "website": self.website,
+            "company_key": self.company_key,
+            "website_domain": self.website_domain,
             "industry": self.industry,
             "company_size": self.company_size,
             "location": self.location,
@@ -76,11 +107,16 @@ class Lead(Base):
             "business_needs": self.business_needs,
             "product_requirements": self.product_requirements,
             "budget_range": self.budget_range,
+            "expected_order_size": self.expected_order_size,
             "timeline": self.timeline,
             "lead_score": self.lead_score,
             "qualification_status": self.qualification_status,
             "engagement_level": self.engagement_level,
-            "communication_history": self.communication_history,
+            "interaction_count": self.interaction_count,
+            "response_count": self.response_count,
+            "last_interaction_at": self.last_interaction_at.isoformat() if self.last_interaction_at else None,
+            "last_interaction_type": self.last_interaction_type,
+            "last_response_sentiment": self.last_response_sentiment,
             "last_contact_date": self.last_contact_date.isoformat() if self.last_contact_date else None,
             "next_follow_up_date": self.next_follow_up_date.isoformat() if self.next_follow_up_date else None,
             "lead_source": self.lead_source,
@@ -93,8 +129,12 @@ class Lead(Base):
 
 
 class LeadInteraction(Base):
-    """客户互动记录模型"""
+    """客户互动记录模型（只追加写入，见 app/services/interaction_log.py）"""
     __tablename__ = "lead_interactions"
+    __table_args__ = (
+        # 按客户读取时间线
+        Index("ix_lead_interactions_lead_created", "lead_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     lead_id = Column(Integer, ForeignKey("leads.id"), nullable=False, index=True)
@@ -115,11 +155,14 @@ class LeadInteraction(Base):
     follow_up_date = Column(DateTime(timezone=True), nullable=True)
     follow_up_notes = Column(Text, nullable=True)
     
+    # 全文检索词元（主题、内容、回复内容）
+    search_text = Column(Text, nullable=True)
+    
     # 时间戳
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # 关系
-    lead = relationship("Lead", back_populates="interactions")
+    lead = relationship("Lead", back_populates="interactions", lazy="raise_on_sql")
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -140,6 +183,59 @@ class LeadInteraction(Base):
         }
 
 
+class FollowUpTask(Base):
+    """跟进任务模型（到期后由 app/services/follow_up_scheduler.py 认领并执行）"""
+    __tablename__ = "follow_up_tasks"
+    __table_args__ = (
+        # 调度器只按 (status, due_at) 范围扫描到期任务
+        Index("ix_follow_up_tasks_status_due", "status", "due_at"),
+        # 按客户查找待执行的后续步骤
+        Index("ix_follow_up_tasks_lead_status_due", "lead_id", "status", "due_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    lead_id = Column(Integer, ForeignKey("leads.id"), nullable=False)
+    factory_id = Column(Integer, ForeignKey("factories.id"), nullable=False)
+    
+    # 跟进内容
+    source = Column(String(50), nullable=False, default="sequence")  # sequence, interaction
+    step_number = Column(Integer, nullable=True)
+    method = Column(String(100), nullable=False, default="email")  # email, linkedin, phone
+    content = Column(Text, nullable=True)
+    goal = Column(String(255), nullable=True)
+    
+    # 调度
+    due_at = Column(DateTime(timezone=True), nullable=False)
+    status = Column(String(50), nullable=False, default="pending")  # pending, done, cancelled, failed
+    lease_owner = Column(String(64), nullable=True)  # 认领批次标识，租约过期后其他进程可重新认领
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "lead_id": self.lead_id,
+            "factory_id": self.factory_id,
+            "source": self.source,
+            "step_number": self.step_number,
+            "method": self.method,
+            "content": self.content,
+            "goal": self.goal,
+            "due_at": self.due_at.isoformat() if self.due_at else None,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
 class LeadSource(Base):
     """客户来源模型"""
     __tablename__ = "lead_sources"
@@ -147,13 +243,91 @@ class LeadSource(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, unique=True)
     description = Column(Text, nullable=True)
-    source_type = Column(String(100), nullable=False)  # organic, paid, referral, event
+    source_type = Column(String(100), nullable=False)  # organic, paid, referral, event, other
     is_active = Column(Boolean, default=True)
     
-    # 统计信息
+    # 统计信息（按 Lead.lead_source 增量维护，见 app/services/factory_stats.py）
     total_leads = Column(Integer, default=0)
+    converted_leads = Column(Integer, default=0)
     conversion_rate = Column(Float, default=0.0)
     
     # 时间戳
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "source_type": self.source_type,
+            "is_active": self.is_active,
+            "total_leads": self.total_leads,
+            "converted_leads": self.converted_leads,
+            "conversion_rate": self.conversion_rate,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+def lead_search_text(lead: Any) -> str:
+    """潜在客户的检索词元，lead 可以是字典或模型实例"""
+    get = lead.get if isinstance(lead, dict) else lambda name: getattr(lead, name)
+    return build_search_text(get("company_name"), get("business_needs"), get("product_requirements"))
+
+
+def interaction_search_text(interaction: Any) -> str:
+    """互动记录的检索词元"""
+    get = interaction.get if isinstance(interaction, dict) else lambda name: getattr(interaction, name)
+    return build_search_text(get("subject"), get("content"), get("response_content"))
+
+
+# ORM 写入时自动维护检索列；批量写入路径（lead_persistence）直接计算
+@event.listens_for(Lead, "before_insert")
+@event.listens_for(Lead, "before_update")
+def _update_lead_search_text(mapper, connection, target):
+    target.search_text = lead_search_text(target)
+
+
+@event.listens_for(LeadInteraction, "before_insert")
+def _update_interaction_search_text(mapper, connection, target):
+    target.search_text = interaction_search_text(target)
+
+
+# 检索索引
+# - SQLite：FTS5 外部内容表，由触发器随 INSERT / UPDATE / DELETE（包括 upsert）同步更新
+# - PostgreSQL：search_text 的 tsvector 表达式 GIN 索引，随行写入自动维护
+SQLITE_SEARCH_TABLES = (("leads", "leads_fts"), ("lead_interactions", "lead_interactions_fts"))
+
+
+def sqlite_search_ddl(table_name: str, fts_name: str) -> List[str]:
+    """SQLite 全文检索表和同步触发器的DDL（可重复执行）"""
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5(search_text, content='{table_name}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts_name}(rowid, search_text) VALUES (new.id, new.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts_name}({fts_name}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE OF search_text ON {table_name} BEGIN "
+        f"INSERT INTO {fts_name}({fts_name}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+        f"INSERT INTO {fts_name}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    ]
+
+
+for _table, _fts in SQLITE_SEARCH_TABLES:
+    for _statement in sqlite_search_ddl(_table, _fts):
+        event.listen(Base.metadata.tables[_table], "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+
+def search_vector(column):
+    """PostgreSQL 检索向量表达式，查询时必须与索引表达式一致才能使用GIN索引"""
+    return func.to_tsvector(text("'simple'"), column)
+
+
+Index("ix_leads_search_text", search_vector(Lead.search_text), postgresql_using="gin").ddl_if(dialect="postgresql")
+Index(
+    "ix_lead_interactions_search_text",
+    search_vector(LeadInteraction.search_text),
+    postgresql_using="gin"
+).ddl_if(dialect="postgresql")
@@ -0,0 +1,35 @@
+from typing import Dict, Tuple
+
+from sqlalchemy.orm import joinedload, noload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from app.models.factory import Factory
+from app.models.lead import Lead, LeadInteraction
+
+# 关系加载方案
+#
+# 模型上的关系默认 lazy="raise_on_sql"，逐行访问未加载的关系会直接报错，而不是悄悄发出N+1查询。
+# 查询时按场景选用下面的方案：
+# - 列表页只需要本表字段，关系一律不加载
+# - 详情页用 joinedload 加载多对一关系（同一条SQL），selectinload 加载一对多关系（额外一条 IN 查询）
+LOAD_PROFILES: Dict[str, Tuple[LoaderOption, ...]] = {
+    "lead_list": (
+        noload(Lead.factory),
+        noload(Lead.interactions),
+    ),
+    "lead_detail": (
+        joinedload(Lead.factory).noload(Factory.leads),
+        selectinload(Lead.interactions).noload(LeadInteraction.lead),
+    ),
+    "factory_list": (
+        noload(Factory.leads),
+    ),
+    "interaction_list": (
+        noload(LeadInteraction.lead),
+    ),
+}
+
+
+def load_profile(name: str) -> Tuple[LoaderOption, ...]:
+    """按名称获取加载方案，用于 select(...).options(*load_profile(name))"""
+    return LOAD_PROFILES[name]
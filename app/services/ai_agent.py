@@ -1,23 +1,31 @@
-import openai
 import asyncio
 import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import logging
 
+from sqlalchemy import select
+
 from app.core.config import settings
+from app.core.llm import chat_completion
+from app.core.llm_scheduler import llm_request_context, PRIORITY_INTERACTIVE, PRIORITY_BATCH
 from app.services.web_analyzer import WebAnalyzer
 from app.services.lead_generator import LeadGenerator
 from app.services.content_creator import ContentCreator
-from app.models.factory import Factory
+from app.services.factory_stats import factory_stats_service
+from app.services.follow_up_scheduler import follow_up_scheduler
+from app.services.blacklist import blacklist_registry
+from app.services.profile_repository import profile_repository
+from app.services.lead_repository import lead_serializer
+from app.core.database import AsyncSessionLocal
 from app.models.lead import Lead
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 配置OpenAI
-openai.api_key = settings.OPENAI_API_KEY
+# 执行跟进步骤前检查黑名单所需的客户字段
+FOLLOW_UP_LEAD_FIELDS = ["id", "company_name", "website", "website_domain", "contact_email"]
 
 
 class AIAgentService:
@@ -53,11 +61,13 @@ class AIAgentService:
             # 1. 网站分析
             website_info = await self.web_analyzer.analyze_website(website_url)
             
-            # 2. AI信息提取和整理
-            extracted_info = await self._extract_factory_info(website_info)
-            
-            # 3. 生成引导对话
-            onboarding_conversation = await self._generate_onboarding_conversation(extracted_info)
+            # 引导流程是交互式的，LLM请求优先于批量任务调度
+            with llm_request_context(priority=PRIORITY_INTERACTIVE):
+                # 2. AI信息提取和整理
+                extracted_info = await self._extract_factory_info(website_info)
+                
+                # 3. 生成引导对话
+                onboarding_conversation = await self._generate_onboarding_conversation(extracted_info)
             
             return {
                 "status": "success",
@@ -97,14 +107,15 @@ class AIAgentService:
 请确保信息准确，如果某项信息无法从网站获取，请标记为"未找到"。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=settings.OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=settings.OPENAI_MAX_TOKENS,
-                temperature=settings.OPENAI_TEMPERATURE
+                temperature=settings.OPENAI_TEMPERATURE,
+                hedge=True
             )
             
             extracted_text = response.choices[0].message.content
@@ -162,14 +173,15 @@ class AIAgentService:
 请确保对话自然、专业，并突出需要用户确认的关键点。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=settings.OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=settings.OPENAI_MAX_TOKENS,
-                temperature=settings.OPENAI_TEMPERATURE
+                temperature=settings.OPENAI_TEMPERATURE,
+                hedge=True
             )
             
             conversation_text = response.choices[0].message.content
@@ -213,29 +225,13 @@ class AIAgentService:
                     "missing_fields": missing_fields
                 }
             
-            # 创建工厂档案
-            factory = Factory(
-                name=factory_data['name'],
-                website=factory_data['website'],
-                description=factory_data.get('description'),
-                location=factory_data.get('location'),
-                main_products=factory_data.get('main_products'),
-                core_advantages=factory_data.get('core_advantages'),
-                competitive_position=factory_data.get('competitive_position'),
-                certifications=factory_data.get('certifications'),
-                ideal_customer_profile=factory_data.get('ideal_customer_profile'),
-                target_markets=factory_data.get('target_markets'),
-                target_industries=factory_data.get('target_industries'),
-                contact_person=factory_data.get('contact_person'),
-                contact_title=factory_data.get('contact_title'),
-                blacklisted_companies=factory_data.get('blacklisted_companies'),
-                profile_completed=True
-            )
+            # 保存工厂档案（已有工厂则更新），并失效该工厂的档案缓存、模板和黑名单
+            factory = await profile_repository.save_factory(factory_data)
             
             return {
                 "status": "success",
                 "message": "工厂档案创建成功！",
-                "factory": factory.to_dict(),
+                "factory": factory,
                 "next_step": "start_business_development"
             }
             
@@ -254,17 +250,18 @@ class AIAgentService:
             # 1. 市场分析
             market_analysis = await self._analyze_market_opportunities(factory_id)
             
-            # 2. 生成潜在客户
-            leads = await self.lead_generator.generate_leads(factory_id, market_analysis)
-            
-            # 3. 创建个性化内容
-            content_templates = await self.content_creator.create_content_templates(factory_id)
+            with llm_request_context(priority=PRIORITY_BATCH, factory_id=factory_id):
+                # 2. 流式生成潜在客户，边生成边入库并推送给订阅的客户端
+                leads_generated = await self.lead_generator.generate_and_store_leads(factory_id, market_analysis)
+                
+                # 3. 创建个性化内容
+                content_templates = await self.content_creator.create_content_templates(factory_id)
             
             return {
                 "status": "success",
                 "message": "业务开发启动成功！",
                 "market_analysis": market_analysis,
-                "leads_generated": len(leads),
+                "leads_generated": leads_generated,
                 "content_templates": len(content_templates),
                 "next_step": "execute_outreach"
             }
@@ -289,24 +286,48 @@ class AIAgentService:
     async def execute_outreach(self, factory_id: int, lead_ids: List[int]) -> Dict[str, Any]:
         """执行客户开发活动"""
         try:
-            results = []
+            # 批量任务并发处理潜在客户，由LLM调度器限制实际在途请求并让出交互式容量
+            concurrency = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
             
-            for lead_id in lead_ids:
-                # 为每个潜在客户创建个性化内容
-                personalized_content = await self.content_creator.create_personalized_content(
-                    factory_id, lead_id
-                )
-                
-                # 执行多渠道开发
-                outreach_result = await self._execute_multi_channel_outreach(
-                    lead_id, personalized_content
-                )
-                
-                results.append({
-                    "lead_id": lead_id,
-                    "content": personalized_content,
-                    "outreach_result": outreach_result
-                })
+            # 一次查询预热本批潜在客户的档案缓存
+            await profile_repository.get_leads(lead_ids)
+            
+            async def process_lead(lead_id: int) -> Dict[str, Any]:
+                async with concurrency:
+                    with llm_request_context(priority=PRIORITY_BATCH, factory_id=factory_id):
+                        # 为每个潜在客户创建个性化内容
+                        personalized_content = await self.content_creator.create_personalized_content(
+                            factory_id, lead_id
+                        )
+                    
+                    # 执行多渠道开发，命中黑名单或没有生成内容的客户不发送
+                    if personalized_content.get("blocked"):
+                        outreach_result = {"status": "blocked"}
+                    elif personalized_content.get("error"):
+                        outreach_result = {"status": "skipped"}
+                    else:
+                        outreach_result = await self._execute_multi_channel_outreach(
+                            lead_id, personalized_content
+                        )
+                    
+                    return {
+                        "lead_id": lead_id,
+                        "content": personalized_content,
+                        "outreach_result": outreach_result
+                    }
+            
+            results = await asyncio.gather(*(process_lead(lead_id) for lead_id in lead_ids))
+            
+            # 已联系的客户按跟进序列安排后续步骤，由跟进调度器到期执行
+            sequences = {
+                result["lead_id"]: {"factory_id": factory_id, "sequence": result["content"]["follow_up_sequence"]}
+                for result in results
+                if result["outreach_result"].get("status") == "in_progress"
+                and result["content"].get("follow_up_sequence")
+            }
+            if sequences:
+                async with AsyncSessionLocal() as db:
+                    await follow_up_scheduler.schedule_sequences(db, sequences)
             
             return {
                 "status": "success",
@@ -331,23 +352,63 @@ class AIAgentService:
             "status": "in_progress"
         }
     
+    async def dispatch_follow_ups(self, tasks: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """执行到期的跟进步骤（跟进调度器认领后调用），返回 任务ID -> 执行结果"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(*lead_serializer.select_columns(FOLLOW_UP_LEAD_FIELDS))
+                .where(Lead.id.in_({task["lead_id"] for task in tasks}))
+            )).all()
+        leads = {lead["id"]: lead for lead in lead_serializer.rows_to_dicts(rows)}
+        
+        async def dispatch(task: Dict[str, Any]) -> Dict[str, Any]:
+            lead = leads.get(task["lead_id"])
+            if lead is None:
+                return {"status": "not_found"}
+            try:
+                # 黑名单不可用时抛出异常，按执行失败处理并稍后重试
+                blacklist_entry = await blacklist_registry.check_lead_async(task["factory_id"], lead)
+                if blacklist_entry is not None:
+                    return {"status": "blocked", "blacklist_entry": blacklist_entry}
+                outreach_result = await self._execute_multi_channel_outreach(task["lead_id"], {"follow_up_step": task})
+                return {**outreach_result, "status": "sent"}
+            except Exception as e:
+                logger.error(f"执行跟进步骤失败，任务ID: {task['id']}: {e}")
+                return {"status": "error", "error": str(e)}
+        
+        results = await asyncio.gather(*(dispatch(task) for task in tasks))
+        return {task["id"]: result for task, result in zip(tasks, results)}
+    
+    def _suggest_next_actions(self, stats: Dict[str, Any]) -> List[str]:
+        """根据统计给出下一步建议"""
+        actions = []
+        if stats["total_leads"] == 0:
+            actions.append("启动全球业务开发，生成潜在客户")
+        if stats["hot_leads"] > 0:
+            actions.append("跟进高价值潜在客户")
+        if stats["qualified_leads"] > stats["outbound_interactions"]:
+            actions.append("向已认证的潜在客户发起首次联系")
+        if stats["outbound_interactions"] >= 20 and stats["response_rate"] < 0.1:
+            actions.append("优化邮件模板")
+        return actions or ["扩展LinkedIn网络"]
+    
     async def get_development_progress(self, factory_id: int) -> Dict[str, Any]:
         """获取业务开发进度"""
         try:
-            # 这里应该实现进度查询逻辑
+            async with AsyncSessionLocal() as db:
+                stats = await factory_stats_service.get_stats(db, factory_id)
+            
             return {
                 "factory_id": factory_id,
-                "total_leads": 150,
-                "qualified_leads": 45,
-                "hot_leads": 12,
-                "conversions": 3,
-                "outreach_campaigns": 8,
-                "response_rate": 0.23,
-                "next_actions": [
-                    "跟进高价值潜在客户",
-                    "优化邮件模板",
-                    "扩展LinkedIn网络"
-                ]
+                "total_leads": stats["total_leads"],
+                "qualified_leads": stats["qualified_leads"],
+                "hot_leads": stats["hot_leads"],
+                "conversions": stats["conversions"],
+                "outbound_interactions": stats["outbound_interactions"],
+                "response_rate": stats["response_rate"],
+                "top_industries": stats["top_industries"],
+                "top_markets": stats["top_markets"],
+                "next_actions": self._suggest_next_actions(stats)
             }
             
         except Exception as e:
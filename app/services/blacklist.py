@@ -0,0 +1,282 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db_sync
+from app.models.factory import Factory
+from app.services.lead_dedup import normalize_company_name, extract_domain
+
+logger = logging.getLogger(__name__)
+
+_DOMAIN_PATTERN = re.compile(r"^[a-z0-9-]+(\.[a-z0-9-]+)*\.[a-z]{2,}$")
+_CJK_PATTERN = re.compile(r"[一-鿿]")
+
+
+class AhoCorasickAutomaton:
+    """多模式字符串匹配自动机，匹配耗时只与文本长度有关，与模式数量无关"""
+
+    def __init__(self, patterns: List[Tuple[str, str]]):
+        """patterns 为 (模式串, 原始黑名单条目)"""
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Optional[str]] = [None]
+
+        for pattern, entry in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions[state][char] = next_state
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                state = next_state
+            if self.output[state] is None:
+                self.output[state] = entry
+
+        # 广度优先构建失败指针，并把后缀状态的输出向下传递
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.transitions[fallback].get(char, 0)
+                if self.output[next_state] is None:
+                    self.output[next_state] = self.output[self.fail[next_state]]
+
+    def __len__(self) -> int:
+        return len(self.transitions)
+
+    def search(self, text: str) -> Optional[str]:
+        """返回第一个命中的条目"""
+        transitions, fail, output = self.transitions, self.fail, self.output
+        state = 0
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+
+class BlacklistMatcher:
+    """单个工厂编译后的黑名单
+
+    域名条目放入哈希集合，按域名及其上级域名查找；公司名称条目归一化后编入
+    Aho-Corasick自动机，按词边界匹配（中文名称按子串匹配）。
+    """
+
+    def __init__(self, entries: Optional[List[str]] = None):
+        self.domains: Dict[str, str] = {}
+        patterns = []
+
+        for entry in entries or []:
+            if not isinstance(entry, str) or not entry.strip():
+                continue
+            value = entry.strip().lower()
+
+            if "@" in value:
+                self.domains.setdefault(value.rsplit("@", 1)[1], entry)
+                continue
+            domain = extract_domain(value) if "/" in value or value.startswith("www.") else value
+            if _DOMAIN_PATTERN.match(domain):
+                self.domains.setdefault(domain, entry)
+                continue
+
+            key = normalize_company_name(entry)
+            if key:
+                patterns.append((key if _CJK_PATTERN.search(key) else f" {key} ", entry))
+
+        self.automaton = AhoCorasickAutomaton(patterns)
+        self.size = len(self.domains) + len(patterns)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def match(self, lead: Dict[str, Any]) -> Optional[str]:
+        """返回命中的黑名单条目，未命中返回None"""
+        if not self.size:
+            return None
+
+        if self.domains:
+            domain = lead.get("website_domain") or extract_domain(lead.get("website"), lead.get("contact_email"))
+            while domain:
+                entry = self.domains.get(domain)
+                if entry is not None:
+                    return entry
+                domain = domain.partition(".")[2] if domain.count(".") > 1 else ""
+
+        name = normalize_company_name(lead.get("company_name"))
+        if name:
+            return self.automaton.search(f" {name} ")
+        return None
+
+    def filter(self, leads: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """拆分为 (允许联系, 命中黑名单)"""
+        if not self.size:
+            return leads, []
+        allowed, blocked = [], []
+        for lead in leads:
+            (blocked if self.match(lead) else allowed).append(lead)
+        return allowed, blocked
+
+
+class BlacklistUnavailableError(RuntimeError):
+    """工厂黑名单加载失败且没有可用的缓存，无法确认客户是否允许联系"""
+
+
+class _CachedMatcher:
+    __slots__ = ("matcher", "version", "checked_at")
+
+    def __init__(self, matcher: BlacklistMatcher, version: Any, checked_at: float):
+        self.matcher = matcher
+        self.version = version
+        self.checked_at = checked_at
+
+
+class BlacklistRegistry:
+    """按工厂缓存编译后的黑名单
+
+    以 Factory.updated_at 作为版本号，最多每 BLACKLIST_REFRESH_S 秒检查一次版本，
+    版本变化或显式失效后重新编译。加载失败时继续使用上一次成功编译的黑名单；从未加载成功时
+    抛出 BlacklistUnavailableError，调用方跳过外联而不是当作没有黑名单放行。
+    """
+
+    def __init__(self, refresh_s: float):
+        self.refresh_s = refresh_s
+        self.matchers: Dict[int, _CachedMatcher] = {}
+        self.lock = threading.Lock()
+
+        # 指标
+        self.compiled = 0
+        self.blocked = 0
+
+    def compile(self, factory_id: int, entries: Optional[List[str]], version: Any = None) -> BlacklistMatcher:
+        """用给定黑名单编译并缓存"""
+        matcher = BlacklistMatcher(entries)
+        with self.lock:
+            self.matchers[factory_id] = _CachedMatcher(matcher, version, time.monotonic())
+            self.compiled += 1
+        logger.info(f"工厂 {factory_id} 黑名单编译完成，共 {len(matcher)} 个条目")
+        return matcher
+
+    def _fresh_matcher(self, factory_id: int) -> Optional[BlacklistMatcher]:
+        """距上次确认不超过 refresh_s 的缓存"""
+        cached = self.matchers.get(factory_id)
+        if cached is not None and time.monotonic() - cached.checked_at < self.refresh_s:
+            return cached.matcher
+        return None
+
+    def _confirm_cached(self, factory_id: int, version: Any) -> Optional[BlacklistMatcher]:
+        """工厂档案版本未变时继续使用缓存"""
+        cached = self.matchers.get(factory_id)
+        if cached is not None and cached.version == version:
+            cached.checked_at = time.monotonic()
+            return cached.matcher
+        return None
+
+    def _load_failed(self, factory_id: int, error: Exception) -> BlacklistMatcher:
+        logger.warning(f"加载工厂 {factory_id} 黑名单失败: {error}")
+        cached = self.matchers.get(factory_id)
+        if cached is not None:
+            cached.checked_at = time.monotonic()
+            return cached.matcher
+        raise BlacklistUnavailableError(f"工厂 {factory_id} 黑名单加载失败: {error}") from error
+
+    def get_matcher(self, factory_id: int) -> BlacklistMatcher:
+        """同步获取黑名单匹配器（后台线程使用，事件循环中使用 get_matcher_async）"""
+        matcher = self._fresh_matcher(factory_id)
+        if matcher is not None:
+            return matcher
+
+        db = get_db_sync()
+        try:
+            version = db.execute(select(Factory.updated_at).where(Factory.id == factory_id)).scalar()
+            matcher = self._confirm_cached(factory_id, version)
+            if matcher is not None:
+                return matcher
+
+            entries = db.execute(
+                select(Factory.blacklisted_companies).where(Factory.id == factory_id)
+            ).scalar()
+            return self.compile(factory_id, entries, version)
+
+        except Exception as e:
+            return self._load_failed(factory_id, e)
+        finally:
+            db.close()
+
+    async def get_matcher_async(self, factory_id: int) -> BlacklistMatcher:
+        """异步获取黑名单匹配器，缓存过期时通过异步会话确认版本，不阻塞事件循环"""
+        matcher = self._fresh_matcher(factory_id)
+        if matcher is not None:
+            return matcher
+
+        try:
+            async with AsyncSessionLocal() as db:
+                version = (await db.execute(
+                    select(Factory.updated_at).where(Factory.id == factory_id)
+                )).scalar()
+                matcher = self._confirm_cached(factory_id, version)
+                if matcher is not None:
+                    return matcher
+
+                entries = (await db.execute(
+                    select(Factory.blacklisted_companies).where(Factory.id == factory_id)
+                )).scalar()
+            return self.compile(factory_id, entries, version)
+
+        except Exception as e:
+            return self._load_failed(factory_id, e)
+
+    def _filter(self, factory_id: int, matcher: BlacklistMatcher, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        allowed, blocked = matcher.filter(leads)
+        if blocked:
+            self.blocked += len(blocked)
+            logger.info(f"工厂 {factory_id} 过滤黑名单客户 {len(blocked)} 个")
+        return allowed
+
+    def _check(self, matcher: BlacklistMatcher, lead: Dict[str, Any]) -> Optional[str]:
+        entry = matcher.match(lead)
+        if entry is not None:
+            self.blocked += 1
+        return entry
+
+    def filter_leads(self, factory_id: int, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """过滤掉命中工厂黑名单的潜在客户"""
+        return self._filter(factory_id, self.get_matcher(factory_id), leads)
+
+    async def filter_leads_async(self, factory_id: int, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self._filter(factory_id, await self.get_matcher_async(factory_id), leads)
+
+    def check_lead(self, factory_id: int, lead: Dict[str, Any]) -> Optional[str]:
+        return self._check(self.get_matcher(factory_id), lead)
+
+    async def check_lead_async(self, factory_id: int, lead: Dict[str, Any]) -> Optional[str]:
+        return self._check(await self.get_matcher_async(factory_id), lead)
+
+    def invalidate(self, factory_id: int):
+        """工厂档案更新后调用"""
+        with self.lock:
+            self.matchers.pop(factory_id, None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "cached_factories": len(self.matchers),
+            "compiled": self.compiled,
+            "blocked": self.blocked
+        }
+
+
+blacklist_registry = BlacklistRegistry(refresh_s=settings.BLACKLIST_REFRESH_S)
@@ -1,4 +1,3 @@
-import openai
 import asyncio
 from typing import Dict, List, Any, Optional
 import logging
@@ -6,9 +5,18 @@ from datetime import datetime
 import json
 
 from app.core.config import settings
+from app.core.llm import chat_completion
+from app.core.semantic_cache import content_prompt_cache
+from app.core.circuit_breaker import CircuitOpenError
+from app.services.template_renderer import template_engine
+from app.services.blacklist import blacklist_registry
+from app.services.profile_repository import profile_repository
 
 logger = logging.getLogger(__name__)
 
+# 个性化内容中与具体客户身份相关、复用缓存时需要替换的字段
+PERSONALIZATION_IDENTITY_FIELDS = ["company_name", "contact_name", "website", "contact_email"]
+
 
 class ContentCreator:
     """内容创建服务"""
@@ -23,9 +31,7 @@ class ContentCreator:
         try:
             logger.info(f"开始为工厂 {factory_id} 创建内容模板")
             
-            # 这里应该从数据库获取工厂信息
-            # 暂时使用模拟数据
-            factory_info = self._get_mock_factory_info(factory_id)
+            factory_info = await profile_repository.get_factory(factory_id)
             
             # 创建不同类型的内容模板
             templates = []
@@ -46,6 +52,12 @@ class ContentCreator:
             company_templates = await self._create_company_templates(factory_info)
             templates.extend(company_templates)
             
+            # 生成失败的内容不作为模板返回，渲染时改用工厂档案中的字段
+            templates = [template for template in templates if template["content"] is not None]
+            
+            # 5. 编译个性化渲染模板，后续的个性化内容优先在本地渲染
+            template_engine.compile_factory(factory_id, factory_info, templates)
+            
             logger.info(f"成功创建 {len(templates)} 个内容模板")
             return templates
             
@@ -58,9 +70,33 @@ class ContentCreator:
         try:
             logger.info(f"为工厂 {factory_id} 的潜在客户 {lead_id} 创建个性化内容")
             
-            # 这里应该从数据库获取工厂和潜在客户信息
-            factory_info = self._get_mock_factory_info(factory_id)
-            lead_info = self._get_mock_lead_info(lead_id)
+            # 档案经缓存读取，批量开发时同一工厂只从数据库读取一次
+            factory_info = await profile_repository.get_factory(factory_id)
+            lead_info = await profile_repository.get_lead(lead_id)
+            
+            # 命中工厂黑名单的客户不生成内容
+            blacklist_entry = await blacklist_registry.check_lead_async(factory_id, lead_info)
+            if blacklist_entry is not None:
+                logger.info(f"潜在客户 {lead_id} 命中黑名单条目 {blacklist_entry}，跳过")
+                return {
+                    "lead_id": lead_id,
+                    "factory_id": factory_id,
+                    "blocked": True,
+                    "blacklist_entry": blacklist_entry
+                }
+            
+            # 优先使用编译好的模板在本地渲染，客户数据不符合模板时才调用LLM
+            if settings.TEMPLATE_RENDERING_ENABLED:
+                if template_engine.get_factory_templates(factory_id) is None:
+                    template_engine.compile_factory(factory_id, factory_info)
+                rendered = template_engine.render(factory_id, lead_info)
+                if rendered is not None:
+                    return {
+                        "lead_id": lead_id,
+                        "factory_id": factory_id,
+                        "render_mode": "template",
+                        **rendered
+                    }
             
             # 创建个性化内容
             personalized_content = {
@@ -69,7 +105,8 @@ class ContentCreator:
                 "email_content": await self._create_personalized_email(factory_info, lead_info),
                 "linkedin_message": await self._create_personalized_linkedin_message(factory_info, lead_info),
                 "product_recommendation": await self._create_product_recommendation(factory_info, lead_info),
-                "follow_up_sequence": await self._create_follow_up_sequence(factory_info, lead_info)
+                "follow_up_sequence": await self._create_follow_up_sequence(factory_info, lead_info),
+                "render_mode": "llm"
             }
             
             return personalized_content
@@ -246,8 +283,8 @@ class ContentCreator:
             logger.error(f"创建公司模板失败: {e}")
             return []
     
-    async def _generate_email_content(self, email_type: str, factory_info: Dict[str, Any], description: str) -> str:
-        """生成邮件内容"""
+    async def _generate_email_content(self, email_type: str, factory_info: Dict[str, Any], description: str) -> Optional[str]:
+        """生成邮件内容，失败时返回None"""
         try:
             prompt = f"""
 请为以下工厂创建一个{description}的邮件模板：
@@ -267,7 +304,7 @@ class ContentCreator:
 请直接返回邮件正文内容，不需要包含邮件格式。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的B2B营销文案专家。"},
@@ -281,10 +318,10 @@ class ContentCreator:
             
         except Exception as e:
             logger.error(f"生成邮件内容失败: {e}")
-            return f"抱歉，生成{description}内容时出现错误。"
+            return None
     
-    async def _generate_linkedin_content(self, message_type: str, factory_info: Dict[str, Any], description: str) -> str:
-        """生成LinkedIn消息内容"""
+    async def _generate_linkedin_content(self, message_type: str, factory_info: Dict[str, Any], description: str) -> Optional[str]:
+        """生成LinkedIn消息内容，失败时返回None"""
         try:
             prompt = f"""
 请为以下工厂创建一个{description}的LinkedIn消息：
@@ -304,7 +341,7 @@ class ContentCreator:
 请直接返回消息内容。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的LinkedIn营销专家。"},
@@ -318,10 +355,10 @@ class ContentCreator:
             
         except Exception as e:
             logger.error(f"生成LinkedIn内容失败: {e}")
-            return f"抱歉，生成{description}内容时出现错误。"
+            return None
     
-    async def _generate_product_content(self, content_type: str, factory_info: Dict[str, Any], description: str) -> str:
-        """生成产品内容"""
+    async def _generate_product_content(self, content_type: str, factory_info: Dict[str, Any], description: str) -> Optional[str]:
+        """生成产品内容，失败时返回None"""
         try:
             prompt = f"""
 请为以下工厂创建一个{description}的产品介绍：
@@ -341,7 +378,7 @@ class ContentCreator:
 请直接返回内容。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的产品文案专家。"},
@@ -355,10 +392,10 @@ class ContentCreator:
             
         except Exception as e:
             logger.error(f"生成产品内容失败: {e}")
-            return f"抱歉，生成{description}内容时出现错误。"
+            return None
     
-    async def _generate_company_content(self, content_type: str, factory_info: Dict[str, Any], description: str) -> str:
-        """生成公司内容"""
+    async def _generate_company_content(self, content_type: str, factory_info: Dict[str, Any], description: str) -> Optional[str]:
+        """生成公司内容，失败时返回None"""
         try:
             prompt = f"""
 请为以下工厂创建一个{description}的公司介绍：
@@ -378,7 +415,7 @@ class ContentCreator:
 请直接返回内容。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的公司介绍文案专家。"},
@@ -392,11 +429,16 @@ class ContentCreator:
             
         except Exception as e:
             logger.error(f"生成公司内容失败: {e}")
-            return f"抱歉，生成{description}内容时出现错误。"
+            return None
     
     async def _create_personalized_email(self, factory_info: Dict[str, Any], lead_info: Dict[str, Any]) -> str:
         """创建个性化邮件"""
         try:
+            cache_text = self._personalization_cache_text("email", lead_info)
+            cached = content_prompt_cache.lookup(cache_text, scope=self._factory_scope(factory_info))
+            if cached:
+                return self._adapt_cached_content(cached["value"], cached["metadata"], lead_info)
+            
             prompt = f"""
 请为以下工厂和潜在客户创建一个个性化的邮件：
 
@@ -417,7 +459,7 @@ class ContentCreator:
 请直接返回邮件正文内容。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的B2B个性化营销专家。"},
@@ -427,7 +469,19 @@ class ContentCreator:
                 temperature=self.temperature
             )
             
-            return response.choices[0].message.content.strip()
+            content = response.choices[0].message.content.strip()
+            content_prompt_cache.store(
+                cache_text,
+                content,
+                scope=self._factory_scope(factory_info),
+                metadata=self._lead_identity(lead_info)
+            )
+            
+            return content
+            
+        except CircuitOpenError as e:
+            logger.warning(f"创建个性化邮件失败，使用缓存降级: {e}")
+            return self._cached_content_fallback(cache_text, factory_info, lead_info, "抱歉，创建个性化邮件时出现错误。")
             
         except Exception as e:
             logger.error(f"创建个性化邮件失败: {e}")
@@ -436,6 +490,11 @@ class ContentCreator:
     async def _create_personalized_linkedin_message(self, factory_info: Dict[str, Any], lead_info: Dict[str, Any]) -> str:
         """创建个性化LinkedIn消息"""
         try:
+            cache_text = self._personalization_cache_text("linkedin", lead_info)
+            cached = content_prompt_cache.lookup(cache_text, scope=self._factory_scope(factory_info))
+            if cached:
+                return self._adapt_cached_content(cached["value"], cached["metadata"], lead_info)
+            
             prompt = f"""
 请为以下工厂和潜在客户创建一个个性化的LinkedIn消息：
 
@@ -456,7 +515,7 @@ class ContentCreator:
 请直接返回消息内容。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的LinkedIn个性化营销专家。"},
@@ -466,7 +525,19 @@ class ContentCreator:
                 temperature=self.temperature
             )
             
-            return response.choices[0].message.content.strip()
+            content = response.choices[0].message.content.strip()
+            content_prompt_cache.store(
+                cache_text,
+                content,
+                scope=self._factory_scope(factory_info),
+                metadata=self._lead_identity(lead_info)
+            )
+            
+            return content
+            
+        except CircuitOpenError as e:
+            logger.warning(f"创建个性化LinkedIn消息失败，使用缓存降级: {e}")
+            return self._cached_content_fallback(cache_text, factory_info, lead_info, "抱歉，创建个性化LinkedIn消息时出现错误。")
             
         except Exception as e:
             logger.error(f"创建个性化LinkedIn消息失败: {e}")
@@ -475,6 +546,11 @@ class ContentCreator:
     async def _create_product_recommendation(self, factory_info: Dict[str, Any], lead_info: Dict[str, Any]) -> str:
         """创建产品推荐"""
         try:
+            cache_text = self._personalization_cache_text("product_recommendation", lead_info)
+            cached = content_prompt_cache.lookup(cache_text, scope=self._factory_scope(factory_info))
+            if cached:
+                return self._adapt_cached_content(cached["value"], cached["metadata"], lead_info)
+            
             prompt = f"""
 请为以下工厂和潜在客户创建一个产品推荐：
 
@@ -494,7 +570,7 @@ class ContentCreator:
 请直接返回推荐内容。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的产品推荐专家。"},
@@ -504,7 +580,19 @@ class ContentCreator:
                 temperature=self.temperature
             )
             
-            return response.choices[0].message.content.strip()
+            content = response.choices[0].message.content.strip()
+            content_prompt_cache.store(
+                cache_text,
+                content,
+                scope=self._factory_scope(factory_info),
+                metadata=self._lead_identity(lead_info)
+            )
+            
+            return content
+            
+        except CircuitOpenError as e:
+            logger.warning(f"创建产品推荐失败，使用缓存降级: {e}")
+            return self._cached_content_fallback(cache_text, factory_info, lead_info, "抱歉，创建产品推荐时出现错误。")
             
         except Exception as e:
             logger.error(f"创建产品推荐失败: {e}")
@@ -532,7 +620,7 @@ class ContentCreator:
 请返回跟进序列的详细计划。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的客户跟进专家。"},
@@ -588,28 +676,46 @@ class ContentCreator:
         
         return sequence[:5]  # 最多5个步骤
     
-    def _get_mock_factory_info(self, factory_id: int) -> Dict[str, Any]:
-        """获取模拟工厂信息"""
-        return {
-            "name": "优质制造工厂",
-            "industry": "制造业",
-            "main_products": ["电子产品", "家居用品", "工业设备"],
-            "core_advantages": ["高质量", "快速交付", "成本优势"],
-            "certifications": ["ISO9001", "ISO14001", "CE认证"],
-            "location": "中国深圳",
-            "established_year": "2010",
-            "employee_count": "500+"
+    def _personalization_cache_text(self, content_type: str, lead_info: Dict[str, Any]) -> str:
+        """生成用于语义缓存的客户特征文本
+
+        不包含公司名和联系人等身份字段，这样特征相近的不同客户可以复用同一份内容。
+        """
+        features = {
+            key: value for key, value in lead_info.items()
+            if key not in PERSONALIZATION_IDENTITY_FIELDS
         }
+        return f"{content_type}\n{json.dumps(features, ensure_ascii=False, sort_keys=True)}"
     
-    def _get_mock_lead_info(self, lead_id: int) -> Dict[str, Any]:
-        """获取模拟潜在客户信息"""
-        return {
-            "company_name": "创新科技公司",
-            "industry": "消费电子",
-            "company_size": "100-500人",
-            "location": "北美",
-            "business_needs": "高质量电子产品制造",
-            "contact_name": "John Smith",
-            "contact_title": "采购经理",
-            "product_requirements": ["智能手机外壳", "平板电脑配件"]
-        }
+    def _lead_identity(self, lead_info: Dict[str, Any]) -> Dict[str, Any]:
+        """提取潜在客户的身份字段"""
+        return {key: lead_info.get(key) for key in PERSONALIZATION_IDENTITY_FIELDS if lead_info.get(key)}
+    
+    def _adapt_cached_content(self, content: str, cached_identity: Dict[str, Any], lead_info: Dict[str, Any]) -> str:
+        """将缓存内容中的身份字段替换为当前潜在客户的信息"""
+        for key, old_value in cached_identity.items():
+            new_value = lead_info.get(key)
+            if new_value and isinstance(old_value, str):
+                content = content.replace(old_value, str(new_value))
+        return content
+    
+    def _cached_content_fallback(
+        self,
+        cache_text: str,
+        factory_info: Dict[str, Any],
+        lead_info: Dict[str, Any],
+        default: str
+    ) -> str:
+        """LLM熔断时以较低的相似度阈值复用缓存内容，没有可用缓存时返回默认内容"""
+        cached = content_prompt_cache.lookup(
+            cache_text,
+            scope=self._factory_scope(factory_info),
+            threshold=settings.LLM_FALLBACK_CACHE_THRESHOLD
+        )
+        if cached:
+            return self._adapt_cached_content(cached["value"], cached["metadata"], lead_info)
+        return default
+    
+    def _factory_scope(self, factory_info: Dict[str, Any]) -> Any:
+        """个性化内容只在同一工厂内复用"""
+        return factory_info.get("id") or factory_info.get("name")
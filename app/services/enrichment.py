@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Callable, Iterable
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentProvider:
+    """企业数据提供方基类，新增第三方数据源时继承并实现 lookup_many"""
+
+    name = "base"
+
+    async def lookup_many(self, domains: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """批量查询，返回 域名 -> 企业数据（查不到为None）"""
+        raise NotImplementedError
+
+
+class StaticEnrichmentProvider(EnrichmentProvider):
+    """返回固定示例数据，未配置数据源时使用"""
+
+    name = "static"
+
+    async def lookup_many(self, domains: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        return {
+            domain: {
+                "company_founded": "2010-2020",
+                "revenue_range": "1M-100M",
+                "technology_stack": ["ERP", "CRM", "Cloud Computing"],
+                "recent_news": "公司正在寻求数字化转型",
+                "competitors": ["竞争对手A", "竞争对手B"],
+                "growth_rate": "15-25%"
+            }
+            for domain in domains
+        }
+
+
+class FileEnrichmentProvider(EnrichmentProvider):
+    """从本地文件读取企业数据，用于测试和离线导入
+
+    支持 JSON（{域名: 数据}）和 JSONL（每行包含 domain 字段）两种格式，文件修改后自动重新加载。
+    """
+
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.loaded_mtime: Optional[float] = None
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self.loaded_mtime is None:
+                logger.warning(f"企业数据文件不存在: {self.path}")
+                self.loaded_mtime = 0.0
+            return
+        if mtime == self.loaded_mtime:
+            return
+
+        records = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            if self.path.endswith(".jsonl"):
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        records[str(record.pop("domain")).lower()] = record
+            else:
+                records = {domain.lower(): record for domain, record in json.load(f).items()}
+
+        self.records = records
+        self.loaded_mtime = mtime
+        logger.info(f"已加载 {len(records)} 条企业数据: {self.path}")
+
+    async def lookup_many(self, domains: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        self._load()
+        return {domain: self.records.get(domain) for domain in domains}
+
+
+PROVIDERS: Dict[str, Callable[[], EnrichmentProvider]] = {
+    "static": StaticEnrichmentProvider,
+    "file": lambda: FileEnrichmentProvider(settings.ENRICHMENT_FILE_PATH),
+}
+
+
+def register_provider(name: str, factory: Callable[[], EnrichmentProvider]):
+    """注册第三方数据源，通过 ENRICHMENT_PROVIDER 配置选用"""
+    PROVIDERS[name] = factory
+
+
+class TTLCache:
+    """带过期时间的LRU缓存"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> tuple:
+        """返回 (是否命中, 值)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value: Any, ttl_s: float):
+        self.entries[key] = (time.monotonic() + ttl_s, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class EnrichmentService:
+    """按网站域名缓存的企业数据丰富服务
+
+    - 缓存按域名跨工厂共享，查不到的域名以较短TTL做负缓存
+    - 同一域名的并发查询合并为一次数据源请求
+    - 未命中的域名按批次批量查询数据源
+    """
+
+    def __init__(
+        self,
+        provider: EnrichmentProvider,
+        ttl_s: float,
+        negative_ttl_s: float,
+        max_entries: int,
+        batch_size: int
+    ):
+        self.provider = provider
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.batch_size = batch_size
+        self.cache = TTLCache(max_entries)
+        self.in_flight: Dict[str, asyncio.Future] = {}
+
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.provider_calls = 0
+        self.provider_errors = 0
+
+    async def enrich_domain(self, domain: str) -> Optional[Dict[str, Any]]:
+        return (await self.enrich_domains([domain])).get(domain.lower())
+
+    async def enrich_domains(self, domains: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """批量获取企业数据，返回 域名 -> 数据"""
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        to_fetch: List[str] = []
+
+        for domain in dict.fromkeys(d.lower() for d in domains if d):
+            hit, value = self.cache.get(domain)
+            if hit:
+                self.hits += 1
+                results[domain] = value
+            elif domain in self.in_flight:
+                # 其他调用方正在查询该域名，等待其结果
+                self.coalesced += 1
+                waiting[domain] = self.in_flight[domain]
+            else:
+                self.misses += 1
+                self.in_flight[domain] = asyncio.get_running_loop().create_future()
+                to_fetch.append(domain)
+
+        try:
+            for start in range(0, len(to_fetch), self.batch_size):
+                await self._fetch_batch(to_fetch[start:start + self.batch_size])
+        finally:
+            # 被取消时也要释放等待中的合并请求
+            for domain in to_fetch:
+                future = self.in_flight.pop(domain)
+                if not future.done():
+                    future.set_result(None)
+                results[domain] = future.result()
+
+        for domain, future in waiting.items():
+            try:
+                results[domain] = await asyncio.shield(future)
+            except Exception:
+                results[domain] = None
+
+        return results
+
+    async def _fetch_batch(self, domains: List[str]):
+        self.provider_calls += 1
+        try:
+            fetched = await self.provider.lookup_many(domains)
+        except Exception as e:
+            # 数据源失败不写缓存，下次重试
+            self.provider_errors += 1
+            logger.error(f"企业数据源 {self.provider.name} 查询失败: {e}")
+            for domain in domains:
+                self.in_flight[domain].set_result(None)
+            return
+
+        for domain in domains:
+            value = fetched.get(domain)
+            self.cache.set(domain, value, self.ttl_s if value is not None else self.negative_ttl_s)
+            self.in_flight[domain].set_result(value)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "provider": self.provider.name,
+            "cached_domains": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "provider_calls": self.provider_calls,
+            "provider_errors": self.provider_errors
+        }
+
+
+def _create_provider() -> EnrichmentProvider:
+    factory = PROVIDERS.get(settings.ENRICHMENT_PROVIDER)
+    if factory is None:
+        logger.warning(f"未知的企业数据源 {settings.ENRICHMENT_PROVIDER}，使用示例数据")
+        factory = StaticEnrichmentProvider
+    return factory()
+
+
+enrichment_service = EnrichmentService(
+    provider=_create_provider(),
+    ttl_s=settings.ENRICHMENT_CACHE_TTL_S,
+    negative_ttl_s=settings.ENRICHMENT_NEGATIVE_TTL_S,
+    max_entries=settings.ENRICHMENT_CACHE_MAX_ENTRIES,
+    batch_size=settings.ENRICHMENT_BATCH_SIZE
+)
@@ -0,0 +1,514 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+import logging
+
+from sqlalchemy import select, update, insert, union, literal, func, case, cast, event, inspect, Float
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import settings
+from app.core.sqlite_writer import sqlite_writer
+from app.models.factory import Factory, FactoryStats, FactoryStatsBucket
+from app.models.lead import Lead, LeadInteraction, LeadSource
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = [
+    "total_leads", "qualified_leads", "hot_leads", "conversions",
+    "total_interactions", "outbound_interactions", "responses"
+]
+QUALIFIED_STATUSES = ("qualified", "hot")
+UPSERT_DIALECTS = ("postgresql", "sqlite")
+
+# 分布维度 -> 潜在客户字段
+BUCKET_DIMENSIONS = {"industry": "industry", "market": "location"}
+
+# 影响统计的潜在客户字段，ORM 修改这些字段时按"移除旧值、加入新值"累加增量
+TRACKED_LEAD_FIELDS = ("factory_id", "qualification_status", "is_converted", "lead_source",
+                       *BUCKET_DIMENSIONS.values())
+
+# 写入时自动创建的客户来源类型
+DEFAULT_SOURCE_TYPE = "other"
+
+
+class FactoryStatsDelta:
+    """一次写入对工厂统计的增量，按工厂累加后一次性合并到统计表"""
+
+    def __init__(self):
+        self.counters: Dict[int, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+        self.buckets: Dict[tuple, int] = defaultdict(int)
+        # 客户来源 -> [客户数, 已转化数]
+        self.sources: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+
+    def __bool__(self) -> bool:
+        return bool(self.counters) or bool(self.buckets) or bool(self.sources)
+
+    def add(self, factory_id: int, column: str, count: int = 1):
+        if count:
+            self.counters[factory_id][column] += count
+
+    def add_lead(self, lead: Dict[str, Any], sign: int = 1):
+        """新增（sign=1）或移除（sign=-1）一个潜在客户"""
+        factory_id = lead.get("factory_id")
+        if factory_id is None:
+            return
+        status = lead.get("qualification_status")
+        self.add(factory_id, "total_leads", sign)
+        self.add(factory_id, "qualified_leads", sign if status in QUALIFIED_STATUSES else 0)
+        self.add(factory_id, "hot_leads", sign if status == "hot" else 0)
+        self.add(factory_id, "conversions", sign if lead.get("is_converted") else 0)
+        for dimension, field in BUCKET_DIMENSIONS.items():
+            value = lead.get(field)
+            if value:
+                self.buckets[(factory_id, dimension, str(value)[:255])] += sign
+        source = lead.get("lead_source")
+        if source:
+            self.sources[source][0] += sign
+            self.sources[source][1] += sign if lead.get("is_converted") else 0
+
+    def change_status(self, factory_id: int, old_status: Optional[str], new_status: Optional[str]):
+        if old_status == new_status:
+            return
+        self.add(factory_id, "qualified_leads",
+                 (new_status in QUALIFIED_STATUSES) - (old_status in QUALIFIED_STATUSES))
+        self.add(factory_id, "hot_leads", (new_status == "hot") - (old_status == "hot"))
+
+    def add_interaction(self, factory_id: int, interaction: Dict[str, Any]):
+        self.add(factory_id, "total_interactions")
+        self.add(factory_id, "outbound_interactions", 1 if interaction.get("interaction_method") == "outbound" else 0)
+        self.add(factory_id, "responses", 1 if interaction.get("response_received") else 0)
+
+
+class FactoryStatsService:
+    """工厂统计的增量维护与读取
+
+    潜在客户和互动记录的写入路径在同一事务中把增量累加到 factory_stats /
+    factory_stats_buckets 以及客户来源（lead_sources）的计数和转化率，仪表盘只按主键读取
+    一行统计和少量分布行，与数据量无关。
+    合并写入、手工改库等增量覆盖不到的情况由定期全量重算（reconcile）纠正。
+    """
+
+    def __init__(self, top_n: int):
+        self.top_n = top_n
+
+    def _rows(self, delta: FactoryStatsDelta) -> tuple:
+        counter_rows = [
+            {"factory_id": factory_id, **counters}
+            for factory_id, counters in delta.counters.items()
+            if any(counters.values())
+        ]
+        bucket_rows = [
+            {"factory_id": factory_id, "dimension": dimension, "value": value, "lead_count": count}
+            for (factory_id, dimension, value), count in delta.buckets.items()
+            if count
+        ]
+        source_rows = [
+            {
+                "name": name,
+                "source_type": DEFAULT_SOURCE_TYPE,
+                "total_leads": total,
+                "converted_leads": converted,
+                "conversion_rate": converted / total if total > 0 else 0.0
+            }
+            for name, (total, converted) in delta.sources.items()
+            if total or converted
+        ]
+        return counter_rows, bucket_rows, source_rows
+
+    def _upsert(self, dialect_name: str, model, **extra):
+        """冲突时在原值上累加的 upsert 语句，extra 为冲突时额外更新的列"""
+        dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+        statement = dialect_insert(model)
+        if model is FactoryStats:
+            return statement.on_conflict_do_update(
+                index_elements=["factory_id"],
+                set_={
+                    **{column: getattr(FactoryStats, column) + getattr(statement.excluded, column)
+                       for column in COUNTER_COLUMNS},
+                    "updated_at": func.now(),
+                    **extra
+                }
+            )
+        if model is FactoryStatsBucket:
+            return statement.on_conflict_do_update(
+                index_elements=["factory_id", "dimension", "value"],
+                set_={"lead_count": FactoryStatsBucket.lead_count + statement.excluded.lead_count, **extra}
+            )
+        total = LeadSource.total_leads + statement.excluded.total_leads
+        converted = LeadSource.converted_leads + statement.excluded.converted_leads
+        return statement.on_conflict_do_update(
+            index_elements=["name"],
+            set_={
+                "total_leads": total,
+                "converted_leads": converted,
+                "conversion_rate": case((total > 0, cast(converted, Float) / total), else_=0.0),
+                "updated_at": func.now(),
+                **extra
+            }
+        )
+
+    def _upserts(
+        self,
+        dialect_name: str,
+        counter_rows: List[Dict[str, Any]],
+        bucket_rows: List[Dict[str, Any]],
+        source_rows: List[Dict[str, Any]]
+    ):
+        """返回 (语句, 参数列表)，冲突时在原值上累加"""
+        for model, rows in ((FactoryStats, counter_rows), (FactoryStatsBucket, bucket_rows), (LeadSource, source_rows)):
+            if rows:
+                yield self._upsert(dialect_name, model), rows
+
+    def _apply_rows(
+        self,
+        db: Session,
+        counter_rows: List[Dict[str, Any]],
+        bucket_rows: List[Dict[str, Any]],
+        source_rows: List[Dict[str, Any]]
+    ):
+        """不支持 upsert 的数据库：先更新，不存在再插入"""
+        for row in counter_rows:
+            result = db.execute(
+                update(FactoryStats)
+                .where(FactoryStats.factory_id == row["factory_id"])
+                .values(**{column: getattr(FactoryStats, column) + row[column] for column in COUNTER_COLUMNS})
+            )
+            if result.rowcount == 0:
+                db.execute(insert(FactoryStats), [row])
+        for row in bucket_rows:
+            result = db.execute(
+                update(FactoryStatsBucket)
+                .where(
+                    FactoryStatsBucket.factory_id == row["factory_id"],
+                    FactoryStatsBucket.dimension == row["dimension"],
+                    FactoryStatsBucket.value == row["value"]
+                )
+                .values(lead_count=FactoryStatsBucket.lead_count + row["lead_count"])
+            )
+            if result.rowcount == 0:
+                db.execute(insert(FactoryStatsBucket), [row])
+        for row in source_rows:
+            total = LeadSource.total_leads + row["total_leads"]
+            converted = LeadSource.converted_leads + row["converted_leads"]
+            result = db.execute(
+                update(LeadSource)
+                .where(LeadSource.name == row["name"])
+                .values(
+                    total_leads=total,
+                    converted_leads=converted,
+                    conversion_rate=case((total > 0, cast(converted, Float) / total), else_=0.0)
+                )
+            )
+            if result.rowcount == 0:
+                db.execute(insert(LeadSource), [row])
+
+    def apply(self, db: Session, delta: FactoryStatsDelta):
+        """在调用方事务中累加增量（同步会话），由调用方提交"""
+        if not delta:
+            return
+        counter_rows, bucket_rows, source_rows = self._rows(delta)
+        dialect_name = db.get_bind().dialect.name
+        if dialect_name not in UPSERT_DIALECTS:
+            self._apply_rows(db, counter_rows, bucket_rows, source_rows)
+            return
+        for statement, rows in self._upserts(dialect_name, counter_rows, bucket_rows, source_rows):
+            db.execute(statement, rows)
+
+    async def apply_async(self, db: AsyncSession, delta: FactoryStatsDelta):
+        """在调用方事务中累加增量（异步会话），由调用方提交"""
+        if not delta:
+            return
+        counter_rows, bucket_rows, source_rows = self._rows(delta)
+        dialect_name = db.bind.dialect.name
+        if dialect_name not in UPSERT_DIALECTS:
+            await db.run_sync(self._apply_rows, counter_rows, bucket_rows, source_rows)
+            return
+        for statement, rows in self._upserts(dialect_name, counter_rows, bucket_rows, source_rows):
+            await db.execute(statement, rows)
+
+    def _counter_corrections(self, factory_id: Optional[int], reconciled_at: datetime):
+        """每个工厂的计数修正量：明细表聚合值减去统计表中的当前值"""
+        lead_filter = [] if factory_id is None else [Lead.factory_id == factory_id]
+        stats_filter = [] if factory_id is None else [FactoryStats.factory_id == factory_id]
+
+        leads = select(
+            Lead.factory_id,
+            func.count().label("total_leads"),
+            func.sum(case((Lead.qualification_status.in_(QUALIFIED_STATUSES), 1), else_=0)).label("qualified_leads"),
+            func.sum(case((Lead.qualification_status == "hot", 1), else_=0)).label("hot_leads"),
+            func.sum(case((Lead.is_converted.is_(True), 1), else_=0)).label("conversions")
+        ).where(*lead_filter).group_by(Lead.factory_id).subquery()
+        interactions = select(
+            Lead.factory_id,
+            func.count(LeadInteraction.id).label("total_interactions"),
+            func.sum(case((LeadInteraction.interaction_method == "outbound", 1), else_=0)).label("outbound_interactions"),
+            func.sum(case((LeadInteraction.response_received.is_(True), 1), else_=0)).label("responses")
+        ).join(Lead, Lead.id == LeadInteraction.lead_id).where(*lead_filter).group_by(Lead.factory_id).subquery()
+        # 已有统计但没有客户的工厂也要修正为零
+        factory_ids = union(
+            select(Lead.factory_id).where(*lead_filter),
+            select(FactoryStats.factory_id).where(*stats_filter)
+        ).subquery()
+        current = aliased(FactoryStats, name="current_stats")
+
+        actual = {column: leads.c[column] for column in COUNTER_COLUMNS[:4]}
+        actual.update({column: interactions.c[column] for column in COUNTER_COLUMNS[4:]})
+        return select(
+            factory_ids.c.factory_id,
+            *[(func.coalesce(actual[column], 0) - func.coalesce(getattr(current, column), 0)).label(column)
+              for column in COUNTER_COLUMNS],
+            literal(reconciled_at, FactoryStats.reconciled_at.type).label("reconciled_at")
+        ).select_from(
+            factory_ids
+            .outerjoin(leads, leads.c.factory_id == factory_ids.c.factory_id)
+            .outerjoin(interactions, interactions.c.factory_id == factory_ids.c.factory_id)
+            .outerjoin(current, current.factory_id == factory_ids.c.factory_id)
+        ).where(factory_ids.c.factory_id.isnot(None))
+
+    def _bucket_corrections(self, factory_id: Optional[int], dimension: str):
+        """某个分布维度每个取值的客户数修正量"""
+        lead_filter = [] if factory_id is None else [Lead.factory_id == factory_id]
+        bucket_filter = [] if factory_id is None else [FactoryStatsBucket.factory_id == factory_id]
+        column = getattr(Lead, BUCKET_DIMENSIONS[dimension])
+        value = func.substr(column, 1, 255)
+
+        leads = (
+            select(Lead.factory_id, value.label("value"), func.count().label("lead_count"))
+            .where(column.isnot(None), column != "", *lead_filter)
+            .group_by(Lead.factory_id, value)
+            .subquery()
+        )
+        keys = union(
+            select(leads.c.factory_id, leads.c.value),
+            select(FactoryStatsBucket.factory_id, FactoryStatsBucket.value)
+            .where(FactoryStatsBucket.dimension == dimension, *bucket_filter)
+        ).subquery()
+        current = aliased(FactoryStatsBucket, name="current_bucket")
+        return select(
+            keys.c.factory_id,
+            literal(dimension).label("dimension"),
+            keys.c.value,
+            (func.coalesce(leads.c.lead_count, 0) - func.coalesce(current.lead_count, 0)).label("lead_count")
+        ).select_from(
+            keys
+            .outerjoin(leads, (leads.c.factory_id == keys.c.factory_id) & (leads.c.value == keys.c.value))
+            .outerjoin(current, (current.factory_id == keys.c.factory_id)
+                       & (current.dimension == dimension) & (current.value == keys.c.value))
+        ).where(keys.c.factory_id.isnot(None))
+
+    def _source_corrections(self):
+        """每个客户来源的客户数、转化数修正量（新来源直接插入实际转化率）"""
+        leads = (
+            select(
+                Lead.lead_source.label("name"),
+                func.count().label("total_leads"),
+                func.sum(case((Lead.is_converted.is_(True), 1), else_=0)).label("converted_leads")
+            )
+            .where(Lead.lead_source.isnot(None), Lead.lead_source != "")
+            .group_by(Lead.lead_source)
+            .subquery()
+        )
+        names = union(select(leads.c.name), select(LeadSource.name)).subquery()
+        current = aliased(LeadSource, name="current_source")
+        total = func.coalesce(leads.c.total_leads, 0)
+        converted = func.coalesce(leads.c.converted_leads, 0)
+        return select(
+            names.c.name,
+            literal(DEFAULT_SOURCE_TYPE).label("source_type"),
+            (total - func.coalesce(current.total_leads, 0)).label("total_leads"),
+            (converted - func.coalesce(current.converted_leads, 0)).label("converted_leads"),
+            case((total > 0, cast(converted, Float) / total), else_=0.0).label("conversion_rate")
+        ).select_from(
+            names
+            .outerjoin(leads, leads.c.name == names.c.name)
+            .outerjoin(current, current.name == names.c.name)
+        ).where(names.c.name.isnot(None))
+
+    def reconcile(self, db: Session, factory_id: Optional[int] = None) -> int:
+        """按明细表全量重算统计并提交，返回重算的工厂数"""
+        try:
+            reconciled = self._reconcile(db, factory_id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        logger.info(f"工厂统计重算完成，共 {reconciled} 个工厂")
+        return reconciled
+
+    def _reconcile(self, db: Session, factory_id: Optional[int] = None) -> int:
+        """按明细表全量重算统计（由调用方提交），返回重算的工厂数
+
+        每张统计表用一条 INSERT ... SELECT ... ON CONFLICT 语句写入：SELECT 在同一快照下算出
+        聚合值与统计表当前值的差，冲突时在最新的行上累加这个差。重算期间其他事务提交的增量
+        不在快照中，也就不会被覆盖。不支持 upsert 的数据库先查出修正量再逐行累加，效果相同。
+        """
+        reconciled_at = datetime.now(timezone.utc)
+        statements = []
+        if factory_id is None:
+            statements.append((LeadSource, self._source_corrections(), {}))
+        statements.append((FactoryStats, self._counter_corrections(factory_id, reconciled_at),
+                           {"reconciled_at": reconciled_at}))
+        for dimension in BUCKET_DIMENSIONS:
+            statements.append((FactoryStatsBucket, self._bucket_corrections(factory_id, dimension), {}))
+
+        dialect_name = db.get_bind().dialect.name
+        for model, corrections, extra in statements:
+            if dialect_name in UPSERT_DIALECTS:
+                db.execute(
+                    self._upsert(dialect_name, model, **extra)
+                    .from_select(list(corrections.selected_columns.keys()), corrections)
+                )
+                continue
+            rows = [dict(row) for row in db.execute(corrections).mappings()]
+            self._apply_rows(
+                db,
+                rows if model is FactoryStats else [],
+                rows if model is FactoryStatsBucket else [],
+                rows if model is LeadSource else []
+            )
+            if model is FactoryStats and rows:
+                db.execute(
+                    update(FactoryStats)
+                    .where(FactoryStats.factory_id.in_([row["factory_id"] for row in rows]))
+                    .values(reconciled_at=reconciled_at)
+                )
+        return db.execute(
+            select(func.count()).select_from(FactoryStats).where(FactoryStats.reconciled_at == reconciled_at)
+        ).scalar()
+
+    async def run_reconciliation(self, interval_s: float):
+        """后台定期重算，在应用启动时创建任务"""
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await asyncio.to_thread(self._reconcile_all)
+            except Exception as e:
+                logger.error(f"工厂统计重算失败: {e}")
+
+    def _reconcile_all(self):
+        # SQLite 上交给写线程执行，不与请求的写入争用写锁
+        reconciled = sqlite_writer.write(self._reconcile)
+        logger.info(f"工厂统计重算完成，共 {reconciled} 个工厂")
+
+    async def _top_values(self, db: AsyncSession, dimension: str, factory_id: Optional[int]) -> List[str]:
+        if factory_id is not None:
+            query = (
+                select(FactoryStatsBucket.value)
+                .where(
+                    FactoryStatsBucket.factory_id == factory_id,
+                    FactoryStatsBucket.dimension == dimension,
+                    FactoryStatsBucket.lead_count > 0
+                )
+                .order_by(FactoryStatsBucket.lead_count.desc())
+            )
+        else:
+            total = func.sum(FactoryStatsBucket.lead_count)
+            query = (
+                select(FactoryStatsBucket.value)
+                .where(FactoryStatsBucket.dimension == dimension)
+                .group_by(FactoryStatsBucket.value)
+                .having(total > 0)
+                .order_by(total.desc())
+            )
+        return list((await db.execute(query.limit(self.top_n))).scalars())
+
+    async def get_stats(self, db: AsyncSession, factory_id: Optional[int] = None) -> Dict[str, Any]:
+        """读取统计；不指定工厂时汇总所有工厂"""
+        if factory_id is not None:
+            row = (await db.execute(
+                select(*[getattr(FactoryStats, column) for column in COUNTER_COLUMNS])
+                .where(FactoryStats.factory_id == factory_id)
+            )).first()
+            counters = dict(zip(COUNTER_COLUMNS, row or [0] * len(COUNTER_COLUMNS)))
+        else:
+            row = (await db.execute(
+                select(*[func.coalesce(func.sum(getattr(FactoryStats, column)), 0) for column in COUNTER_COLUMNS])
+            )).first()
+            counters = dict(zip(COUNTER_COLUMNS, row))
+
+        total_leads = counters["total_leads"]
+        return {
+            **counters,
+            "conversion_rate": round(counters["conversions"] / total_leads, 4) if total_leads else 0.0,
+            "response_rate": (
+                round(counters["responses"] / counters["outbound_interactions"], 4)
+                if counters["outbound_interactions"] else 0.0
+            ),
+            "top_industries": await self._top_values(db, "industry", factory_id),
+            "top_markets": await self._top_values(db, "market", factory_id)
+        }
+
+    async def get_source_stats(self, db: AsyncSession, name: str) -> Optional[Dict[str, Any]]:
+        """读取单个客户来源的效果统计（一行）"""
+        source = (await db.execute(select(LeadSource).where(LeadSource.name == name))).scalar_one_or_none()
+        return source.to_dict() if source is not None else None
+
+    async def list_source_stats(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        """所有客户来源的效果统计，按客户数降序"""
+        sources = (await db.execute(
+            select(LeadSource).order_by(LeadSource.total_leads.desc(), LeadSource.id)
+        )).scalars()
+        return [source.to_dict() for source in sources]
+
+    async def get_summary(self, db: AsyncSession, factory_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """分析摘要；指定的工厂不存在时返回 None"""
+        query = select(func.count()).select_from(Factory)
+        if factory_id is not None:
+            query = query.where(Factory.id == factory_id)
+        total_factories = (await db.execute(query)).scalar()
+        if factory_id is not None and not total_factories:
+            return None
+        stats = await self.get_stats(db, factory_id)
+        return {"total_factories": total_factories, **stats}
+
+
+factory_stats_service = FactoryStatsService(top_n=settings.ANALYTICS_TOP_N)
+
+
+
+def _changed_fields(lead: Lead) -> Dict[str, Any]:
+    """本次修改的统计字段及新值，只读取属性历史，不触发加载"""
+    state = inspect(lead)
+    return {
+        field: state.attrs[field].history.added[0]
+        for field in TRACKED_LEAD_FIELDS
+        if state.attrs[field].history.added
+    }
+
+
+@event.listens_for(Session, "before_flush")
+def _track_orm_lead_changes(session: Session, flush_context, instances):
+    """ORM 方式新增、修改、删除的潜在客户在同一事务中计入统计
+
+    修改和删除时从数据库读取旧值（已过期的对象上属性历史不含旧值），按"移除旧值、加入新值"累加。
+    批量写入路径（lead_persistence、评分重算）不经过 ORM 工作单元，自行累加增量。
+    """
+    delta = FactoryStatsDelta()
+    for lead in session.new:
+        if isinstance(lead, Lead):
+            delta.add_lead({field: lead.__dict__.get(field) for field in TRACKED_LEAD_FIELDS})
+
+    changed: Dict[int, Dict[str, Any]] = {}
+    for lead in session.dirty:
+        if isinstance(lead, Lead):
+            fields = _changed_fields(lead)
+            if fields:
+                changed[inspect(lead).identity[0]] = fields
+    deleted = [inspect(lead).identity[0] for lead in session.deleted if isinstance(lead, Lead)]
+    if changed or deleted:
+        rows = session.execute(
+            select(Lead.id, *(getattr(Lead, field) for field in TRACKED_LEAD_FIELDS))
+            .where(Lead.id.in_([*changed, *deleted]))
+        ).all()
+        for row in rows:
+            old = dict(row._mapping)
+            delta.add_lead(old, sign=-1)
+            if row.id in changed:
+                delta.add_lead({**old, **changed[row.id]})
+
+    if delta:
+        factory_stats_service.apply(session, delta)
@@ -0,0 +1,433 @@
+import asyncio
+import math
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Set, Tuple
+import logging
+
+from sqlalchemy import select, update, insert, and_, or_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.sqlite_writer import sqlite_writer
+from app.models.lead import Lead, FollowUpTask
+from app.services.interaction_log import interaction_log
+
+logger = logging.getLogger(__name__)
+
+# 认领后交给执行方的任务字段
+TASK_COLUMNS = ("id", "lead_id", "factory_id", "source", "step_number", "method", "content", "goal", "attempts")
+
+# 执行方返回的状态 -> 任务最终状态；其余状态按失败重试
+DISPATCH_OUTCOMES = {"sent": "done", "blocked": "cancelled", "not_found": "cancelled"}
+
+# "3天后"、"3-5天后"：取范围的起始天数
+_DAYS_PATTERN = re.compile(r"(\d+)(?:\s*[-~～至到]\s*\d+)?\s*天")
+
+FollowUpDispatcher = Callable[[List[Dict[str, Any]]], Awaitable[Dict[int, Dict[str, Any]]]]
+
+
+def _utc_timestamp(value: datetime) -> float:
+    # SQLite 读回的时间不带时区，写入时统一为UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def sequence_tasks(
+    factory_id: int,
+    lead_id: int,
+    sequence: List[Dict[str, Any]],
+    start: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """把跟进序列（content_creator / template_renderer 生成）转换为跟进任务
+
+    步骤的 timing 形如 "3天后" 或 "3-5天后"，表示距首次联系的天数，取第一个数字；
+    无法解析时按 (步骤序号 * FOLLOW_UP_INTERVAL_DAYS) 计算。
+    """
+    start = start or datetime.now(timezone.utc)
+    tasks = []
+    for index, step in enumerate(sequence):
+        match = _DAYS_PATTERN.search(str(step.get("timing") or ""))
+        days = int(match.group(1)) if match else (index + 1) * settings.FOLLOW_UP_INTERVAL_DAYS
+        tasks.append({
+            "lead_id": lead_id,
+            "factory_id": factory_id,
+            "source": "sequence",
+            "step_number": step.get("step_number", index + 1),
+            "method": step.get("method") or "email",
+            "content": step.get("content"),
+            "goal": step.get("goal"),
+            "due_at": start + timedelta(days=days),
+            "status": "pending",
+            "attempts": 0,
+        })
+    return tasks
+
+
+class TimingWheel:
+    """单层时间轮
+
+    覆盖从当前刻度起 slots 个刻度的近期范围，每个槽位保存到期时间落在该刻度内的任务ID。
+    添加和取出到期任务都是 O(1)，调度循环每个刻度只需取出当前槽位，不需要查询数据库。
+    """
+
+    def __init__(self, tick_s: float, slots: int):
+        self.tick_s = tick_s
+        self.slots: List[Set[int]] = [set() for _ in range(slots)]
+        self.current_tick = int(time.time() // tick_s)
+        self.task_ticks: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.task_ticks)
+
+    def add(self, task_id: int, due_ts: float) -> bool:
+        """加入任务，超出覆盖范围时返回False（由之后的装载处理）；已过期的任务放入当前刻度"""
+        tick = max(int(due_ts // self.tick_s), self.current_tick)
+        if tick - self.current_tick >= len(self.slots):
+            return False
+
+        previous = self.task_ticks.get(task_id)
+        if previous is not None:
+            self.slots[previous % len(self.slots)].discard(task_id)
+        self.slots[tick % len(self.slots)].add(task_id)
+        self.task_ticks[task_id] = tick
+        return True
+
+    def advance(self, now_ts: float) -> List[int]:
+        """推进到 now_ts，返回经过的刻度中到期的任务ID"""
+        target = int(now_ts // self.tick_s)
+        # 落后超过一圈时每个槽位只需处理一次
+        ticks = range(self.current_tick, target + 1)
+        if len(ticks) > len(self.slots):
+            ticks = range(target - len(self.slots) + 1, target + 1)
+
+        due = []
+        for tick in ticks:
+            slot = self.slots[tick % len(self.slots)]
+            if slot:
+                due.extend(slot)
+                for task_id in slot:
+                    del self.task_ticks[task_id]
+                slot.clear()
+        self.current_tick = max(self.current_tick, target + 1)
+        return due
+
+
+class FollowUpScheduler:
+    """跟进任务调度器
+
+    - 全部任务保存在 follow_up_tasks 表，只通过 (status, due_at) 索引做范围扫描，
+      每次只装载近期（FOLLOW_UP_HORIZON_S 内）到期的有限条任务到内存时间轮，不扫描全表。
+    - 时间轮按刻度取出到期任务ID，再按ID批量认领：认领是一条带条件的 UPDATE，写入批次标识和
+      租约过期时间，只有未被认领或租约已过期的任务会被认领（PostgreSQL 上使用 SKIP LOCKED），
+      多个进程同时运行时同一任务只会被一个进程执行。
+    - 执行结果只在仍持有租约时写回；进程异常退出后任务在租约过期后由下一次装载重新认领。
+    """
+
+    def __init__(
+        self,
+        tick_s: float = 1.0,
+        horizon_s: float = 300.0,
+        max_wheel_tasks: int = 10000,
+        batch_size: int = 100,
+        lease_s: float = 300.0,
+        max_attempts: int = 3,
+        retry_backoff_s: float = 600.0
+    ):
+        self.horizon_s = horizon_s
+        self.max_wheel_tasks = max_wheel_tasks
+        self.batch_size = batch_size
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.retry_backoff_s = retry_backoff_s
+        self.wheel = TimingWheel(tick_s, max(1, math.ceil(horizon_s / tick_s)))
+        self.next_load_ts = 0.0
+
+        # 指标
+        self.scheduled = 0
+        self.loaded = 0
+        self.claimed = 0
+        self.claim_misses = 0  # 已被其他进程认领或已完成
+        self.completed = 0
+        self.cancelled = 0
+        self.retried = 0
+        self.failed = 0
+        self.lost_leases = 0
+
+    @staticmethod
+    def _claimable(now: datetime):
+        return and_(
+            FollowUpTask.status == "pending",
+            FollowUpTask.due_at <= now,
+            or_(FollowUpTask.lease_expires_at.is_(None), FollowUpTask.lease_expires_at <= now)
+        )
+
+    async def schedule(self, db: AsyncSession, tasks: List[Dict[str, Any]], commit: bool = True) -> int:
+        """写入跟进任务，近期到期的同时加入时间轮"""
+        if not tasks:
+            return 0
+
+        rows = (await db.execute(
+            insert(FollowUpTask).returning(FollowUpTask.id, FollowUpTask.due_at, sort_by_parameter_order=True),
+            tasks
+        )).all()
+        if commit:
+            await db.commit()
+
+        for row in rows:
+            self.wheel.add(row.id, _utc_timestamp(row.due_at))
+        self.scheduled += len(rows)
+        return len(rows)
+
+    async def schedule_sequences(self, db: AsyncSession, sequences: Dict[int, Dict[str, Any]]) -> int:
+        """为多个客户安排跟进序列（lead_id -> {"factory_id", "sequence"}），替换尚未执行的旧序列"""
+        if not sequences:
+            return 0
+
+        await db.execute(
+            update(FollowUpTask)
+            .where(
+                FollowUpTask.lead_id.in_(list(sequences)),
+                FollowUpTask.source == "sequence",
+                FollowUpTask.status == "pending"
+            )
+            .values(status="cancelled", completed_at=func.now())
+        )
+        tasks = []
+        for lead_id, item in sequences.items():
+            tasks.extend(sequence_tasks(item["factory_id"], lead_id, item["sequence"]))
+        scheduled = await self.schedule(db, tasks, commit=False)
+
+        # 客户的下次跟进时间为最早的待执行步骤
+        next_due: Dict[int, datetime] = {}
+        for task in tasks:
+            if task["lead_id"] not in next_due or task["due_at"] < next_due[task["lead_id"]]:
+                next_due[task["lead_id"]] = task["due_at"]
+        if next_due:
+            await db.execute(update(Lead), [
+                {"id": lead_id, "next_follow_up_date": due_at} for lead_id, due_at in next_due.items()
+            ])
+        await db.commit()
+        return scheduled
+
+    async def _load(self, db: AsyncSession, now_ts: float):
+        """从数据库装载覆盖范围内到期的待执行任务（包括已过期和租约过期的任务）"""
+        horizon_end = datetime.fromtimestamp(now_ts + self.horizon_s, timezone.utc)
+        rows = (await db.execute(
+            select(FollowUpTask.id, FollowUpTask.due_at)
+            .where(FollowUpTask.status == "pending", FollowUpTask.due_at < horizon_end)
+            .order_by(FollowUpTask.due_at)
+            .limit(self.max_wheel_tasks)
+        )).all()
+
+        for row in rows:
+            self.wheel.add(row.id, _utc_timestamp(row.due_at))
+        self.loaded += len(rows)
+
+        # 装载满额说明覆盖范围内还有更多任务，在已装载的最后一个任务到期时再次装载
+        self.next_load_ts = now_ts + self.horizon_s / 2
+        if len(rows) >= self.max_wheel_tasks:
+            self.next_load_ts = min(self.next_load_ts, _utc_timestamp(rows[-1].due_at))
+
+    async def _write(self, db: AsyncSession, job: Callable[[Session], Any]):
+        """执行一次写操作：SQLite 写队列开启时交给写线程与其他写入合并提交，否则在 db 上执行并提交"""
+        if sqlite_writer.enabled:
+            return await sqlite_writer.write_async(job)
+        result = await db.run_sync(job)
+        await db.commit()
+        return result
+
+    def _claim_tasks(self, db: Session, task_ids: List[int], now: datetime, lease_owner: str) -> List[Dict[str, Any]]:
+        """认领任务（由调用方提交），返回认领到的任务"""
+        claimable = self._claimable(now)
+        candidates = (
+            select(FollowUpTask.id)
+            .where(FollowUpTask.id.in_(task_ids), claimable)
+            .with_for_update(skip_locked=True)
+        )
+        rows = db.execute(
+            update(FollowUpTask)
+            .where(FollowUpTask.id.in_(candidates.scalar_subquery()), claimable)
+            .values(
+                lease_owner=lease_owner,
+                lease_expires_at=now + timedelta(seconds=self.lease_s),
+                attempts=FollowUpTask.attempts + 1
+            )
+            .returning(*(getattr(FollowUpTask, name) for name in TASK_COLUMNS))
+            .execution_options(synchronize_session=False)
+        ).all()
+        return [dict(row._mapping) for row in rows]
+
+    async def _claim(self, db: AsyncSession, task_ids: List[int], now: datetime):
+        """认领任务，返回 (批次标识, 认领到的任务)"""
+        lease_owner = uuid.uuid4().hex
+        tasks = await self._write(db, lambda session: self._claim_tasks(session, task_ids, now, lease_owner))
+
+        self.claimed += len(tasks)
+        self.claim_misses += len(task_ids) - len(tasks)
+        return lease_owner, tasks
+
+    def _complete_tasks(
+        self,
+        db: Session,
+        lease_owner: str,
+        tasks: List[Dict[str, Any]],
+        results: Dict[int, Dict[str, Any]],
+        now: datetime
+    ) -> Tuple[Dict[str, int], Dict[int, datetime]]:
+        """写回执行结果（由调用方提交）
+
+        返回 (各结果的任务数, 重试任务ID -> 新的到期时间)，held 为仍持有租约的任务数。
+        """
+        held = set(db.execute(
+            select(FollowUpTask.id)
+            .where(FollowUpTask.id.in_([task["id"] for task in tasks]), FollowUpTask.lease_owner == lease_owner)
+            .with_for_update()
+        ).scalars())
+
+        outcomes = dict.fromkeys(("held", "completed", "cancelled", "failed", "retried"), 0)
+        outcomes["held"] = len(held)
+        updates, sent = [], []
+        retried: Dict[int, datetime] = {}
+        for task in (task for task in tasks if task["id"] in held):
+            result = results.get(task["id"]) or {"status": "error", "error": "执行方未返回结果"}
+            values = {"id": task["id"], "lease_owner": None, "lease_expires_at": None}
+            outcome = DISPATCH_OUTCOMES.get(result.get("status"))
+            if outcome is not None:
+                values.update(status=outcome, completed_at=now, last_error=None)
+                if outcome == "done":
+                    sent.append(task)
+                    outcomes["completed"] += 1
+                else:
+                    outcomes["cancelled"] += 1
+            elif task["attempts"] >= self.max_attempts:
+                values.update(status="failed", completed_at=now, last_error=str(result.get("error")))
+                outcomes["failed"] += 1
+            else:
+                retried[task["id"]] = now + timedelta(seconds=self.retry_backoff_s * task["attempts"])
+                values.update(due_at=retried[task["id"]], last_error=str(result.get("error")))
+                outcomes["retried"] += 1
+            updates.append(values)
+
+        if updates:
+            db.execute(
+                update(FollowUpTask).where(FollowUpTask.lease_owner == lease_owner),
+                updates,
+                execution_options={"synchronize_session": None}
+            )
+
+        if sent:
+            lead_ids = list({task["lead_id"] for task in sent})
+            next_due = dict(db.execute(
+                select(FollowUpTask.lead_id, func.min(FollowUpTask.due_at))
+                .where(FollowUpTask.lead_id.in_(lead_ids), FollowUpTask.status == "pending")
+                .group_by(FollowUpTask.lead_id)
+            ).all())
+            interaction_log.record_many(db, [
+                {
+                    "lead_id": task["lead_id"],
+                    "interaction_type": task["method"],
+                    "interaction_method": "outbound",
+                    "subject": task["goal"],
+                    "content": task["content"],
+                    "follow_up_required": task["lead_id"] in next_due,
+                    "follow_up_date": next_due.get(task["lead_id"]),
+                }
+                for task in sent
+            ], commit=False)
+            finished = [lead_id for lead_id in lead_ids if lead_id not in next_due]
+            if finished:
+                db.execute(update(Lead), [
+                    {"id": lead_id, "next_follow_up_date": None} for lead_id in finished
+                ])
+        return outcomes, retried
+
+    async def _complete(
+        self,
+        db: AsyncSession,
+        lease_owner: str,
+        tasks: List[Dict[str, Any]],
+        results: Dict[int, Dict[str, Any]]
+    ):
+        """写回执行结果（只更新仍由本批次持有租约的任务），并为已发送的步骤追加互动记录
+
+        需要重试的任务按新的到期时间重新加入时间轮，与 schedule 相同；超出覆盖范围的由之后的装载处理。
+        """
+        now = datetime.now(timezone.utc)
+        outcomes, retried = await self._write(
+            db, lambda session: self._complete_tasks(session, lease_owner, tasks, results, now)
+        )
+        for task_id, due_at in retried.items():
+            self.wheel.add(task_id, _utc_timestamp(due_at))
+        if outcomes["held"] < len(tasks):
+            # 租约已过期并被其他进程认领，以对方的结果为准
+            self.lost_leases += len(tasks) - outcomes["held"]
+            logger.warning(f"{len(tasks) - outcomes['held']} 个跟进任务的租约在执行期间过期")
+        self.completed += outcomes["completed"]
+        self.cancelled += outcomes["cancelled"]
+        self.failed += outcomes["failed"]
+        self.retried += outcomes["retried"]
+
+    async def run_once(self, dispatcher: FollowUpDispatcher, now_ts: Optional[float] = None) -> int:
+        """推进一个刻度：必要时装载近期任务，认领并执行到期任务，返回执行的任务数"""
+        now_ts = time.time() if now_ts is None else now_ts
+        if now_ts >= self.next_load_ts:
+            async with AsyncSessionLocal() as db:
+                await self._load(db, now_ts)
+
+        due = self.wheel.advance(now_ts)
+        now = datetime.fromtimestamp(now_ts, timezone.utc)
+        executed = 0
+        for start in range(0, len(due), self.batch_size):
+            async with AsyncSessionLocal() as db:
+                lease_owner, tasks = await self._claim(db, due[start:start + self.batch_size], now)
+                if not tasks:
+                    continue
+                try:
+                    results = await dispatcher(tasks)
+                except Exception as e:
+                    logger.error(f"执行跟进任务失败: {e}")
+                    results = {task["id"]: {"status": "error", "error": str(e)} for task in tasks}
+                await self._complete(db, lease_owner, tasks, results)
+                executed += len(tasks)
+        return executed
+
+    async def run(self, dispatcher: FollowUpDispatcher):
+        """后台调度循环，在应用启动时创建任务"""
+        logger.info(f"跟进调度器启动，时间轮覆盖 {self.horizon_s:.0f} 秒")
+        while True:
+            try:
+                await self.run_once(dispatcher)
+            except Exception as e:
+                logger.error(f"跟进调度失败: {e}")
+            await asyncio.sleep(self.wheel.tick_s)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "wheel_tasks": len(self.wheel),
+            "scheduled": self.scheduled,
+            "loaded": self.loaded,
+            "claimed": self.claimed,
+            "claim_misses": self.claim_misses,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "retried": self.retried,
+            "failed": self.failed,
+            "lost_leases": self.lost_leases
+        }
+
+
+follow_up_scheduler = FollowUpScheduler(
+    tick_s=settings.FOLLOW_UP_TICK_S,
+    horizon_s=settings.FOLLOW_UP_HORIZON_S,
+    max_wheel_tasks=settings.FOLLOW_UP_WHEEL_MAX_TASKS,
+    batch_size=settings.FOLLOW_UP_BATCH_SIZE,
+    lease_s=settings.FOLLOW_UP_LEASE_S,
+    max_attempts=settings.FOLLOW_UP_MAX_ATTEMPTS,
+    retry_backoff_s=settings.FOLLOW_UP_RETRY_BACKOFF_S
+)
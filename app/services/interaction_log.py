@@ -0,0 +1,238 @@
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+from sqlalchemy import select, update, func, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.database import engine
+from app.core.serialization import ModelSerializer
+from app.core.sqlite_writer import sqlite_writer
+from app.models.lead import Lead, LeadInteraction, FollowUpTask
+from app.services.lead_persistence import INTERACTION_COLUMNS, lead_persistence
+from app.services.factory_stats import FactoryStatsDelta, factory_stats_service
+
+logger = logging.getLogger(__name__)
+
+interaction_serializer = ModelSerializer(LeadInteraction, exclude=("search_text",))
+
+
+class LeadNotFoundError(LookupError):
+    """潜在客户不存在"""
+
+
+def _interaction_row(lead_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
+    row = {column: data.get(column) for column in INTERACTION_COLUMNS}
+    row["lead_id"] = lead_id
+    # 兼容接口中使用的简写字段
+    row["interaction_type"] = row["interaction_type"] or data.get("type") or "email"
+    row["interaction_method"] = row["interaction_method"] or data.get("method") or "outbound"
+    row["response_received"] = bool(row["response_received"])
+    row["follow_up_required"] = bool(row["follow_up_required"])
+    if isinstance(row["follow_up_date"], str):
+        row["follow_up_date"] = datetime.fromisoformat(row["follow_up_date"])
+    return row
+
+
+def _summary_values(row: Dict[str, Any], count: int = 1, responses: Optional[int] = None) -> Dict[str, Any]:
+    """潜在客户摘要的增量更新：只做计数累加和最近值覆盖，不读取旧数据"""
+    if responses is None:
+        responses = 1 if row["response_received"] else 0
+    values = {
+        "interaction_count": func.coalesce(Lead.interaction_count, 0) + count,
+        "response_count": func.coalesce(Lead.response_count, 0) + responses,
+        "last_interaction_at": func.now(),
+        "last_interaction_type": row["interaction_type"],
+        "last_response_sentiment": func.coalesce(row["response_sentiment"], Lead.last_response_sentiment),
+    }
+    if row["interaction_method"] == "outbound":
+        values["last_contact_date"] = func.now()
+    if row["follow_up_date"] is not None:
+        values["next_follow_up_date"] = row["follow_up_date"]
+    return values
+
+
+class InteractionLog:
+    """客户互动记录的只追加写入路径
+
+    每次互动插入一行 lead_interactions，同时用一条 UPDATE 累加 Lead 上的摘要字段，
+    不再重写整段沟通历史。明细按 (lead_id, created_at, id) 索引倒序读取。
+    """
+
+    async def record(self, db: AsyncSession, lead_id: int, data: Dict[str, Any]) -> LeadInteraction:
+        """记录一次互动；SQLite 写队列开启时交给写线程与其他请求的写入合并提交"""
+        if sqlite_writer.enabled:
+            return await sqlite_writer.write_async(lambda session: self._record(session, lead_id, data))
+
+        try:
+            interaction = await db.run_sync(self._record, lead_id, data)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        return interaction
+
+    def _record(self, db: Session, lead_id: int, data: Dict[str, Any]) -> LeadInteraction:
+        """在调用方事务中写入互动记录，由调用方提交"""
+        row = _interaction_row(lead_id, data)
+
+        factory_id = db.execute(
+            update(Lead).where(Lead.id == lead_id).values(**_summary_values(row)).returning(Lead.factory_id)
+        ).scalar()
+        if factory_id is None:
+            raise LeadNotFoundError(f"潜在客户 {lead_id} 不存在")
+
+        stats = FactoryStatsDelta()
+        stats.add_interaction(factory_id, row)
+        factory_stats_service.apply(db, stats)
+
+        interaction = LeadInteraction(**row)
+        db.add(interaction)
+        if row["follow_up_date"] is not None:
+            # 互动中约定的跟进，由跟进调度器到期执行
+            db.add(FollowUpTask(
+                lead_id=lead_id,
+                factory_id=factory_id,
+                source="interaction",
+                method=row["interaction_type"],
+                content=row["follow_up_notes"],
+                due_at=row["follow_up_date"]
+            ))
+        db.flush()
+        return interaction
+
+    def record_many(self, db: Session, interactions: List[Dict[str, Any]], commit: bool = True) -> int:
+        """批量追加互动记录（同步会话，供批量任务使用），摘要按客户聚合后一次更新
+
+        follow_up_date 只更新客户摘要，不安排跟进任务（跟进调度器用此方法记录已执行的步骤）。
+        """
+        rows = [_interaction_row(data["lead_id"], data) for data in interactions]
+        if not rows:
+            return 0
+
+        try:
+            lead_persistence.write_interactions(db, rows, commit=False)
+
+            stats = FactoryStatsDelta()
+            by_lead: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+            for row in rows:
+                by_lead[row["lead_id"]].append(row)
+
+            for lead_id, lead_rows in by_lead.items():
+                latest = dict(lead_rows[-1])
+                latest["response_sentiment"] = next(
+                    (r["response_sentiment"] for r in reversed(lead_rows) if r["response_sentiment"]), None
+                )
+                latest["interaction_method"] = (
+                    "outbound" if any(r["interaction_method"] == "outbound" for r in lead_rows) else "inbound"
+                )
+                latest["follow_up_date"] = next(
+                    (r["follow_up_date"] for r in reversed(lead_rows) if r["follow_up_date"] is not None), None
+                )
+                factory_id = db.execute(
+                    update(Lead).where(Lead.id == lead_id).values(**_summary_values(
+                        latest,
+                        count=len(lead_rows),
+                        responses=sum(1 for r in lead_rows if r["response_received"])
+                    )).returning(Lead.factory_id)
+                ).scalar()
+                if factory_id is not None:
+                    for row in lead_rows:
+                        stats.add_interaction(factory_id, row)
+            factory_stats_service.apply(db, stats)
+            if commit:
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        return len(rows)
+
+    async def list_interactions(
+        self,
+        db: AsyncSession,
+        lead_id: int,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """按时间倒序读取客户的互动记录，before_id 为上一页最后一条记录的ID"""
+        query = (
+            select(*interaction_serializer.select_columns(fields))
+            .where(LeadInteraction.lead_id == lead_id)
+        )
+        if before_id is not None:
+            query = query.where(LeadInteraction.id < before_id)
+        query = query.order_by(LeadInteraction.created_at.desc(), LeadInteraction.id.desc()).limit(limit)
+        return interaction_serializer.rows_to_dicts((await db.execute(query)).all())
+
+    def _migrate_history_chunk(self, db: Session, chunk_size: int) -> Tuple[int, int]:
+        """迁移一块旧沟通历史（由调用方提交），返回 (处理的客户数, 迁移的互动记录数)"""
+        rows = db.execute(text(
+            "SELECT id, communication_history FROM leads "
+            "WHERE communication_history IS NOT NULL LIMIT :limit"
+        ), {"limit": chunk_size}).all()
+        if not rows:
+            return 0, 0
+
+        interactions = []
+        for lead_id, history in rows:
+            if isinstance(history, str):
+                history = json.loads(history)
+            for entry in history or []:
+                if not isinstance(entry, dict):
+                    entry = {"content": str(entry)}
+                interactions.append({
+                    **entry,
+                    "lead_id": lead_id,
+                    "interaction_type": entry.get("interaction_type") or entry.get("type"),
+                    "interaction_method": entry.get("interaction_method") or entry.get("method"),
+                    "follow_up_date": None,
+                })
+
+        self.record_many(db, interactions, commit=False)
+        db.execute(
+            text("UPDATE leads SET communication_history = NULL WHERE id = :lead_id"),
+            [{"lead_id": lead_id} for lead_id, _ in rows]
+        )
+        return len(rows), len(interactions)
+
+    def migrate_communication_history(self, chunk_size: int = 1000) -> int:
+        """把旧的 leads.communication_history JSON 列迁移为互动记录
+
+        应用启动时在表结构升级（schema_upgrade）之后执行，也可以单独运行
+        python -m app.services.interaction_log（同样先升级表结构）；
+        列不存在或已迁移完时立即返回。每块单独提交，中断后重新运行会继续迁移剩余的记录。
+        """
+        columns = {column["name"] for column in inspect(engine).get_columns("leads")}
+        if "communication_history" not in columns:
+            return 0
+
+        migrated = 0
+        while True:
+            leads, interactions = sqlite_writer.write(lambda db: self._migrate_history_chunk(db, chunk_size))
+            if not leads:
+                break
+            migrated += interactions
+
+        logger.info(f"已迁移 {migrated} 条沟通历史到互动记录")
+        return migrated
+
+
+interaction_log = InteractionLog()
+
+
+def main():
+    from app.services.schema_upgrade import schema_upgrade
+
+    # 迁移前先把旧版本的表结构升级到当前结构
+    schema_upgrade.upgrade()
+    migrated = interaction_log.migrate_communication_history()
+    print(f"✅ 已迁移 {migrated} 条沟通历史到互动记录")
+
+
+if __name__ == "__main__":
+    main()
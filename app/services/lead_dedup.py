@@ -0,0 +1,339 @@
+import re
+import threading
+import unicodedata
+import zlib
+import numpy as np
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Set, Tuple
+from urllib.parse import urlparse
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.lead import Lead
+
+logger = logging.getLogger(__name__)
+
+# 公司名称末尾的法律形式后缀，归一化时去掉（中文后缀没有分隔符，按字符串结尾匹配）
+CJK_COMPANY_SUFFIXES = ["股份有限公司", "有限责任公司", "有限公司", "集团", "公司"]
+COMPANY_SUFFIXES = {
+    "incorporated", "inc", "corporation", "corp", "company", "co", "limited", "ltd",
+    "llc", "llp", "plc", "gmbh", "ag", "sa", "srl", "bv", "pty", "kk",
+}
+
+# 公共邮箱域名不能代表公司
+FREE_EMAIL_DOMAINS = {
+    "gmail.com", "outlook.com", "hotmail.com", "yahoo.com", "icloud.com",
+    "qq.com", "163.com", "126.com", "sina.com", "foxmail.com",
+}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[一-鿿]+")
+_MERSENNE_PRIME = (1 << 31) - 1
+MAX_BUCKET_SIZE = 64
+
+
+def normalize_company_name(name: Optional[str]) -> str:
+    """归一化公司名称：全半角统一、小写、去标点和法律形式后缀"""
+    if not name:
+        return ""
+    tokens = _TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", name).lower())
+
+    while len(tokens) > 1 and tokens[-1] in COMPANY_SUFFIXES:
+        tokens.pop()
+    if tokens:
+        for suffix in CJK_COMPANY_SUFFIXES:
+            if tokens[-1].endswith(suffix) and len(tokens[-1]) > len(suffix):
+                tokens[-1] = tokens[-1][:-len(suffix)]
+                break
+
+    return " ".join(tokens)
+
+
+def extract_domain(website: Optional[str] = None, email: Optional[str] = None) -> str:
+    """从网站地址或企业邮箱中提取域名"""
+    if website:
+        netloc = urlparse(website if "://" in website else f"//{website}").netloc.lower()
+        netloc = netloc.split("@")[-1].split(":")[0]
+        if netloc.startswith("www."):
+            netloc = netloc[4:]
+        if netloc:
+            return netloc
+    if email and "@" in email:
+        domain = email.rsplit("@", 1)[1].strip().lower()
+        if domain not in FREE_EMAIL_DOMAINS:
+            return domain
+    return ""
+
+
+def company_shingles(normalized_name: str) -> Set[str]:
+    """字符三元组"""
+    padded = f" {normalized_name} "
+    if len(padded) < 3:
+        return {padded}
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MinHasher:
+    """MinHash签名 + LSH分段，用于快速找出名称相近的候选公司"""
+
+    def __init__(self, num_perm: int, bands: int, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+
+    def signature(self, shingles: Set[str]) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) % _MERSENNE_PRIME for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+
+class _IndexEntry:
+    __slots__ = ("lead", "lead_id", "key", "domain", "shingles")
+
+    def __init__(self, lead: Optional[Dict[str, Any]], lead_id: Optional[int], key: str, domain: str,
+                 shingles: Set[str]):
+        self.lead = lead
+        self.lead_id = lead_id
+        self.key = key
+        self.domain = domain
+        self.shingles = shingles
+
+
+class FactoryLeadIndex:
+    """单个工厂的潜在客户实体识别索引
+
+    依次按 归一化名称精确匹配 -> 域名匹配 -> MinHash/LSH候选 + 三元组Jaccard相似度 判断重复。
+    """
+
+    def __init__(self, hasher: MinHasher, similarity: float):
+        self.hasher = hasher
+        self.similarity = similarity
+        self.by_key: Dict[str, _IndexEntry] = {}
+        self.by_domain: Dict[str, _IndexEntry] = {}
+        self.buckets: Dict[Tuple[int, bytes], List[_IndexEntry]] = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.by_key)
+
+    def find(self, key: str, domain: str, shingles: Set[str], band_keys: List[Tuple[int, bytes]]) -> Optional[_IndexEntry]:
+        entry = self.by_key.get(key)
+        if entry is None and domain:
+            entry = self.by_domain.get(domain)
+        if entry is not None:
+            return entry
+
+        candidates: Dict[int, _IndexEntry] = {}
+        for band_key in band_keys:
+            for candidate in self.buckets.get(band_key, ()):
+                candidates[id(candidate)] = candidate
+
+        best, best_similarity = None, self.similarity
+        for candidate in candidates.values():
+            if candidate.domain and domain and candidate.domain != domain:
+                # 两边都有域名且不同，视为不同公司
+                continue
+            similarity = len(shingles & candidate.shingles) / len(shingles | candidate.shingles)
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def add(self, entry: _IndexEntry, band_keys: Optional[List[Tuple[int, bytes]]] = None):
+        self.by_key.setdefault(entry.key, entry)
+        if entry.domain:
+            self.by_domain.setdefault(entry.domain, entry)
+        if band_keys is None:
+            band_keys = self.hasher.band_keys(self.hasher.signature(entry.shingles))
+        for band_key in band_keys:
+            bucket = self.buckets[band_key]
+            # 通用词组成的名称会让分段桶过大，超过上限后不再加入，只依赖精确匹配
+            if len(bucket) < MAX_BUCKET_SIZE:
+                bucket.append(entry)
+
+    def remove(self, entry: _IndexEntry):
+        if self.by_key.get(entry.key) is entry:
+            del self.by_key[entry.key]
+        if entry.domain and self.by_domain.get(entry.domain) is entry:
+            del self.by_domain[entry.domain]
+        for band_key in self.hasher.band_keys(self.hasher.signature(entry.shingles)):
+            bucket = self.buckets.get(band_key)
+            if bucket and entry in bucket:
+                bucket.remove(entry)
+                if not bucket:
+                    del self.buckets[band_key]
+
+
+def merge_leads(existing: Dict[str, Any], duplicate: Dict[str, Any]) -> Dict[str, Any]:
+    """合并策略：保留先出现的记录，空字段用重复记录补齐，产品需求取并集，评分取较高值"""
+    for field, value in duplicate.items():
+        if value in (None, "", []):
+            continue
+        if field == "product_requirements":
+            merged = list(existing.get(field) or [])
+            merged += [item for item in value if item not in merged]
+            existing[field] = merged
+        elif field == "lead_score":
+            existing[field] = max(existing.get(field) or 0.0, value)
+        elif existing.get(field) in (None, "", []):
+            existing[field] = value
+    return existing
+
+
+class LeadDedupIndex:
+    """按工厂维护的潜在客户去重索引，写入前调用"""
+
+    def __init__(self, num_perm: int, bands: int, similarity: float):
+        self.hasher = MinHasher(num_perm, bands)
+        self.similarity = similarity
+        self.factories: Dict[int, FactoryLeadIndex] = {}
+        self.loaded_factories: Set[int] = set()
+        self.lock = threading.Lock()
+
+        # 指标
+        self.checked = 0
+        self.merged = 0
+        self.skipped_existing = 0
+
+    def _factory_index(self, factory_id: int) -> FactoryLeadIndex:
+        with self.lock:
+            index = self.factories.get(factory_id)
+            if index is None:
+                index = FactoryLeadIndex(self.hasher, self.similarity)
+                self.factories[factory_id] = index
+            return index
+
+    @staticmethod
+    def identity(lead: Dict[str, Any]) -> Tuple[str, str]:
+        """计算并写入 company_key / website_domain"""
+        key = normalize_company_name(lead.get("company_name"))
+        domain = extract_domain(lead.get("website"), lead.get("contact_email"))
+        lead["company_key"] = key.replace(" ", "") or None
+        lead["website_domain"] = domain or None
+        return key, domain
+
+    def load_stored_leads(self, db: Session, factory_id: int, chunk_size: int = 20000) -> int:
+        """从数据库加载已有潜在客户的身份信息（每个工厂只加载一次）"""
+        if factory_id in self.loaded_factories:
+            return 0
+
+        index = self._factory_index(factory_id)
+        last_id = 0
+        loaded = 0
+        while True:
+            rows = db.execute(
+                select(Lead.id, Lead.company_name, Lead.website, Lead.contact_email)
+                .where(Lead.factory_id == factory_id, Lead.id > last_id)
+                .order_by(Lead.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            with index.lock:
+                for lead_id, company_name, website, email in rows:
+                    key = normalize_company_name(company_name)
+                    if key:
+                        domain = extract_domain(website, email)
+                        index.add(_IndexEntry(None, lead_id, key, domain, company_shingles(key)))
+            loaded += len(rows)
+            last_id = rows[-1][0]
+
+        self.loaded_factories.add(factory_id)
+        logger.info(f"工厂 {factory_id} 去重索引已加载 {loaded} 个已有潜在客户")
+        return loaded
+
+    def deduplicate(self, factory_id: int, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """返回去重后的新潜在客户
+
+        本批内的重复记录合并到先出现的记录；与之前批次或数据库中已有客户重复时
+        直接跳过，以已有记录为准。
+        """
+        index = self._factory_index(factory_id)
+        unique_leads = []
+        new_entries = []
+
+        with index.lock:
+            for lead in leads:
+                self.checked += 1
+                key, domain = self.identity(lead)
+                if not key:
+                    unique_leads.append(lead)
+                    continue
+
+                shingles = company_shingles(key)
+                band_keys = self.hasher.band_keys(self.hasher.signature(shingles))
+                entry = index.find(key, domain, shingles, band_keys)
+                if entry is None:
+                    entry = _IndexEntry(lead, lead.get("id"), key, domain, shingles)
+                    index.add(entry, band_keys)
+                    new_entries.append(entry)
+                    unique_leads.append(lead)
+                elif entry.lead is not None:
+                    merge_leads(entry.lead, lead)
+                    self.merged += 1
+                else:
+                    self.skipped_existing += 1
+
+            # 批次结束后只保留身份信息，之后的重复记录按已有客户处理
+            for entry in new_entries:
+                entry.lead = None
+
+        if len(unique_leads) < len(leads):
+            logger.info(f"工厂 {factory_id} 潜在客户去重: {len(leads)} -> {len(unique_leads)}")
+        return unique_leads
+
+    def forget_leads(self, factory_id: int, leads: List[Dict[str, Any]]) -> int:
+        """撤销 deduplicate 为这些新潜在客户加入的索引条目
+
+        写入数据库失败（或结果不写入数据库）时调用，之后重新生成的同一公司不会被误判为已有客户。
+        """
+        with self.lock:
+            index = self.factories.get(factory_id)
+        if index is None:
+            return 0
+
+        removed = 0
+        with index.lock:
+            for lead in leads:
+                key = normalize_company_name(lead.get("company_name"))
+                entry = index.by_key.get(key) if key else None
+                # 从数据库加载的条目带有ID，不撤销
+                if entry is not None and entry.lead_id is None:
+                    index.remove(entry)
+                    removed += 1
+        return removed
+
+    def forget_factory(self, factory_id: int):
+        with self.lock:
+            self.factories.pop(factory_id, None)
+            self.loaded_factories.discard(factory_id)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "factories": len(self.factories),
+            "indexed_leads": sum(len(index) for index in self.factories.values()),
+            "checked": self.checked,
+            "merged": self.merged,
+            "skipped_existing": self.skipped_existing
+        }
+
+
+lead_dedup_index = LeadDedupIndex(
+    num_perm=settings.LEAD_DEDUP_NUM_PERM,
+    bands=settings.LEAD_DEDUP_BANDS,
+    similarity=settings.LEAD_DEDUP_SIMILARITY
+)
@@ -1,14 +1,28 @@
-import openai
 import asyncio
-from typing import Dict, List, Any, Optional
+import numpy as np
+from typing import Dict, List, Any, Optional, AsyncIterator
 import logging
 from datetime import datetime
 
 from app.core.config import settings
+from app.core.llm import chat_completion
+from app.core.semantic_cache import lead_prompt_cache
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.database import get_db_sync
+from app.core.sqlite_writer import sqlite_writer
+from app.core.websocket import push_factory_event
 from app.models.lead import Lead
+from app.services.lead_dedup import lead_dedup_index, extract_domain
+from app.services.enrichment import enrichment_service
+from app.services.blacklist import BlacklistUnavailableError, blacklist_registry
+from app.services.lead_persistence import lead_persistence
+from app.services.lead_scoring import lead_scoring_engine, EncodedLeads
 
 logger = logging.getLogger(__name__)
 
+# 客户画像在语义缓存中的scope（潜在客户按工厂ID隔离）
+PROFILE_CACHE_SCOPE = "customer_profiles"
+
 
 class LeadGenerator:
     """潜在客户生成服务"""
@@ -17,22 +31,21 @@ class LeadGenerator:
         self.openai_model = settings.OPENAI_MODEL
         self.max_tokens = settings.OPENAI_MAX_TOKENS
         self.temperature = settings.OPENAI_TEMPERATURE
+        self.scoring_engine = lead_scoring_engine
+        self.dedup_index = lead_dedup_index
     
     async def generate_leads(self, factory_id: int, market_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
         """基于市场分析生成潜在客户"""
         try:
             logger.info(f"开始为工厂 {factory_id} 生成潜在客户")
             
-            # 1. 基于市场分析生成客户画像
-            customer_profiles = await self._generate_customer_profiles(market_analysis)
-            
-            # 2. 为每个客户画像生成具体的潜在客户
             all_leads = []
-            
-            for profile in customer_profiles:
-                profile_leads = await self._generate_leads_for_profile(factory_id, profile)
+            async for profile_leads in self.stream_leads(factory_id, market_analysis):
                 all_leads.extend(profile_leads)
             
+            # 结果不写入数据库，去重索引中只保留已保存的客户
+            self.dedup_index.forget_leads(factory_id, all_leads)
+            
             logger.info(f"成功生成 {len(all_leads)} 个潜在客户")
             return all_leads
             
@@ -40,9 +53,82 @@ class LeadGenerator:
             logger.error(f"生成潜在客户失败: {e}")
             return []
     
+    async def stream_leads(self, factory_id: int, market_analysis: Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """以流的形式生成潜在客户，每完成一个客户画像产出一批"""
+        # 1. 基于市场分析生成客户画像
+        customer_profiles = await self._generate_customer_profiles(market_analysis)
+        
+        # 2. 并发为每个客户画像生成潜在客户，按完成顺序产出
+        tasks = [
+            asyncio.create_task(self._generate_leads_for_profile(factory_id, profile))
+            for profile in customer_profiles
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                profile_leads = await next_done
+                
+                # 3. 先过滤工厂黑名单中的公司，黑名单不可用时整批跳过
+                try:
+                    profile_leads = await blacklist_registry.filter_leads_async(factory_id, profile_leads)
+                except BlacklistUnavailableError as e:
+                    logger.error(f"无法确认工厂 {factory_id} 的黑名单，跳过 {len(profile_leads)} 个潜在客户: {e}")
+                    continue
+                if not profile_leads:
+                    continue
+                
+                # 4. 只为未被过滤的客户评分（整批向量化计算）
+                for lead, score in zip(profile_leads, self.scoring_engine.score_leads(profile_leads)):
+                    lead["lead_score"] = float(score)
+                
+                # 5. 去除与本批及已有客户重复的公司（首次处理工厂时同步加载已有客户，放到线程中执行）
+                profile_leads = await asyncio.to_thread(self._deduplicate_leads, factory_id, profile_leads)
+                
+                if profile_leads:
+                    yield profile_leads
+        finally:
+            # 调用方提前结束时取消未完成的画像
+            for task in tasks:
+                task.cancel()
+    
+    async def generate_and_store_leads(self, factory_id: int, market_analysis: Dict[str, Any]) -> int:
+        """流式生成潜在客户，按小批次资格认证、写入数据库并推送给订阅的WebSocket客户端"""
+        logger.info(f"开始为工厂 {factory_id} 流式生成潜在客户")
+        total = 0
+        batch_size = settings.LEAD_STREAM_BATCH_SIZE
+        
+        async for profile_leads in self.stream_leads(factory_id, market_analysis):
+            for start in range(0, len(profile_leads), batch_size):
+                batch = await self.qualify_leads(profile_leads[start:start + batch_size])
+                
+                try:
+                    await asyncio.to_thread(self._persist_leads, batch)
+                except Exception as e:
+                    # 未保存的客户移出去重索引，重试时可以重新写入
+                    logger.error(f"保存潜在客户失败: {e}")
+                    self.dedup_index.forget_leads(factory_id, batch)
+                    continue
+                
+                total += len(batch)
+                await push_factory_event(factory_id, "leads_generated", {"leads": batch, "total": total})
+        
+        await push_factory_event(factory_id, "lead_generation_completed", {"total": total})
+        logger.info(f"工厂 {factory_id} 流式生成完成，共 {total} 个潜在客户")
+        return total
+    
+    def _persist_leads(self, leads: List[Dict[str, Any]]):
+        """批量写入一批潜在客户，并把生成的ID回填到字典中"""
+        sqlite_writer.write(lambda db: lead_persistence.write_leads(db, leads, commit=False))
+    
     async def _generate_customer_profiles(self, market_analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
         """生成客户画像"""
+        # 客户画像只描述客户类型，不含具体公司，相似市场分析的结果可以跨工厂复用
+        cache_text = self._market_cache_text(market_analysis)
         try:
+            cached = lead_prompt_cache.lookup(cache_text, scope=PROFILE_CACHE_SCOPE)
+            if cached:
+                logger.info(f"市场分析命中语义缓存，相似度: {cached['similarity']:.3f}")
+                return self._parse_customer_profiles(cached["value"])
+            
             prompt = f"""
 基于以下市场分析，请生成5-8个详细的客户画像：
 
@@ -62,7 +148,7 @@ class LeadGenerator:
 请确保客户画像多样化，覆盖不同的市场细分。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的B2B客户画像分析师。"},
@@ -73,12 +159,23 @@ class LeadGenerator:
             )
             
             profiles_text = response.choices[0].message.content
+            lead_prompt_cache.store(cache_text, profiles_text, scope=PROFILE_CACHE_SCOPE)
             
             # 解析客户画像
             customer_profiles = self._parse_customer_profiles(profiles_text)
             
             return customer_profiles
             
+        except CircuitOpenError as e:
+            # LLM熔断时放宽相似度阈值，尽量复用已有的客户画像
+            logger.warning(f"生成客户画像失败，使用缓存降级: {e}")
+            cached = lead_prompt_cache.lookup(
+                cache_text, scope=PROFILE_CACHE_SCOPE, threshold=settings.LLM_FALLBACK_CACHE_THRESHOLD
+            )
+            if cached:
+                return self._parse_customer_profiles(cached["value"])
+            return self._get_default_customer_profiles()
+            
         except Exception as e:
             logger.error(f"生成客户画像失败: {e}")
             return self._get_default_customer_profiles()
@@ -138,7 +235,12 @@ class LeadGenerator:
         ]
     
     async def _generate_leads_for_profile(self, factory_id: int, profile: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """为特定客户画像生成潜在客户"""
+        """为特定客户画像生成潜在客户
+
+        生成的公司按工厂隔离缓存，有意只在LLM熔断时读取：正常情况下命中同一工厂的相似画像
+        只会得到已存在、会被去重掉的公司，反而少生成新客户；其他工厂的结果则不能泄露给当前工厂。
+        """
+        cache_text = self._profile_cache_text(profile)
         try:
             prompt = f"""
 基于以下客户画像，请生成3-5个具体的潜在客户公司：
@@ -159,7 +261,7 @@ class LeadGenerator:
 请确保公司名称和域名在目标市场中是合理的。
 """
 
-            response = await openai.ChatCompletion.acreate(
+            response = await chat_completion(
                 model=self.openai_model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的B2B潜在客户生成专家。"},
@@ -170,18 +272,53 @@ class LeadGenerator:
             )
             
             leads_text = response.choices[0].message.content
+            lead_prompt_cache.store(cache_text, leads_text, scope=factory_id)
             
             # 解析潜在客户信息
             leads = self._parse_leads(leads_text, factory_id, profile)
             
             return leads
             
+        except CircuitOpenError as e:
+            # LLM熔断时放宽相似度阈值，尽量复用已有的生成结果
+            logger.warning(f"为画像生成潜在客户失败，使用缓存降级: {e}")
+            cached = lead_prompt_cache.lookup(
+                cache_text, scope=factory_id, threshold=settings.LLM_FALLBACK_CACHE_THRESHOLD
+            )
+            if cached:
+                return self._parse_leads(cached["value"], factory_id, profile)
+            return []
+            
         except Exception as e:
             logger.error(f"为画像生成潜在客户失败: {e}")
             return []
     
+    def _deduplicate_leads(self, factory_id: int, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """写入前去重，首次处理某工厂时从数据库加载已有客户"""
+        if not settings.LEAD_DEDUP_ENABLED:
+            return leads
+        
+        if factory_id not in self.dedup_index.loaded_factories:
+            db = get_db_sync()
+            try:
+                self.dedup_index.load_stored_leads(db, factory_id)
+            except Exception as e:
+                logger.warning(f"加载已有潜在客户失败，仅按本批数据去重: {e}")
+            finally:
+                db.close()
+        
+        return self.dedup_index.deduplicate(factory_id, leads)
+    
+    def _market_cache_text(self, market_analysis: Dict[str, Any]) -> str:
+        """生成用于语义缓存的市场分析文本"""
+        return "\n".join(f"{key}: {market_analysis[key]}" for key in sorted(market_analysis))
+    
+    def _profile_cache_text(self, profile: Dict[str, Any]) -> str:
+        """生成用于语义缓存的客户画像文本"""
+        return "\n".join(f"{key}: {profile[key]}" for key in sorted(profile))
+    
     def _parse_leads(self, leads_text: str, factory_id: int, profile: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """解析潜在客户信息"""
+        """解析潜在客户信息（过滤黑名单后才评分，见 stream_leads）"""
         leads = []
         
         # 简单的文本解析逻辑
@@ -199,7 +336,6 @@ class LeadGenerator:
                 "business_needs": profile.get("业务需求", ""),
                 "budget_range": profile.get("预算范围", ""),
                 "timeline": profile.get("采购时间线", ""),
-                "lead_score": self._calculate_lead_score(profile),
                 "qualification_status": "unqualified",
                 "engagement_level": "cold",
                 "lead_source": "ai_generated",
@@ -236,60 +372,26 @@ class LeadGenerator:
                     elif key == "具体产品需求":
                         lead_data["product_requirements"] = [value]
                     elif key == "预期订单规模":
-                        lead_data["budget_range"] = value
+                        # 预算范围沿用客户画像的取值，重新评分时才能得到相同的结果
+                        lead_data["expected_order_size"] = value
             
             if "company_name" in lead_data:
                 leads.append(lead_data)
         
         return leads[:5]  # 最多5个潜在客户
     
-    def _calculate_lead_score(self, profile: Dict[str, Any]) -> float:
-        """计算潜在客户评分"""
-        score = 50.0  # 基础分
-        
-        # 根据公司规模调整分数
-        size = profile.get("公司规模", "")
-        if "1000+" in size or "500+" in size:
-            score += 20
-        elif "100-500" in size or "200-500" in size:
-            score += 15
-        elif "50-200" in size or "100-200" in size:
-            score += 10
-        
-        # 根据预算范围调整分数
-        budget = profile.get("预算范围", "")
-        if "高" in budget:
-            score += 15
-        elif "中高" in budget:
-            score += 10
-        elif "中等" in budget:
-            score += 5
-        
-        # 根据采购时间线调整分数
-        timeline = profile.get("采购时间线", "")
-        if "3-6个月" in timeline:
-            score += 15
-        elif "6-12个月" in timeline:
-            score += 10
-        elif "12个月以上" in timeline:
-            score += 5
-        
-        return min(score, 100.0)  # 最高100分
-    
     async def qualify_leads(self, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """资格认证潜在客户"""
         try:
-            qualified_leads = []
+            # 整批编码后一次性计算资格，评分沿用潜在客户已有的 lead_score
+            encoded = EncodedLeads.from_leads(leads)
+            scores = np.asarray([lead.get("lead_score", 0) or 0 for lead in leads], dtype=np.float64)
+            qualified = self.scoring_engine.qualify(encoded, scores)
             
-            for lead in leads:
-                # 基于评分和基本信息进行资格认证
-                if self._is_qualified(lead):
-                    lead["qualification_status"] = "qualified"
-                    qualified_leads.append(lead)
-                else:
-                    lead["qualification_status"] = "unqualified"
+            for lead, is_qualified in zip(leads, qualified):
+                lead["qualification_status"] = "qualified" if is_qualified else "unqualified"
             
-            logger.info(f"资格认证完成，合格客户: {len(qualified_leads)}/{len(leads)}")
+            logger.info(f"资格认证完成，合格客户: {int(qualified.sum())}/{len(leads)}")
             return leads
             
         except Exception as e:
@@ -298,41 +400,32 @@ class LeadGenerator:
     
     def _is_qualified(self, lead: Dict[str, Any]) -> bool:
         """判断潜在客户是否合格"""
-        # 基本资格检查
-        if not lead.get("company_name") or not lead.get("contact_email"):
-            return False
-        
-        # 评分检查
-        if lead.get("lead_score", 0) < 60:
-            return False
-        
-        # 行业匹配检查（这里可以根据具体需求调整）
-        valid_industries = ["消费电子", "家居用品", "汽车", "医疗设备", "工业设备"]
-        if lead.get("industry") not in valid_industries:
-            return False
-        
-        return True
+        scores = np.asarray([lead.get("lead_score", 0) or 0], dtype=np.float64)
+        return bool(self.scoring_engine.qualify(EncodedLeads.from_leads([lead]), scores)[0])
     
     async def enrich_lead_data(self, lead: Dict[str, Any]) -> Dict[str, Any]:
         """丰富潜在客户数据"""
+        return (await self.enrich_leads([lead]))[0]
+    
+    async def enrich_leads(self, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按网站域名批量丰富潜在客户数据（见 app/services/enrichment.py）"""
         try:
-            # 这里可以集成第三方数据源来丰富客户信息
-            # 例如：公司财务信息、员工数量、技术栈等
+            domains = [
+                lead.get("website_domain") or extract_domain(lead.get("website"), lead.get("contact_email"))
+                for lead in leads
+            ]
+            enriched_data = await enrichment_service.enrich_domains(domains)
             
-            enriched_lead = lead.copy()
+            enriched_leads = []
+            for lead, domain in zip(leads, domains):
+                enriched_lead = lead.copy()
+                data = enriched_data.get(domain.lower()) if domain else None
+                if data is not None:
+                    enriched_lead["enriched_data"] = data
+                enriched_leads.append(enriched_lead)
             
-            # 添加一些模拟的丰富数据
-            enriched_lead["enriched_data"] = {
-                "company_founded": "2010-2020",
-                "revenue_range": "1M-100M",
-                "technology_stack": ["ERP", "CRM", "Cloud Computing"],
-                "recent_news": "公司正在寻求数字化转型",
-                "competitors": ["竞争对手A", "竞争对手B"],
-                "growth_rate": "15-25%"
-            }
-            
-            return enriched_lead
+            return enriched_leads
             
         except Exception as e:
             logger.error(f"丰富客户数据失败: {e}")
-            return lead
+            return leads
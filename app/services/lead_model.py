@@ -0,0 +1,293 @@
+import argparse
+import json
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+import logging
+
+from sqlalchemy import select, func, case, and_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.lead import Lead, LeadInteraction
+from app.services.lead_scoring import DEFAULT_SCORING_RULES, lead_scoring_engine
+
+logger = logging.getLogger(__name__)
+
+# 按评分规则表把文本字段分桶，每个桶对应一个独热特征
+BUCKETED_FIELDS = ["company_size", "budget_range", "timeline"]
+FLAG_FIELDS = ["contact_email", "contact_phone", "linkedin_profile", "website"]
+FEATURE_FIELDS = BUCKETED_FIELDS + ["industry"] + FLAG_FIELDS
+# 评分后按规则重新认证资格时还需要的列（见 LeadScoringEngine.apply_scores）
+QUALIFICATION_FIELDS = ["factory_id", "qualification_status", "company_name"]
+FETCHED_FIELDS = ["id"] + FEATURE_FIELDS + QUALIFICATION_FIELDS
+
+
+def _bucket_index(value: Optional[str], rules: List[Tuple[List[str], float]]) -> int:
+    """返回命中的规则序号，未命中时为最后一个桶"""
+    for index, (keywords, _) in enumerate(rules):
+        if value and any(keyword in value for keyword in keywords):
+            return index
+    return len(rules)
+
+
+class LeadFeatureEncoder:
+    """把潜在客户的列数据编码为特征矩阵"""
+
+    def __init__(self, industries: List[str]):
+        self.industries = industries
+        self.industry_index = {industry: i for i, industry in enumerate(industries)}
+        self.bucket_rules = {field: DEFAULT_SCORING_RULES["fields"][field] for field in BUCKETED_FIELDS}
+
+    @property
+    def feature_names(self) -> List[str]:
+        names = []
+        for field in BUCKETED_FIELDS:
+            names += [f"{field}={i}" for i in range(len(self.bucket_rules[field]) + 1)]
+        names += [f"industry={industry}" for industry in self.industries] + ["industry=other"]
+        names += [f"has_{field}" for field in FLAG_FIELDS]
+        return names
+
+    def transform(self, columns: Dict[str, Sequence[Any]]) -> np.ndarray:
+        size = len(columns["industry"])
+        blocks = []
+
+        for field in BUCKETED_FIELDS:
+            rules = self.bucket_rules[field]
+            # 每个不同取值只匹配一次规则
+            buckets = {value: _bucket_index(value, rules) for value in set(columns[field])}
+            indexes = np.fromiter((buckets[v] for v in columns[field]), dtype=np.int64, count=size)
+            blocks.append(np.eye(len(rules) + 1, dtype=np.float32)[indexes])
+
+        other = len(self.industries)
+        indexes = np.fromiter(
+            (self.industry_index.get(v, other) for v in columns["industry"]),
+            dtype=np.int64,
+            count=size
+        )
+        blocks.append(np.eye(other + 1, dtype=np.float32)[indexes])
+
+        for field in FLAG_FIELDS:
+            blocks.append(np.fromiter((bool(v) for v in columns[field]), dtype=np.float32, count=size)[:, None])
+
+        return np.hstack(blocks)
+
+
+class LeadScoringModel:
+    """逻辑回归潜在客户评分模型，模型文件为紧凑的JSON"""
+
+    def __init__(self, encoder: LeadFeatureEncoder, weights: np.ndarray, bias: float, metadata: Dict[str, Any]):
+        self.encoder = encoder
+        self.weights = weights
+        self.bias = bias
+        self.metadata = metadata
+
+    def predict_proba(self, columns: Dict[str, Sequence[Any]]) -> np.ndarray:
+        logits = self.encoder.transform(columns) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "industries": self.encoder.industries,
+                "feature_names": self.encoder.feature_names,
+                "weights": [round(float(w), 6) for w in self.weights],
+                "bias": round(float(self.bias), 6),
+                "metadata": self.metadata
+            }, f, ensure_ascii=False, indent=2)
+
+    @property
+    def min_qualified_score(self) -> float:
+        """模型评分（0-100）的资格分数线，训练时按正样本比例确定；与评分保留相同的小数位"""
+        return float(np.round(self.metadata["qualification_threshold"] * 100.0, 2))
+
+    @classmethod
+    def load(cls, path: str) -> "LeadScoringModel":
+        with open(path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+        encoder = LeadFeatureEncoder(artifact["industries"])
+        if encoder.feature_names != artifact["feature_names"]:
+            raise ValueError("模型特征与当前编码器不一致，请重新训练")
+        if "qualification_threshold" not in artifact["metadata"]:
+            raise ValueError("模型文件缺少资格阈值，请重新训练")
+        return cls(encoder, np.asarray(artifact["weights"], dtype=np.float64), artifact["bias"], artifact["metadata"])
+
+
+def _fetch_columns(db: Session, factory_id: Optional[int], last_id: int, limit: int) -> Dict[str, List[Any]]:
+    query = (
+        select(*(getattr(Lead, field) for field in FETCHED_FIELDS))
+        .where(Lead.id > last_id)
+        .order_by(Lead.id)
+        .limit(limit)
+    )
+    if factory_id is not None:
+        query = query.where(Lead.factory_id == factory_id)
+    rows = db.execute(query).all()
+    return {name: [row[i] for row in rows] for i, name in enumerate(FETCHED_FIELDS)}
+
+
+def _fetch_labels(db: Session, factory_id: Optional[int]) -> Dict[int, bool]:
+    """正样本：已转化，或收到过非负面的回复"""
+    positive_response = case(
+        (and_(
+            LeadInteraction.response_received.is_(True),
+            func.coalesce(LeadInteraction.response_sentiment, "neutral") != "negative"
+        ), 1),
+        else_=0
+    )
+    query = (
+        select(Lead.id, Lead.is_converted, func.max(positive_response))
+        .outerjoin(LeadInteraction, LeadInteraction.lead_id == Lead.id)
+        .group_by(Lead.id, Lead.is_converted)
+    )
+    if factory_id is not None:
+        query = query.where(Lead.factory_id == factory_id)
+    return {lead_id: bool(converted) or bool(responded) for lead_id, converted, responded in db.execute(query)}
+
+
+def _fit_logistic_regression(
+    X: np.ndarray,
+    y: np.ndarray,
+    l2: float,
+    iterations: int = 25
+) -> Tuple[np.ndarray, float]:
+    """带L2正则的牛顿法（IRLS）逻辑回归，特征维度小，几轮即可收敛"""
+    Xb = np.hstack([X.astype(np.float64), np.ones((len(X), 1))])
+    theta = np.zeros(Xb.shape[1])
+    penalty = np.full(Xb.shape[1], l2)
+    penalty[-1] = 0.0  # 不惩罚截距
+
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(Xb @ theta)))
+        gradient = Xb.T @ (p - y) + penalty * theta
+        hessian = (Xb * (p * (1 - p))[:, None]).T @ Xb + np.diag(penalty) + 1e-9 * np.eye(len(theta))
+        step = np.linalg.solve(hessian, gradient)
+        theta -= step
+        if np.max(np.abs(step)) < 1e-6:
+            break
+
+    return theta[:-1], float(theta[-1])
+
+
+def _auc(y: np.ndarray, scores: np.ndarray) -> Optional[float]:
+    positives = int(y.sum())
+    negatives = len(y) - positives
+    if positives == 0 or negatives == 0:
+        return None
+    ranks = np.empty(len(scores))
+    ranks[np.argsort(scores)] = np.arange(1, len(scores) + 1)
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def _qualification_threshold(probabilities: np.ndarray, positive_rate: float) -> float:
+    """按训练集正样本比例取预测概率的分位数：概率最高的同等比例客户达到阈值
+
+    模型输出的是校准后的概率，整体接近正样本比例，不能套用规则评分的固定分数线。
+    """
+    count = int(round(positive_rate * len(probabilities)))
+    if count == 0:
+        return 1.0
+    return float(np.sort(probabilities)[::-1][count - 1])
+
+
+def train_lead_model(
+    db: Session,
+    factory_id: Optional[int] = None,
+    l2: float = 1.0,
+    max_industries: int = 30,
+    chunk_size: int = 50000
+) -> LeadScoringModel:
+    """基于 LeadInteraction 回复结果和 Lead.is_converted 训练评分模型"""
+    labels = _fetch_labels(db, factory_id)
+    if not labels:
+        raise ValueError("没有可用于训练的潜在客户")
+
+    columns: Dict[str, List[Any]] = {}
+    last_id = 0
+    while True:
+        chunk = _fetch_columns(db, factory_id, last_id, chunk_size)
+        if not chunk["id"]:
+            break
+        for name, values in chunk.items():
+            columns.setdefault(name, []).extend(values)
+        last_id = chunk["id"][-1]
+
+    industries, counts = np.unique(np.asarray([v or "" for v in columns["industry"]], dtype=object), return_counts=True)
+    top_industries = [str(i) for i in industries[np.argsort(-counts)][:max_industries] if i]
+
+    encoder = LeadFeatureEncoder(top_industries)
+    X = encoder.transform(columns)
+    y = np.asarray([labels.get(lead_id, False) for lead_id in columns["id"]], dtype=np.float64)
+
+    weights, bias = _fit_logistic_regression(X, y, l2)
+    model = LeadScoringModel(encoder, weights, bias, {})
+    probabilities = model.predict_proba(columns)
+    model.metadata = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "factory_id": factory_id,
+        "samples": int(len(y)),
+        "positive_rate": float(y.mean()),
+        "train_auc": _auc(y, probabilities),
+        "qualification_threshold": _qualification_threshold(probabilities, float(y.mean()))
+    }
+    logger.info(f"潜在客户评分模型训练完成: {model.metadata}")
+    return model
+
+
+def score_factory_leads(db: Session, model: LeadScoringModel, factory_id: int, chunk_size: int = 20000) -> int:
+    """用训练好的模型批量更新工厂所有潜在客户的 lead_score（0-100）
+
+    与规则重新评分走同一写入路径：按新评分重新认证资格，状态变化计入工厂统计。
+    资格分数线使用模型文件中保存的阈值，而不是规则的 min_qualified_score。
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        columns = _fetch_columns(db, factory_id, last_id, chunk_size)
+        if not columns["id"]:
+            break
+
+        scores = np.round(model.predict_proba(columns) * 100.0, 2)
+        lead_scoring_engine.apply_scores(db, columns, scores, min_score=model.min_qualified_score)
+        db.commit()
+
+        updated += len(columns["id"])
+        last_id = columns["id"][-1]
+
+    logger.info(f"工厂 {factory_id} 已按模型更新 {updated} 个潜在客户评分")
+    return updated
+
+
+def main():
+    from app.core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="潜在客户评分模型训练与批量评分")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train")
+    train_parser.add_argument("--factory-id", type=int, default=None)
+    train_parser.add_argument("--l2", type=float, default=1.0)
+    train_parser.add_argument("--output", default=settings.LEAD_MODEL_PATH)
+
+    score_parser = subparsers.add_parser("score")
+    score_parser.add_argument("--factory-id", type=int, required=True)
+    score_parser.add_argument("--model", default=settings.LEAD_MODEL_PATH)
+
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        if args.command == "train":
+            model = train_lead_model(db, factory_id=args.factory_id, l2=args.l2)
+            model.save(args.output)
+            print(f"✅ 模型已保存到 {args.output}: {model.metadata}")
+        else:
+            updated = score_factory_leads(db, LeadScoringModel.load(args.model), args.factory_id)
+            print(f"✅ 已更新 {updated} 个潜在客户评分")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
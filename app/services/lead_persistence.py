@@ -0,0 +1,285 @@
+import csv
+import io
+import json
+import threading
+import time
+from typing import Dict, List, Any, Optional
+import logging
+
+from sqlalchemy import insert, update, case, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.lead import Lead, LeadInteraction, lead_search_text, interaction_search_text
+from app.services.lead_dedup import LeadDedupIndex, merge_leads
+from app.services.factory_stats import FactoryStatsDelta, factory_stats_service
+
+logger = logging.getLogger(__name__)
+
+LEAD_COLUMNS = [column.name for column in Lead.__table__.columns if column.name not in ("id", "created_at", "updated_at")]
+INTERACTION_COLUMNS = [
+    column.name for column in LeadInteraction.__table__.columns if column.name not in ("id", "created_at")
+]
+JSON_COLUMNS = {"product_requirements"}
+# 合并写入后重新计算检索词元需要取回的列
+SEARCH_TEXT_COLUMNS = [Lead.company_name, Lead.business_needs, Lead.product_requirements, Lead.search_text]
+
+# 去重键冲突时的合并策略：保留已有值，空字段用新值补齐，评分取较高值；
+# 检索词元不参与合并，写入后按合并结果重新计算（见 _refresh_search_text）
+_KEEP_EXISTING = {"search_text", "factory_id", "company_key", "company_name", "qualification_status", "engagement_level",
+                  "is_active", "is_converted", "interaction_count", "response_count", "last_interaction_at",
+                  "last_interaction_type", "last_response_sentiment", "last_contact_date", "next_follow_up_date"}
+
+
+class PersistenceMetrics:
+    """写入吞吐指标"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows: Dict[str, int] = {}
+        self.batches: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def record(self, path: str, rows: int, seconds: float):
+        with self.lock:
+            self.rows[path] = self.rows.get(path, 0) + rows
+            self.batches[path] = self.batches.get(path, 0) + 1
+            self.seconds[path] = self.seconds.get(path, 0.0) + seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                path: {
+                    "rows": self.rows[path],
+                    "batches": self.batches[path],
+                    "seconds": round(self.seconds[path], 3),
+                    "rows_per_second": round(self.rows[path] / self.seconds[path], 1) if self.seconds[path] else None
+                }
+                for path in self.rows
+            }
+
+
+class LeadPersistence:
+    """潜在客户批量写入
+
+    - 按 LEAD_PERSIST_BATCH_SIZE 分批，每批一条多行 INSERT ... VALUES（由SQLAlchemy按页展开）
+    - PostgreSQL/SQLite 在 (factory_id, company_key) 冲突时按合并策略更新已有记录
+    - PostgreSQL 大批量写入走 COPY 到临时表，再一次性合并到 leads 表
+    """
+
+    def __init__(self, batch_size: int, copy_threshold: int):
+        self.batch_size = batch_size
+        self.copy_threshold = copy_threshold
+        self.metrics = PersistenceMetrics()
+
+    def _lead_row(self, lead: Dict[str, Any]) -> Dict[str, Any]:
+        if "company_key" not in lead:
+            LeadDedupIndex.identity(lead)
+        row = {column: lead.get(column) for column in LEAD_COLUMNS}
+        for column, default in (("lead_score", 0.0), ("qualification_status", "unqualified"),
+                                ("engagement_level", "cold"), ("is_active", True), ("is_converted", False),
+                                ("interaction_count", 0), ("response_count", 0)):
+            if row[column] is None:
+                row[column] = default
+        row["search_text"] = lead_search_text(row)
+        return row
+
+    def _collapse_batch(self, leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """同一条语句中同一个去重键只能出现一次，批内重复先合并"""
+        seen: Dict[tuple, Dict[str, Any]] = {}
+        collapsed = []
+        for lead in leads:
+            key = lead.get("company_key")
+            if not key:
+                collapsed.append(lead)
+                continue
+            existing = seen.get((lead.get("factory_id"), key))
+            if existing is None:
+                seen[(lead.get("factory_id"), key)] = lead
+                collapsed.append(lead)
+            else:
+                merge_leads(existing, lead)
+        return collapsed
+
+    def _upsert_statement(self, dialect_name: str):
+        dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+        statement = dialect_insert(Lead)
+        excluded = statement.excluded
+        updates = {
+            column: func.coalesce(getattr(Lead, column), getattr(excluded, column))
+            for column in LEAD_COLUMNS
+            if column not in _KEEP_EXISTING and column != "lead_score"
+        }
+        updates["lead_score"] = case(
+            (excluded.lead_score > Lead.lead_score, excluded.lead_score),
+            else_=Lead.lead_score
+        )
+        updates["updated_at"] = func.now()
+        return statement.on_conflict_do_update(index_elements=["factory_id", "company_key"], set_=updates)
+
+    def _refresh_search_text(self, db: Session, merged_rows: List[Dict[str, Any]]):
+        """冲突合并后的记录按合并后的字段重新计算检索词元，只更新发生变化的行"""
+        updates = []
+        for row in merged_rows:
+            search_text = lead_search_text(row)
+            if search_text != row["search_text"]:
+                updates.append({"id": row["id"], "search_text": search_text})
+        if updates:
+            db.execute(update(Lead), updates)
+
+    def write_leads(self, db: Session, leads: List[Dict[str, Any]], commit: bool = True) -> int:
+        """批量写入潜在客户，并把数据库ID回填到字典中，返回写入（含合并）的行数
+
+        新插入的客户在同一事务中计入工厂统计；与已有记录合并的不重复计数。
+        """
+        for lead in leads:
+            if "company_key" not in lead:
+                LeadDedupIndex.identity(lead)
+        leads = self._collapse_batch(leads)
+        if not leads:
+            return 0
+
+        dialect_name = db.get_bind().dialect.name
+        stats = FactoryStatsDelta()
+        written = 0
+        try:
+            if dialect_name == "postgresql" and len(leads) >= self.copy_threshold:
+                written = self._copy_leads(db, leads, stats)
+            else:
+                for start in range(0, len(leads), self.batch_size):
+                    written += self._insert_batch(db, leads[start:start + self.batch_size], dialect_name, stats)
+            factory_stats_service.apply(db, stats)
+            if commit:
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        return written
+
+    def _insert_batch(
+        self,
+        db: Session,
+        leads: List[Dict[str, Any]],
+        dialect_name: str,
+        stats: FactoryStatsDelta
+    ) -> int:
+        started = time.perf_counter()
+        rows = [self._lead_row(lead) for lead in leads]
+
+        if dialect_name in ("postgresql", "sqlite"):
+            path = "upsert"
+            statement = self._upsert_statement(dialect_name)
+        else:
+            path = "insert"
+            statement = insert(Lead)
+
+        # updated_at 只在冲突更新时赋值，为空即为新插入的记录
+        result = db.execute(
+            statement.returning(Lead.id, Lead.updated_at, *SEARCH_TEXT_COLUMNS, sort_by_parameter_order=True),
+            rows
+        )
+        merged_rows = []
+        for lead, row, returned in zip(leads, rows, result):
+            lead["id"] = returned.id
+            if returned.updated_at is None:
+                stats.add_lead(row)
+            else:
+                merged_rows.append(returned._asdict())
+        self._refresh_search_text(db, merged_rows)
+
+        self.metrics.record(path, len(rows), time.perf_counter() - started)
+        return len(rows)
+
+    def _copy_leads(self, db: Session, leads: List[Dict[str, Any]], stats: FactoryStatsDelta) -> int:
+        """PostgreSQL：COPY 到临时表后合并到 leads 表"""
+        started = time.perf_counter()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rows = [self._lead_row(lead) for lead in leads]
+        for row in rows:
+            writer.writerow([
+                "\\N" if row[column] is None
+                else json.dumps(row[column], ensure_ascii=False) if column in JSON_COLUMNS
+                else row[column]
+                for column in LEAD_COLUMNS
+            ])
+        buffer.seek(0)
+
+        column_list = ", ".join(LEAD_COLUMNS)
+        assignments = ", ".join(
+            f"{column} = COALESCE(leads.{column}, EXCLUDED.{column})"
+            for column in LEAD_COLUMNS
+            if column not in _KEEP_EXISTING and column != "lead_score"
+        )
+        db.execute(text(
+            "CREATE TEMP TABLE IF NOT EXISTS lead_staging "
+            "(LIKE leads INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        ))
+        # 临时表只在提交时清空，同一事务中的上一次写入可能还留有数据
+        db.execute(text("TRUNCATE lead_staging"))
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY lead_staging ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+        result = db.execute(text(
+            f"INSERT INTO leads ({column_list}) SELECT {column_list} FROM lead_staging "
+            f"ON CONFLICT (factory_id, company_key) DO UPDATE SET {assignments}, "
+            f"lead_score = GREATEST(leads.lead_score, EXCLUDED.lead_score), updated_at = now() "
+            f"RETURNING id, factory_id, company_key, updated_at IS NULL AS inserted, "
+            f"{', '.join(column.key for column in SEARCH_TEXT_COLUMNS)}"
+        ))
+        ids = {}
+        merged_rows = []
+        for returned in result:
+            if returned.company_key:
+                ids[(returned.factory_id, returned.company_key)] = (returned.id, returned.inserted)
+            if not returned.inserted:
+                merged_rows.append(returned._asdict())
+        for lead, row in zip(leads, rows):
+            lead_id, inserted = ids.get((lead.get("factory_id"), lead.get("company_key")), (None, False))
+            if lead_id is not None:
+                lead["id"] = lead_id
+            if inserted or not lead.get("company_key"):
+                stats.add_lead(row)
+        self._refresh_search_text(db, merged_rows)
+
+        self.metrics.record("copy", len(leads), time.perf_counter() - started)
+        return len(leads)
+
+    def write_interactions(self, db: Session, interactions: List[Dict[str, Any]], commit: bool = True) -> int:
+        """批量写入客户互动记录"""
+        if not interactions:
+            return 0
+        try:
+            for start in range(0, len(interactions), self.batch_size):
+                started = time.perf_counter()
+                rows = [
+                    {column: interaction.get(column) for column in INTERACTION_COLUMNS}
+                    for interaction in interactions[start:start + self.batch_size]
+                ]
+                for row in rows:
+                    row["search_text"] = interaction_search_text(row)
+                db.execute(insert(LeadInteraction), rows)
+                self.metrics.record("interactions", len(rows), time.perf_counter() - started)
+            if commit:
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return len(interactions)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return self.metrics.snapshot()
+
+
+lead_persistence = LeadPersistence(
+    batch_size=settings.LEAD_PERSIST_BATCH_SIZE,
+    copy_threshold=settings.LEAD_PERSIST_COPY_THRESHOLD
+)
@@ -0,0 +1,86 @@
+import base64
+import json
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.serialization import ModelSerializer
+from app.models.lead import Lead
+from app.models.loading import load_profile
+
+logger = logging.getLogger(__name__)
+
+lead_serializer = ModelSerializer(Lead, exclude=("search_text",))
+
+
+class InvalidCursorError(ValueError):
+    """分页游标无法解析"""
+
+
+def encode_cursor(lead_score: float, lead_id: int) -> str:
+    payload = json.dumps([lead_score, lead_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        lead_score, lead_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return float(lead_score), int(lead_id)
+    except Exception as e:
+        raise InvalidCursorError(f"无效的分页游标: {cursor}") from e
+
+
+class LeadRepository:
+    """潜在客户查询
+
+    列表按 (lead_score DESC, id DESC) 排序，使用键集（游标）分页：游标记录上一页最后一行的
+    (lead_score, id)，下一页直接从索引中该位置之后开始读取，与页码深度无关。
+    对应索引见 Lead.__table_args__。
+    """
+
+    async def list_leads(
+        self,
+        db: AsyncSession,
+        factory_id: Optional[int] = None,
+        qualification_status: Optional[str] = None,
+        engagement_level: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """返回 (当前页潜在客户, 下一页游标)，没有下一页时游标为None
+
+        只查询 fields 指定的列（默认全部列），结果为字典，不构建ORM对象。
+        """
+        query = select(*lead_serializer.select_columns(fields, required=("lead_score", "id")))
+
+        if factory_id is not None:
+            query = query.where(Lead.factory_id == factory_id)
+        if qualification_status is not None:
+            query = query.where(Lead.qualification_status == qualification_status)
+        if engagement_level is not None:
+            query = query.where(Lead.engagement_level == engagement_level)
+        if cursor:
+            last_score, last_id = decode_cursor(cursor)
+            query = query.where(tuple_(Lead.lead_score, Lead.id) < tuple_(last_score, last_id))
+
+        query = query.order_by(Lead.lead_score.desc(), Lead.id.desc()).limit(limit + 1)
+        rows = (await db.execute(query)).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].lead_score, rows[-1].id)
+
+        return lead_serializer.rows_to_dicts(rows, fields), next_cursor
+
+    async def get_lead(self, db: AsyncSession, lead_id: int) -> Optional[Lead]:
+        """读取潜在客户详情，同时加载所属工厂和全部互动记录（共两条SQL）"""
+        query = select(Lead).options(*load_profile("lead_detail")).where(Lead.id == lead_id)
+        return (await db.execute(query)).unique().scalar_one_or_none()
+
+
+lead_repository = LeadRepository()
@@ -0,0 +1,273 @@
+import argparse
+import json
+import numpy as np
+from copy import deepcopy
+from typing import Dict, List, Any, Optional, Sequence
+import logging
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.lead import Lead
+from app.services.factory_stats import FactoryStatsDelta, factory_stats_service
+
+logger = logging.getLogger(__name__)
+
+
+# 默认评分规则，与原有逐条评分逻辑一致：每个字段按顺序匹配关键词，命中第一条即加分
+DEFAULT_SCORING_RULES: Dict[str, Any] = {
+    "base_score": 50.0,
+    "max_score": 100.0,
+    "fields": {
+        "company_size": [
+            (["1000+", "500+"], 20.0),
+            (["100-500", "200-500"], 15.0),
+            (["50-200", "100-200"], 10.0),
+        ],
+        "budget_range": [
+            (["高"], 15.0),
+            (["中高"], 10.0),
+            (["中等"], 5.0),
+        ],
+        "timeline": [
+            (["3-6个月"], 15.0),
+            (["6-12个月"], 10.0),
+            (["12个月以上"], 5.0),
+        ],
+    },
+    "min_qualified_score": 60.0,
+    "qualified_industries": ["消费电子", "家居用品", "汽车", "医疗设备", "工业设备"],
+}
+
+def load_scoring_rules(path: str) -> Dict[str, Any]:
+    """读取JSON评分规则，文件中的顶层项覆盖默认规则（fields 整体替换）"""
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    rules = deepcopy(DEFAULT_SCORING_RULES)
+    rules.update(overrides)
+    return rules
+
+
+def get_configured_rules() -> Dict[str, Any]:
+    """LEAD_SCORING_RULES_PATH 指定的评分规则，未配置或读取失败时使用默认规则"""
+    if not settings.LEAD_SCORING_RULES_PATH:
+        return deepcopy(DEFAULT_SCORING_RULES)
+    try:
+        return load_scoring_rules(settings.LEAD_SCORING_RULES_PATH)
+    except Exception as e:
+        logger.error(f"读取评分规则失败，使用默认规则: {e}")
+        return deepcopy(DEFAULT_SCORING_RULES)
+
+
+# 客户画像使用中文字段名，评分时映射到潜在客户的字段名
+PROFILE_FIELD_MAP = {
+    "公司规模": "company_size",
+    "预算范围": "budget_range",
+    "采购时间线": "timeline",
+    "行业类型": "industry",
+}
+
+ENCODED_FIELDS = ["company_size", "budget_range", "timeline", "industry"]
+
+# 重新评分和资格认证读取的列
+SCORING_COLUMNS = [
+    Lead.id, Lead.factory_id, Lead.qualification_status, Lead.company_name, Lead.contact_email,
+    *(getattr(Lead, field) for field in ENCODED_FIELDS)
+]
+
+
+class EncodedLeads:
+    """按列编码后的潜在客户数据
+
+    文本字段只在编码时处理一次，转为类别编码 + 类别表；规则变化时只需重新计算
+    类别表上的分值，再通过编码查表得到整列结果。
+    """
+
+    def __init__(self, codes: Dict[str, np.ndarray], categories: Dict[str, np.ndarray], has_contact: np.ndarray):
+        self.codes = codes
+        self.categories = categories
+        self.has_contact = has_contact
+
+    def __len__(self) -> int:
+        return len(self.has_contact)
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Sequence[Any]]) -> "EncodedLeads":
+        size = len(next(iter(columns.values()))) if columns else 0
+        codes = {}
+        categories = {}
+
+        for field in ENCODED_FIELDS:
+            # 用字典做因子化，单次遍历即可得到编码，避免对字符串整列排序
+            mapping: Dict[str, int] = {}
+            codes[field] = np.fromiter(
+                (mapping.setdefault(str(value or ""), len(mapping)) for value in columns.get(field, [""] * size)),
+                dtype=np.int32,
+                count=size
+            )
+            categories[field] = np.asarray(list(mapping), dtype=object)
+
+        has_name = np.fromiter((bool(v) for v in columns.get("company_name", [None] * size)), dtype=bool, count=size)
+        has_email = np.fromiter((bool(v) for v in columns.get("contact_email", [None] * size)), dtype=bool, count=size)
+
+        return cls(codes, categories, has_name & has_email)
+
+    @classmethod
+    def from_leads(cls, leads: List[Dict[str, Any]]) -> "EncodedLeads":
+        fields = ENCODED_FIELDS + ["company_name", "contact_email"]
+        return cls.from_columns({field: [lead.get(field) for lead in leads] for field in fields})
+
+    @classmethod
+    def from_profiles(cls, profiles: List[Dict[str, Any]]) -> "EncodedLeads":
+        columns = {
+            field: [profile.get(key) for profile in profiles]
+            for key, field in PROFILE_FIELD_MAP.items()
+        }
+        return cls.from_columns(columns)
+
+
+class LeadScoringEngine:
+    """批量潜在客户评分引擎"""
+
+    def __init__(self, rules: Optional[Dict[str, Any]] = None):
+        self.rules = deepcopy(rules or DEFAULT_SCORING_RULES)
+
+    def _category_points(self, field: str, categories: np.ndarray) -> np.ndarray:
+        """计算每个类别的得分（类别数远小于记录数）"""
+        points = np.zeros(len(categories), dtype=np.float64)
+        for index, category in enumerate(categories):
+            for keywords, value in self.rules["fields"].get(field, []):
+                if any(keyword in category for keyword in keywords):
+                    points[index] = value
+                    break
+        return points
+
+    def score(self, encoded: EncodedLeads) -> np.ndarray:
+        """计算整列评分"""
+        scores = np.full(len(encoded), self.rules["base_score"], dtype=np.float64)
+        for field in self.rules["fields"]:
+            if field not in encoded.codes:
+                continue
+            points = self._category_points(field, encoded.categories[field])
+            scores += points[encoded.codes[field]]
+        return np.minimum(scores, self.rules["max_score"])
+
+    def qualify(
+        self,
+        encoded: EncodedLeads,
+        scores: Optional[np.ndarray] = None,
+        min_score: Optional[float] = None
+    ) -> np.ndarray:
+        """计算整列资格认证结果；min_score 默认为规则中的 min_qualified_score"""
+        if scores is None:
+            scores = self.score(encoded)
+        if min_score is None:
+            min_score = self.rules["min_qualified_score"]
+        valid_industry = np.isin(encoded.categories["industry"], self.rules["qualified_industries"])
+        return (
+            encoded.has_contact
+            & (scores >= min_score)
+            & valid_industry[encoded.codes["industry"]]
+        )
+
+    def score_profiles(self, profiles: List[Dict[str, Any]]) -> np.ndarray:
+        return self.score(EncodedLeads.from_profiles(profiles))
+
+    def score_leads(self, leads: List[Dict[str, Any]]) -> np.ndarray:
+        return self.score(EncodedLeads.from_leads(leads))
+
+    def apply_scores(
+        self,
+        db: Session,
+        columns: Dict[str, Sequence[Any]],
+        scores: np.ndarray,
+        encoded: Optional[EncodedLeads] = None,
+        min_score: Optional[float] = None
+    ):
+        """写入一块已保存潜在客户的新评分，并按新评分重新认证资格（不提交）
+
+        columns 需包含 id、factory_id、qualification_status 以及资格认证用到的列。
+        评分不是按规则计算时（如模型评分），用 min_score 传入与之对应的资格分数线。
+        已标记为 hot 的客户只更新评分，不改变状态。资格状态的变化在同一事务中计入工厂统计。
+        """
+        if encoded is None:
+            encoded = EncodedLeads.from_columns(columns)
+        qualified = self.qualify(encoded, scores, min_score)
+        statuses = columns["qualification_status"]
+        new_statuses = np.where(
+            np.asarray(statuses, dtype=object) == "hot",
+            "hot",
+            np.where(qualified, "qualified", "unqualified")
+        )
+
+        db.execute(
+            update(Lead),
+            [
+                {"id": lead_id, "lead_score": float(score), "qualification_status": str(status)}
+                for lead_id, score, status in zip(columns["id"], scores, new_statuses)
+            ]
+        )
+        stats = FactoryStatsDelta()
+        for lead_factory_id, old_status, new_status in zip(columns["factory_id"], statuses, new_statuses):
+            stats.change_status(lead_factory_id, old_status, str(new_status))
+        factory_stats_service.apply(db, stats)
+
+    def rescore_stored_leads(
+        self,
+        db: Session,
+        factory_id: Optional[int] = None,
+        chunk_size: int = 20000
+    ) -> int:
+        """按当前规则重新计算数据库中潜在客户的评分和资格状态
+
+        按主键分块读取所需列，每块一次向量化计算并批量更新（见 apply_scores），每块提交一次。
+        """
+        names = [column.key for column in SCORING_COLUMNS]
+        last_id = 0
+        updated = 0
+
+        while True:
+            query = select(*SCORING_COLUMNS).where(Lead.id > last_id).order_by(Lead.id).limit(chunk_size)
+            if factory_id is not None:
+                query = query.where(Lead.factory_id == factory_id)
+            rows = db.execute(query).all()
+            if not rows:
+                break
+
+            columns = {name: [row[i] for row in rows] for i, name in enumerate(names)}
+            encoded = EncodedLeads.from_columns(columns)
+            self.apply_scores(db, columns, self.score(encoded), encoded)
+            db.commit()
+
+            updated += len(rows)
+            last_id = columns["id"][-1]
+            logger.info(f"已重新评分 {updated} 个潜在客户")
+
+        return updated
+
+
+lead_scoring_engine = LeadScoringEngine(get_configured_rules())
+
+
+def main():
+    from app.core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="按评分规则重新计算已保存潜在客户的评分和资格状态")
+    parser.add_argument("--factory-id", type=int, default=None)
+    parser.add_argument("--rules", default=settings.LEAD_SCORING_RULES_PATH,
+                        help="评分规则JSON文件，默认读取 LEAD_SCORING_RULES_PATH")
+    parser.add_argument("--chunk-size", type=int, default=20000)
+
+    args = parser.parse_args()
+    engine = LeadScoringEngine(load_scoring_rules(args.rules) if args.rules else None)
+    db = SessionLocal()
+    try:
+        updated = engine.rescore_stored_leads(db, factory_id=args.factory_id, chunk_size=args.chunk_size)
+        print(f"✅ 已重新评分 {updated} 个潜在客户")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
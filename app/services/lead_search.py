@@ -0,0 +1,179 @@
+import argparse
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+from sqlalchemy import select, update, func, tuple_, union_all, literal_column, table, column, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.text_search import query_tokens
+from app.models.lead import Lead, LeadInteraction, lead_search_text, interaction_search_text, search_vector
+from app.services.lead_repository import lead_serializer, encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# 只在互动记录中命中的客户，排序时降低权重
+INTERACTION_WEIGHT = 0.5
+
+
+class InvalidSearchQueryError(ValueError):
+    """检索语句中没有可检索的词"""
+
+
+class LeadSearch:
+    """潜在客户全文检索
+
+    检索范围为潜在客户的公司名称、业务需求、产品需求，以及其互动记录的主题和内容。
+    写入时把这些字段切分为词元存入 search_text 列（见 app/core/text_search.py），
+    SQLite 使用 FTS5 + bm25 排序，PostgreSQL 使用 tsvector GIN 索引 + ts_rank_cd 排序，
+    两者对外行为一致。结果按相关度降序，使用 (相关度, id) 游标分页。
+    """
+
+    def _sqlite_hits(self, tokens: List[str]):
+        match = " ".join(f'"{token}"*' for token in tokens)
+        leads_fts = table("leads_fts", column("rowid"))
+        interactions_fts = table("lead_interactions_fts", column("rowid"))
+
+        lead_hits = select(
+            leads_fts.c.rowid.label("lead_id"),
+            (-func.bm25(literal_column("leads_fts"))).label("score")
+        ).where(literal_column("leads_fts").op("MATCH")(match))
+
+        interaction_hits = select(
+            LeadInteraction.lead_id.label("lead_id"),
+            (-func.bm25(literal_column("lead_interactions_fts")) * INTERACTION_WEIGHT).label("score")
+        ).select_from(
+            interactions_fts.join(LeadInteraction, LeadInteraction.id == interactions_fts.c.rowid)
+        ).where(literal_column("lead_interactions_fts").op("MATCH")(match))
+
+        return lead_hits, interaction_hits
+
+    def _postgresql_hits(self, tokens: List[str]):
+        query = func.to_tsquery(text("'simple'"), " & ".join(f"{token}:*" for token in tokens))
+        lead_vector = search_vector(Lead.search_text)
+        interaction_vector = search_vector(LeadInteraction.search_text)
+
+        lead_hits = select(
+            Lead.id.label("lead_id"),
+            func.ts_rank_cd(lead_vector, query).label("score")
+        ).where(lead_vector.op("@@")(query))
+
+        interaction_hits = select(
+            LeadInteraction.lead_id.label("lead_id"),
+            (func.ts_rank_cd(interaction_vector, query) * INTERACTION_WEIGHT).label("score")
+        ).where(interaction_vector.op("@@")(query))
+
+        return lead_hits, interaction_hits
+
+    async def search(
+        self,
+        db: AsyncSession,
+        query: str,
+        factory_id: Optional[int] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """返回 (当前页潜在客户, 下一页游标)，每条结果附带 search_score"""
+        tokens = query_tokens(query)
+        if not tokens:
+            raise InvalidSearchQueryError(f"检索语句中没有可检索的词: {query}")
+
+        if db.bind.dialect.name == "postgresql":
+            lead_hits, interaction_hits = self._postgresql_hits(tokens)
+        else:
+            lead_hits, interaction_hits = self._sqlite_hits(tokens)
+
+        hits = union_all(lead_hits, interaction_hits).subquery()
+        ranked = (
+            select(hits.c.lead_id, func.max(hits.c.score).label("score"))
+            .group_by(hits.c.lead_id)
+            .subquery()
+        )
+
+        page_query = select(ranked.c.lead_id, ranked.c.score)
+        if factory_id is not None:
+            page_query = page_query.join(Lead, Lead.id == ranked.c.lead_id).where(Lead.factory_id == factory_id)
+        if cursor:
+            last_score, last_id = decode_cursor(cursor)
+            page_query = page_query.where(tuple_(ranked.c.score, ranked.c.lead_id) < tuple_(last_score, last_id))
+        page_query = page_query.order_by(ranked.c.score.desc(), ranked.c.lead_id.desc()).limit(limit + 1)
+
+        page = (await db.execute(page_query)).all()
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1].score, page[-1].lead_id)
+        if not page:
+            return [], None
+
+        rows = (await db.execute(
+            select(*lead_serializer.select_columns(fields, required=("id",)))
+            .where(Lead.id.in_([hit.lead_id for hit in page]))
+        )).all()
+        leads = {row.id: lead for row, lead in zip(rows, lead_serializer.rows_to_dicts(rows, fields))}
+
+        results = []
+        for hit in page:
+            lead = leads.get(hit.lead_id)
+            if lead is not None:
+                results.append({**lead, "search_score": round(float(hit.score), 6)})
+        return results, next_cursor
+
+    def rebuild(self, db: Session, chunk_size: int = 5000, commit: bool = True) -> int:
+        """重新计算所有检索词元并重建索引（检索规则变化或旧数据迁移后执行）
+
+        commit=False 时不提交，由调用方在同一事务中提交（升级表结构时使用）。
+        """
+        rebuilt = 0
+        for model, columns, build in (
+            (Lead, (Lead.company_name, Lead.business_needs, Lead.product_requirements), lead_search_text),
+            (LeadInteraction, (LeadInteraction.subject, LeadInteraction.content, LeadInteraction.response_content),
+             interaction_search_text),
+        ):
+            last_id = 0
+            while True:
+                rows = db.execute(
+                    select(model.id, *columns).where(model.id > last_id).order_by(model.id).limit(chunk_size)
+                ).all()
+                if not rows:
+                    break
+                db.execute(update(model), [
+                    {"id": row.id, "search_text": build(dict(row._mapping))} for row in rows
+                ])
+                if commit:
+                    db.commit()
+                rebuilt += len(rows)
+                last_id = rows[-1].id
+
+        if db.get_bind().dialect.name == "sqlite":
+            for fts in ("leads_fts", "lead_interactions_fts"):
+                db.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+            if commit:
+                db.commit()
+
+        logger.info(f"全文检索索引重建完成，共 {rebuilt} 条记录")
+        return rebuilt
+
+
+lead_search = LeadSearch()
+
+
+def main():
+    from app.core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="潜在客户全文检索索引维护")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild")
+
+    parser.parse_args()
+    db = SessionLocal()
+    try:
+        rebuilt = lead_search.rebuild(db)
+        print(f"✅ 已重建 {rebuilt} 条记录的检索索引")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
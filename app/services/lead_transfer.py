@@ -0,0 +1,434 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import importlib.util
+import io
+import json
+from datetime import datetime
+from typing import Dict, List, Any, Optional, AsyncIterator, Callable, Iterator
+import logging
+
+import orjson
+from sqlalchemy import select, Boolean, Integer, Float, DateTime, JSON
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db_sync
+from app.core.serialization import ModelSerializer
+from app.core.sqlite_writer import sqlite_writer
+from app.models.factory import Factory
+from app.models.lead import Lead
+from app.services.blacklist import blacklist_registry
+from app.services.lead_dedup import lead_dedup_index
+from app.services.lead_persistence import LEAD_COLUMNS, lead_persistence
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+IMPORT_FORMATS = ("ndjson", "csv")
+# Parquet只能写入文件（文件尾部保存元数据），依赖可选的 pyarrow
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+lead_export_serializer = ModelSerializer(Lead, exclude=("search_text",))
+
+
+class LeadImportError(ValueError):
+    """导入请求本身无效（格式不支持、工厂不存在等）"""
+
+
+class ExportFormatUnavailableError(ValueError):
+    """导出格式依赖的可选组件未安装"""
+
+
+def parquet_available() -> bool:
+    """是否安装了Parquet导出需要的 pyarrow"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+# ---------------------------------------------------------------------------
+# 导出
+# ---------------------------------------------------------------------------
+
+async def iter_lead_chunks(
+    factory_id: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    chunk_size: Optional[int] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """按主键键集分页读取潜在客户，每次产出一块
+
+    每块使用独立的会话，块与块之间不占用连接，也不保持长事务；下游消费慢时数据库无压力。
+    """
+    chunk_size = chunk_size or settings.LEAD_EXPORT_CHUNK_SIZE
+    columns = lead_export_serializer.select_columns(fields, required=("id",))
+    last_id = 0
+
+    while True:
+        query = select(*columns).where(Lead.id > last_id).order_by(Lead.id).limit(chunk_size)
+        if factory_id is not None:
+            query = query.where(Lead.factory_id == factory_id)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        yield lead_export_serializer.rows_to_dicts(rows, fields)
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode("utf-8")
+    return value
+
+
+async def stream_ndjson(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        yield b"".join(orjson.dumps(row) + b"\n" for row in chunk)
+
+
+async def stream_csv(
+    chunks: AsyncIterator[List[Dict[str, Any]]],
+    fields: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    header = fields or lead_export_serializer.field_names
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    async for chunk in chunks:
+        writer.writerows([_csv_value(row[name]) for name in header] for row in chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_export(
+    export_format: str,
+    factory_id: Optional[int] = None,
+    fields: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    """返回导出内容的字节流（用于 StreamingResponse）"""
+    if fields is not None:
+        # 提前校验字段，避免响应开始后才报错
+        lead_export_serializer.select_columns(fields)
+    chunks = iter_lead_chunks(factory_id, fields)
+    if export_format == "csv":
+        return stream_csv(chunks, fields)
+    return stream_ndjson(chunks)
+
+
+def _arrow_schema(fields: List[str]):
+    import pyarrow as pa
+
+    types = []
+    for name in fields:
+        column_type = lead_export_serializer.columns[name].type
+        if isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column_type, DateTime):
+            arrow_type = pa.timestamp("us", tz="UTC" if column_type.timezone else None)
+        else:
+            # 字符串；JSON列以JSON文本保存
+            arrow_type = pa.string()
+        types.append(pa.field(name, arrow_type))
+    return pa.schema(types)
+
+
+async def export_parquet(path: str, factory_id: Optional[int] = None, fields: Optional[List[str]] = None) -> int:
+    """导出为Parquet文件，每块数据写为一个row group，内存占用与总行数无关（需要安装pyarrow）"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ExportFormatUnavailableError("Parquet导出不可用：需要安装可选依赖 pyarrow") from e
+
+    names = fields or lead_export_serializer.field_names
+    schema = _arrow_schema(names)
+    json_fields = [name for name in names if isinstance(lead_export_serializer.columns[name].type, JSON)]
+
+    exported = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        async for chunk in iter_lead_chunks(factory_id, fields):
+            for row in chunk:
+                for name in json_fields:
+                    if row[name] is not None:
+                        row[name] = orjson.dumps(row[name]).decode("utf-8")
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            exported += len(chunk)
+
+    logger.info(f"已导出 {exported} 个潜在客户到 {path}")
+    return exported
+
+
+# ---------------------------------------------------------------------------
+# 导入
+# ---------------------------------------------------------------------------
+
+def _column_coercers() -> Dict[str, Callable[[Any], Any]]:
+    def to_bool(value):
+        return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "y", "t")
+
+    def to_datetime(value):
+        return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+    def to_json(value):
+        if not isinstance(value, str):
+            return value
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    coercers = {}
+    for name in LEAD_COLUMNS:
+        column_type = Lead.__table__.columns[name].type
+        if isinstance(column_type, Boolean):
+            coercers[name] = to_bool
+        elif isinstance(column_type, Integer):
+            coercers[name] = lambda value: int(float(value))
+        elif isinstance(column_type, Float):
+            coercers[name] = float
+        elif isinstance(column_type, DateTime):
+            coercers[name] = to_datetime
+        elif isinstance(column_type, JSON):
+            coercers[name] = to_json
+        else:
+            coercers[name] = str
+    return coercers
+
+
+_COERCERS = _column_coercers()
+# 导入时由服务端决定的字段
+_IMPORT_IGNORED = {"factory_id", "company_key", "website_domain", "search_text"}
+
+
+def coerce_lead(record: Dict[str, Any], factory_id: int) -> Dict[str, Any]:
+    """把导入的一条记录转换为潜在客户字典，未知字段忽略，空字符串视为空值"""
+    lead = {"factory_id": factory_id}
+    for name, value in record.items():
+        coerce = _COERCERS.get(name)
+        if coerce is None or name in _IMPORT_IGNORED or value is None or value == "":
+            continue
+        lead[name] = coerce(value)
+    if not lead.get("company_name"):
+        raise ValueError("缺少 company_name")
+    return lead
+
+
+class _RecordSplitter:
+    """把分块到达的文本切分为完整记录
+
+    NDJSON 按行切分；CSV 的字段内可能含换行，引号数量为偶数时才算一条完整记录。
+    """
+
+    def __init__(self, quoted: bool):
+        self.quoted = quoted
+        self.decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.pending = ""
+        self.record: List[str] = []
+        self.quotes = 0
+
+    def _split(self, text: str) -> Iterator[str]:
+        lines = (self.pending + text).split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            if not self.quoted:
+                yield line
+                continue
+            self.record.append(line)
+            self.quotes += line.count('"')
+            if self.quotes % 2 == 0:
+                yield "\n".join(self.record)
+                self.record = []
+                self.quotes = 0
+
+    def feed(self, data: bytes) -> Iterator[str]:
+        return self._split(self.decoder.decode(data))
+
+    def close(self) -> Iterator[str]:
+        text = self.decoder.decode(b"", final=True)
+        yield from self._split(text + "\n")
+        if self.record:
+            yield "\n".join(self.record)
+
+
+class LeadImporter:
+    """流式导入潜在客户
+
+    边接收边解析，每凑满 LEAD_IMPORT_BATCH_SIZE 条就按生成流程的同一路径处理：
+    黑名单过滤 -> 去重 -> 批量写入。任一时刻只在内存中保留一个批次。
+    """
+
+    def __init__(self, factory_id: int, import_format: str, batch_size: Optional[int] = None):
+        if import_format not in IMPORT_FORMATS:
+            raise LeadImportError(f"不支持的导入格式: {import_format}")
+        self.factory_id = factory_id
+        self.import_format = import_format
+        self.batch_size = batch_size or settings.LEAD_IMPORT_BATCH_SIZE
+        self.splitter = _RecordSplitter(quoted=import_format == "csv")
+        self.header: Optional[List[str]] = None
+        self.batch: List[Dict[str, Any]] = []
+        self.line = 0
+
+        self.received = 0
+        self.rejected = 0
+        self.blacklisted = 0
+        self.duplicates = 0
+        self.written = 0
+        self.errors: List[str] = []
+
+    def _parse(self, record: str) -> Optional[Dict[str, Any]]:
+        if not record.strip():
+            return None
+        if self.import_format == "ndjson":
+            return orjson.loads(record)
+        values = next(csv.reader([record]))
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            return None
+        return dict(zip(self.header, values))
+
+    def _add_records(self, records: Iterator[str]) -> List[List[Dict[str, Any]]]:
+        """解析记录并返回已凑满的批次"""
+        ready = []
+        for record in records:
+            self.line += 1
+            try:
+                parsed = self._parse(record)
+                if parsed is None:
+                    continue
+                self.received += 1
+                self.batch.append(coerce_lead(parsed, self.factory_id))
+            except Exception as e:
+                self.rejected += 1
+                if len(self.errors) < 20:
+                    self.errors.append(f"第 {self.line} 条记录: {e}")
+                continue
+            if len(self.batch) >= self.batch_size:
+                ready.append(self.batch)
+                self.batch = []
+        return ready
+
+    def _write_batch(self, leads: List[Dict[str, Any]]):
+        """黑名单过滤、去重并写入一批（在线程中执行）"""
+        allowed = blacklist_registry.filter_leads(self.factory_id, leads)
+        self.blacklisted += len(leads) - len(allowed)
+
+        if settings.LEAD_DEDUP_ENABLED:
+            db = get_db_sync()
+            try:
+                lead_dedup_index.load_stored_leads(db, self.factory_id)
+            finally:
+                db.close()
+            unique = lead_dedup_index.deduplicate(self.factory_id, allowed)
+            self.duplicates += len(allowed) - len(unique)
+            allowed = unique
+        try:
+            self.written += sqlite_writer.write(lambda db: lead_persistence.write_leads(db, allowed, commit=False))
+        except Exception:
+            lead_dedup_index.forget_leads(self.factory_id, allowed)
+            raise
+
+    async def _check_factory(self):
+        async with AsyncSessionLocal() as db:
+            exists = (await db.execute(select(Factory.id).where(Factory.id == self.factory_id))).scalar()
+        if exists is None:
+            raise LeadImportError(f"工厂 {self.factory_id} 不存在")
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        await self._check_factory()
+        async for data in chunks:
+            for batch in self._add_records(self.splitter.feed(data)):
+                await asyncio.to_thread(self._write_batch, batch)
+
+        for batch in self._add_records(self.splitter.close()):
+            await asyncio.to_thread(self._write_batch, batch)
+        if self.batch:
+            await asyncio.to_thread(self._write_batch, self.batch)
+            self.batch = []
+
+        logger.info(
+            f"工厂 {self.factory_id} 导入完成: 收到 {self.received}，写入 {self.written}，"
+            f"重复 {self.duplicates}，黑名单 {self.blacklisted}，无效 {self.rejected}"
+        )
+        return self.get_result()
+
+    def get_result(self) -> Dict[str, Any]:
+        return {
+            "factory_id": self.factory_id,
+            "received": self.received,
+            "written": self.written,
+            "duplicates": self.duplicates,
+            "blacklisted": self.blacklisted,
+            "rejected": self.rejected,
+            "errors": self.errors
+        }
+
+
+# ---------------------------------------------------------------------------
+# 命令行（夜间CRM同步等离线任务）
+# ---------------------------------------------------------------------------
+
+async def _read_file(path: str, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            data = await asyncio.to_thread(f.read, chunk_size)
+            if not data:
+                break
+            yield data
+
+
+async def _export_file(export_format: str, path: str, factory_id: Optional[int], fields: Optional[List[str]]):
+    if export_format == "parquet":
+        await export_parquet(path, factory_id, fields)
+        return
+    with open(path, "wb") as f:
+        async for data in stream_export(export_format, factory_id, fields):
+            await asyncio.to_thread(f.write, data)
+
+
+def main():
+    from app.core.serialization import parse_fields
+
+    parser = argparse.ArgumentParser(description="潜在客户批量导入导出")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--format", choices=[*EXPORT_FORMATS, "parquet"], default="ndjson")
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--factory-id", type=int, default=None)
+    export_parser.add_argument("--fields", default=None)
+
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("--format", choices=IMPORT_FORMATS, default="ndjson")
+    import_parser.add_argument("--input", required=True)
+    import_parser.add_argument("--factory-id", type=int, required=True)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        try:
+            asyncio.run(_export_file(args.format, args.output, args.factory_id, parse_fields(args.fields)))
+        except ExportFormatUnavailableError as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        print(f"✅ 已导出到 {args.output}")
+    else:
+        result = asyncio.run(LeadImporter(args.factory_id, args.format).run(_read_file(args.input)))
+        print(f"✅ 导入完成: {result}")
+
+
+if __name__ == "__main__":
+    main()
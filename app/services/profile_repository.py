@@ -0,0 +1,261 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterable
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.serialization import ModelSerializer
+from app.core.sqlite_writer import sqlite_writer
+from app.models.factory import Factory
+from app.models.lead import Lead
+from app.services.template_renderer import template_engine
+from app.services.blacklist import blacklist_registry
+
+logger = logging.getLogger(__name__)
+
+# 生成内容时使用的工厂档案字段（黑名单由 blacklist_registry 单独缓存）
+FACTORY_PROFILE_FIELDS = [
+    "id", "name", "website", "description", "location", "established_year", "employee_count",
+    "main_products", "product_categories", "core_advantages", "competitive_position",
+    "certifications", "quality_system", "ideal_customer_profile", "target_markets",
+    "target_industries", "contact_person", "contact_title"
+]
+
+# 确认工厂档案时可以写入的字段
+FACTORY_WRITABLE_FIELDS = [
+    "name", "website", "description", "location", "main_products", "core_advantages",
+    "competitive_position", "certifications", "ideal_customer_profile", "target_markets",
+    "target_industries", "contact_person", "contact_title", "blacklisted_companies"
+]
+
+# 生成个性化内容时使用的潜在客户字段（不含ID和评分等，避免影响语义缓存的特征文本）
+LEAD_PROFILE_FIELDS = [
+    "company_name", "website", "industry", "company_size", "location", "contact_name",
+    "contact_title", "contact_email", "business_needs", "product_requirements"
+]
+
+
+class ProfileNotFoundError(LookupError):
+    """工厂或潜在客户不存在"""
+
+
+class _CachedProfile:
+    __slots__ = ("value", "version", "checked_at")
+
+    def __init__(self, value: Dict[str, Any], version: Any, checked_at: float):
+        self.value = value
+        self.version = version
+        self.checked_at = checked_at
+
+
+class ProfileCache:
+    """按ID读穿透的档案LRU缓存
+
+    以 updated_at 作为版本号：缓存超过 refresh_s 未确认时只查询版本列，版本未变继续使用缓存，
+    变化后才重新读取整行。同一批ID的确认和读取各合并为一条SQL，同一ID的并发读取合并为一次。
+    缓存中的档案只包含可直接序列化为JSON的字段，返回给调用方的是副本。
+    """
+
+    def __init__(self, model: Any, fields: List[str], max_entries: int, refresh_s: float):
+        self.model = model
+        self.fields = fields
+        self.serializer = ModelSerializer(model)
+        self.max_entries = max_entries
+        self.refresh_s = refresh_s
+        self.entries: "OrderedDict[int, _CachedProfile]" = OrderedDict()
+        self.in_flight: Dict[int, asyncio.Future] = {}
+        self.epoch = 0  # 每次失效加一，失效前开始的读取结果不写入缓存
+
+        # 指标
+        self.hits = 0
+        self.coalesced = 0
+        self.version_checks = 0
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    async def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        return (await self.get_many([profile_id])).get(profile_id)
+
+    async def get_many(self, profile_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """批量获取档案，返回 ID -> 档案，不存在的ID不在结果中"""
+        results: Dict[int, Optional[Dict[str, Any]]] = {}
+        waiting: Dict[int, asyncio.Future] = {}
+        stale: Dict[int, _CachedProfile] = {}
+        missing: List[int] = []
+        now = time.monotonic()
+
+        for profile_id in dict.fromkeys(profile_ids):
+            entry = self.entries.get(profile_id)
+            if entry is not None and now - entry.checked_at < self.refresh_s:
+                self.hits += 1
+                self.entries.move_to_end(profile_id)
+                results[profile_id] = entry.value
+            elif profile_id in self.in_flight:
+                self.coalesced += 1
+                waiting[profile_id] = self.in_flight[profile_id]
+            else:
+                self.in_flight[profile_id] = asyncio.get_running_loop().create_future()
+                if entry is not None:
+                    stale[profile_id] = entry
+                else:
+                    missing.append(profile_id)
+
+        fetching = {profile_id: self.in_flight[profile_id] for profile_id in [*stale, *missing]}
+        if fetching:
+            try:
+                fetched = await self._fetch(stale, missing)
+                for profile_id, future in fetching.items():
+                    future.set_result(fetched.get(profile_id))
+            except BaseException as e:
+                for future in fetching.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        future.exception()  # 没有其他等待者时不报未读取的异常
+                raise
+            finally:
+                for profile_id, future in fetching.items():
+                    if self.in_flight.get(profile_id) is future:
+                        del self.in_flight[profile_id]
+            results.update(fetched)
+
+        for profile_id, future in waiting.items():
+            results[profile_id] = await asyncio.shield(future)
+
+        return {profile_id: dict(value) for profile_id, value in results.items() if value is not None}
+
+    async def _fetch(self, stale: Dict[int, _CachedProfile], missing: List[int]) -> Dict[int, Dict[str, Any]]:
+        epoch = self.epoch
+        fetched: Dict[int, Dict[str, Any]] = {}
+        to_load = list(missing)
+
+        async with AsyncSessionLocal() as db:
+            if stale:
+                self.version_checks += 1
+                versions = dict((await db.execute(
+                    select(self.model.id, self.model.updated_at).where(self.model.id.in_(list(stale)))
+                )).all())
+                checked_at = time.monotonic()
+                for profile_id, entry in stale.items():
+                    if profile_id in versions and versions[profile_id] == entry.version:
+                        entry.checked_at = checked_at
+                        fetched[profile_id] = entry.value
+                    else:
+                        to_load.append(profile_id)
+
+            if to_load:
+                self.loads += 1
+                rows = (await db.execute(
+                    select(*self.serializer.select_columns(self.fields, required=("id", "updated_at")))
+                    .where(self.model.id.in_(to_load))
+                )).all()
+                for row, value in zip(rows, self.serializer.rows_to_dicts(rows, self.fields)):
+                    fetched[row.id] = value
+                    if self.epoch == epoch:
+                        self._put(row.id, value, row.updated_at)
+
+        for profile_id in to_load:
+            if profile_id not in fetched:
+                self.entries.pop(profile_id, None)
+        return fetched
+
+    def _put(self, profile_id: int, value: Dict[str, Any], version: Any):
+        self.entries[profile_id] = _CachedProfile(value, version, time.monotonic())
+        self.entries.move_to_end(profile_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, profile_id: int):
+        self.epoch += 1
+        self.entries.pop(profile_id, None)
+        self.in_flight.pop(profile_id, None)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "cached": len(self.entries),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "version_checks": self.version_checks,
+            "loads": self.loads
+        }
+
+
+class ProfileRepository:
+    """工厂与潜在客户档案
+
+    生成内容等服务统一从这里读取档案，同一工厂在一次批量开发中只从数据库读取一次。
+    工厂档案通过 save_factory 更新时，同时失效档案缓存、已编译的个性化模板和黑名单；
+    其他进程的更新在 PROFILE_CACHE_REFRESH_S 内通过 updated_at 版本检查发现。
+    """
+
+    def __init__(self, refresh_s: float, factory_max_entries: int, lead_max_entries: int):
+        self.factories = ProfileCache(Factory, FACTORY_PROFILE_FIELDS, factory_max_entries, refresh_s)
+        self.leads = ProfileCache(Lead, LEAD_PROFILE_FIELDS, lead_max_entries, refresh_s)
+
+    async def get_factory(self, factory_id: int) -> Dict[str, Any]:
+        factory = await self.factories.get(factory_id)
+        if factory is None:
+            raise ProfileNotFoundError(f"工厂 {factory_id} 不存在")
+        return factory
+
+    async def get_lead(self, lead_id: int) -> Dict[str, Any]:
+        lead = await self.leads.get(lead_id)
+        if lead is None:
+            raise ProfileNotFoundError(f"潜在客户 {lead_id} 不存在")
+        return lead
+
+    async def get_leads(self, lead_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """批量读取潜在客户档案（批量开发前预热缓存）"""
+        return await self.leads.get_many(lead_ids)
+
+    async def save_factory(self, factory_data: Dict[str, Any]) -> Dict[str, Any]:
+        """创建或更新工厂档案（按 id，其次按网站匹配已有工厂），返回保存后的完整档案"""
+        factory_id = factory_data.get("id")
+        values = {field: factory_data[field] for field in FACTORY_WRITABLE_FIELDS if field in factory_data}
+        values["profile_completed"] = True
+
+        def save(db: Session) -> Dict[str, Any]:
+            factory = db.get(Factory, factory_id) if factory_id is not None else None
+            if factory is None:
+                factory = db.execute(
+                    select(Factory).where(Factory.website == values.get("website"))
+                ).scalar_one_or_none()
+            if factory is None:
+                factory = Factory(**values)
+                db.add(factory)
+            else:
+                for field, value in values.items():
+                    setattr(factory, field, value)
+            db.flush()
+            db.refresh(factory)
+            return factory.to_dict()
+
+        factory = await sqlite_writer.write_async(save)
+        self.invalidate_factory(factory["id"])
+        logger.info(f"工厂 {factory['id']} 档案已保存")
+        return factory
+
+    def invalidate_factory(self, factory_id: int):
+        """工厂档案更新后调用"""
+        self.factories.invalidate(factory_id)
+        template_engine.invalidate(factory_id)
+        blacklist_registry.invalidate(factory_id)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "factories": self.factories.get_metrics(),
+            "leads": self.leads.get_metrics()
+        }
+
+
+profile_repository = ProfileRepository(
+    refresh_s=settings.PROFILE_CACHE_REFRESH_S,
+    factory_max_entries=settings.FACTORY_PROFILE_CACHE_MAX_ENTRIES,
+    lead_max_entries=settings.LEAD_PROFILE_CACHE_MAX_ENTRIES
+)
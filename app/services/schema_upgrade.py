@@ -0,0 +1,180 @@
+from typing import Dict, List, Any
+import logging
+
+from sqlalchemy import Column, Table, func, inspect, literal, select, update, text
+from sqlalchemy.orm import Session
+
+from app.core.database import Base, SessionLocal
+from app.models.lead import Lead, LeadInteraction, SQLITE_SEARCH_TABLES, sqlite_search_ddl
+from app.services.factory_stats import factory_stats_service
+from app.services.lead_dedup import LeadDedupIndex
+from app.services.lead_search import lead_search
+
+logger = logging.getLogger(__name__)
+
+# 去重键唯一索引，最后创建：存在即说明已有客户的去重键已回填
+COMPANY_KEY_INDEX = "ix_leads_factory_company_key"
+
+
+def _column_ddl(db: Session, table: Table, column: Column) -> str:
+    """ALTER TABLE ... ADD COLUMN 语句；新增列都可为空，标量默认值写入已有行"""
+    dialect = db.get_bind().dialect
+    preparer = dialect.identifier_preparer
+    ddl = (
+        f"ALTER TABLE {preparer.format_table(table)} "
+        f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+    )
+    default = column.default
+    if default is not None and default.is_scalar:
+        value = literal(default.arg).compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+        ddl += f" DEFAULT {value}"
+    return ddl
+
+
+class SchemaUpgrade:
+    """把旧版本创建的数据库升级到当前表结构
+
+    Base.metadata.create_all 只创建不存在的表，不会修改已有的表。应用启动时在 init_db 之后、
+    迁移沟通历史之前执行：创建缺少的表，为已有的表补齐新增的列（ALTER TABLE ADD COLUMN）和索引，
+    SQLite 上补建全文检索表和触发器，并回填新列的数据（去重键、互动摘要、检索词元），
+    最后重算工厂统计。所有表结构变更和回填在同一事务中提交，已是最新结构时不做任何修改，
+    可以重复执行。
+    """
+
+    def _add_missing_columns(self, db: Session) -> Dict[str, List[str]]:
+        inspector = inspect(db.connection())
+        existing_tables = set(inspector.get_table_names())
+        added: Dict[str, List[str]] = {}
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    db.execute(text(_column_ddl(db, table, column)))
+                    added.setdefault(table.name, []).append(column.name)
+        return added
+
+    def _backfill_company_keys(self, db: Session, chunk_size: int) -> int:
+        """计算已有客户的去重键；同一工厂内重复的客户只保留最早一条的去重键，以便创建唯一索引"""
+        seen = set()
+        last_id = 0
+        filled = 0
+        while True:
+            rows = db.execute(
+                select(Lead.id, Lead.factory_id, Lead.company_name, Lead.website, Lead.contact_email)
+                .where(Lead.id > last_id)
+                .order_by(Lead.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                lead = dict(row._mapping)
+                LeadDedupIndex.identity(lead)
+                key = (lead["factory_id"], lead["company_key"])
+                if lead["company_key"] and key in seen:
+                    lead["company_key"] = None
+                seen.add(key)
+                updates.append({"id": lead["id"], "company_key": lead["company_key"],
+                                "website_domain": lead["website_domain"]})
+            db.execute(update(Lead), updates)
+            filled += len(updates)
+            last_id = rows[-1].id
+        return filled
+
+    def _backfill_interaction_summaries(self, db: Session):
+        """按已有的互动记录计算客户摘要"""
+        def latest(column, *conditions):
+            return (
+                select(column)
+                .where(LeadInteraction.lead_id == Lead.id, *conditions)
+                .order_by(LeadInteraction.created_at.desc(), LeadInteraction.id.desc())
+                .limit(1)
+                .scalar_subquery()
+            )
+
+        def count(*conditions):
+            return select(func.count()).where(LeadInteraction.lead_id == Lead.id, *conditions).scalar_subquery()
+
+        db.execute(
+            update(Lead)
+            .values(
+                interaction_count=count(),
+                response_count=count(LeadInteraction.response_received.is_(True)),
+                last_interaction_at=latest(LeadInteraction.created_at),
+                last_interaction_type=latest(LeadInteraction.interaction_type),
+                last_response_sentiment=latest(
+                    LeadInteraction.response_sentiment, LeadInteraction.response_sentiment.isnot(None)
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def _upgrade(self, db: Session, chunk_size: int) -> Dict[str, Any]:
+        """执行升级（由调用方提交），返回新增的列、索引和是否重建了检索索引"""
+        Base.metadata.create_all(db.connection())
+        added = self._add_missing_columns(db)
+        lead_columns = set(added.get("leads", []))
+
+        inspector = inspect(db.connection())
+        existing_tables = set(inspector.get_table_names())
+        if "leads" in existing_tables and COMPANY_KEY_INDEX not in {
+            index["name"] for index in inspector.get_indexes("leads")
+        }:
+            self._backfill_company_keys(db, chunk_size)
+        if "interaction_count" in lead_columns:
+            self._backfill_interaction_summaries(db)
+
+        created_indexes = []
+        upgraded_tables = [table for table in Base.metadata.sorted_tables if table.name in existing_tables]
+        for table in upgraded_tables:
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    # 只适用于其他数据库的索引（ddl_if）会被跳过，下面按实际建成的索引记录
+                    index.create(db.connection(), checkfirst=True)
+                    created_indexes.append(index.name)
+        if created_indexes:
+            inspector = inspect(db.connection())
+            built = {index["name"] for table in upgraded_tables for index in inspector.get_indexes(table.name)}
+            created_indexes = [name for name in created_indexes if name in built]
+
+        rebuild_search = any("search_text" in columns for columns in added.values())
+        triggers = []
+        if db.get_bind().dialect.name == "sqlite":
+            for table_name, fts_name in SQLITE_SEARCH_TABLES:
+                if fts_name not in existing_tables:
+                    rebuild_search = True
+                create_table, *create_triggers = sqlite_search_ddl(table_name, fts_name)
+                db.execute(text(create_table))
+                triggers.extend(create_triggers)
+        if rebuild_search:
+            lead_search.rebuild(db, chunk_size=chunk_size, commit=False)
+        # 触发器在回填检索词元之后创建：对未建索引的行执行FTS删除会破坏外部内容索引
+        for statement in triggers:
+            db.execute(text(statement))
+
+        return {"columns": added, "indexes": created_indexes, "search_rebuilt": rebuild_search}
+
+    def upgrade(self, chunk_size: int = 5000) -> Dict[str, Any]:
+        """升级表结构并回填数据；有变更时重算工厂统计（新增的统计表和计数列从明细表得出）"""
+        db = SessionLocal()
+        try:
+            changes = self._upgrade(db, chunk_size)
+            db.commit()
+            if changes["columns"]:
+                factory_stats_service.reconcile(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if changes["columns"] or changes["indexes"] or changes["search_rebuilt"]:
+            logger.info(f"数据库表结构已升级: {changes}")
+        return changes
+
+
+schema_upgrade = SchemaUpgrade()
@@ -0,0 +1,220 @@
+from jinja2 import Environment, StrictUndefined, Template, TemplateError
+from typing import Dict, List, Any, Optional
+import logging
+import threading
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# 潜在客户槽位定义：槽位名 -> (类型, 是否必填, 最大长度)
+LEAD_SLOTS = {
+    "company_name": (str, True, 120),
+    "industry": (str, True, 60),
+    "business_needs": (str, True, 300),
+    "contact_name": (str, False, 80),
+    "contact_title": (str, False, 80),
+    "location": (str, False, 120),
+    "company_size": (str, False, 60),
+    "product_requirements": (list, False, 5),
+}
+
+EMAIL_SUBJECT_TEMPLATE = "{{ factory.name }} x {{ lead.company_name }}：{{ lead.industry }}制造合作机会"
+
+EMAIL_TEMPLATE = """尊敬的{{ lead.contact_name or '采购负责人' }}{% if lead.contact_title %}（{{ lead.contact_title }}）{% endif %}：
+
+您好！我是{{ factory.name }}的{{ factory.contact_person or '业务代表' }}，我们的工厂位于{{ factory.location or '中国' }}。
+了解到{{ lead.company_name }}{% if lead.location %}在{{ lead.location }}{% endif %}专注于{{ lead.business_needs }}，我们在{{ lead.industry }}领域拥有丰富的制造经验。
+{% if lead.product_requirements %}
+针对贵司关注的{{ lead.product_requirements | join('、') }}，我们可以提供定制化的生产方案。
+{% endif %}
+{% if factory.intro %}
+{{ factory.intro }}
+{% endif %}
+我们的核心优势：{{ factory.core_advantages | join('、') }}。{% if factory.certifications %}
+已通过认证：{{ factory.certifications | join('、') }}。{% endif %}
+
+
+不知您下周是否方便安排15分钟的电话沟通，进一步了解{{ lead.company_name }}的采购计划？
+
+此致
+{{ factory.contact_person or factory.name }}
+"""
+
+LINKEDIN_TEMPLATE = """{{ lead.contact_name or '您好' }}，您好！注意到{{ lead.company_name }}在{{ lead.industry }}领域的业务发展，\
+{{ factory.name }}专注于{{ factory.main_products | join('、') }}的制造，具备{{ factory.core_advantages | join('、') }}等优势。\
+{% if lead.product_requirements %}我们在{{ lead.product_requirements | first }}方面有成熟的方案，{% endif %}\
+很希望与您建立联系，交流合作机会。"""
+
+PRODUCT_RECOMMENDATION_TEMPLATE = """根据{{ lead.company_name }}的业务需求（{{ lead.business_needs }}），我们推荐以下产品线：
+{% for product in factory.main_products %}
+- {{ product }}
+{% endfor %}
+{% if lead.product_requirements %}
+可重点针对{{ lead.product_requirements | join('、') }}提供样品与技术参数。
+{% endif %}
+{% if factory.product_overview %}
+{{ factory.product_overview }}
+{% endif %}
+"""
+
+# 跟进序列：(间隔倍数, 方式, 内容要点, 目标)
+FOLLOW_UP_STEPS = [
+    (1, "email", "跟进首封邮件，补充{{ lead.industry }}相关案例", "建立初步联系"),
+    (2, "linkedin", "在LinkedIn上与{{ lead.contact_name or lead.company_name }}建立联系", "加深关系"),
+    (3, "email", "发送针对{{ lead.company_name }}需求的产品资料与报价", "推动需求确认"),
+    (5, "phone", "电话沟通样品与合作细节", "推进合作"),
+]
+
+
+class FactoryTemplateSet:
+    """单个工厂编译后的模板集合"""
+
+    def __init__(self, factory_id: int, templates: Dict[str, Template], follow_up_steps: List[tuple]):
+        self.factory_id = factory_id
+        self.templates = templates
+        self.follow_up_steps = follow_up_steps
+
+
+class TemplateRenderingEngine:
+    """基于Jinja2的个性化内容渲染引擎
+
+    每个工厂的模板只编译一次（工厂信息和LLM生成的工厂级内容作为模板全局变量），
+    之后每个潜在客户只需在本地渲染；客户数据不符合槽位定义时由调用方改走LLM生成。
+    """
+
+    def __init__(self):
+        self.environment = Environment(
+            undefined=StrictUndefined,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            autoescape=False
+        )
+        self.factory_templates: Dict[int, FactoryTemplateSet] = {}
+        self.lock = threading.Lock()
+
+        # 指标
+        self.rendered = 0
+        self.escalated = 0
+
+    def compile_factory(
+        self,
+        factory_id: int,
+        factory_info: Dict[str, Any],
+        generated_templates: Optional[List[Dict[str, Any]]] = None
+    ) -> FactoryTemplateSet:
+        """编译工厂模板，generated_templates 为 create_content_templates 生成的工厂级内容
+
+        缺少生成内容（未生成或生成失败）时公司介绍使用工厂档案中的描述，产品概述省略。
+        """
+        generated = {
+            f"{template['type']}:{template['subtype']}": template["content"]
+            for template in (generated_templates or [])
+            if template.get("content")
+        }
+        factory_context = {
+            "name": factory_info.get("name", ""),
+            "location": factory_info.get("location"),
+            "contact_person": factory_info.get("contact_person"),
+            "main_products": factory_info.get("main_products") or [],
+            "core_advantages": factory_info.get("core_advantages") or [],
+            "certifications": factory_info.get("certifications") or [],
+            "intro": generated.get("company:introduction") or factory_info.get("description"),
+            "product_overview": generated.get("product:overview"),
+        }
+        template_globals = {"factory": factory_context}
+
+        template_set = FactoryTemplateSet(
+            factory_id=factory_id,
+            templates={
+                "email_subject": self.environment.from_string(EMAIL_SUBJECT_TEMPLATE, globals=template_globals),
+                "email_content": self.environment.from_string(EMAIL_TEMPLATE, globals=template_globals),
+                "linkedin_message": self.environment.from_string(LINKEDIN_TEMPLATE, globals=template_globals),
+                "product_recommendation": self.environment.from_string(
+                    PRODUCT_RECOMMENDATION_TEMPLATE, globals=template_globals
+                ),
+            },
+            follow_up_steps=[
+                (multiplier, method, self.environment.from_string(content, globals=template_globals), goal)
+                for multiplier, method, content, goal in FOLLOW_UP_STEPS
+            ]
+        )
+
+        with self.lock:
+            self.factory_templates[factory_id] = template_set
+
+        logger.info(f"工厂 {factory_id} 的个性化模板编译完成")
+        return template_set
+
+    def get_factory_templates(self, factory_id: int) -> Optional[FactoryTemplateSet]:
+        return self.factory_templates.get(factory_id)
+
+    def invalidate(self, factory_id: int):
+        """工厂信息更新后丢弃已编译的模板"""
+        with self.lock:
+            self.factory_templates.pop(factory_id, None)
+
+    def validate_lead(self, lead_info: Dict[str, Any]) -> List[str]:
+        """按槽位定义检查潜在客户数据，返回不符合的原因列表"""
+        problems = []
+        for slot, (slot_type, required, max_length) in LEAD_SLOTS.items():
+            value = lead_info.get(slot)
+            if value in (None, "", []):
+                if required:
+                    problems.append(f"缺少必填字段 {slot}")
+                continue
+            if not isinstance(value, slot_type):
+                problems.append(f"字段 {slot} 类型应为 {slot_type.__name__}")
+                continue
+            if len(value) > max_length:
+                problems.append(f"字段 {slot} 超出长度限制")
+            if slot_type is list and not all(isinstance(item, str) and item for item in value):
+                problems.append(f"字段 {slot} 应为非空字符串列表")
+        return problems
+
+    def render(self, factory_id: int, lead_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """渲染个性化内容，模板未编译或客户数据不符合槽位时返回None"""
+        template_set = self.get_factory_templates(factory_id)
+        if template_set is None:
+            return None
+
+        problems = self.validate_lead(lead_info)
+        if problems:
+            self.escalated += 1
+            logger.debug(f"潜在客户数据不适用模板，改用LLM生成: {problems}")
+            return None
+
+        lead = {slot: lead_info.get(slot) for slot in LEAD_SLOTS}
+        try:
+            content = {
+                name: template.render(lead=lead).strip()
+                for name, template in template_set.templates.items()
+            }
+            content["follow_up_sequence"] = [
+                {
+                    "step_number": index + 1,
+                    "timing": f"{multiplier * settings.FOLLOW_UP_INTERVAL_DAYS}天后",
+                    "method": method,
+                    "content": template.render(lead=lead).strip(),
+                    "goal": goal
+                }
+                for index, (multiplier, method, template, goal) in enumerate(template_set.follow_up_steps)
+            ]
+        except TemplateError as e:
+            self.escalated += 1
+            logger.warning(f"模板渲染失败，改用LLM生成: {e}")
+            return None
+
+        self.rendered += 1
+        return content
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "compiled_factories": len(self.factory_templates),
+            "rendered": self.rendered,
+            "escalated": self.escalated
+        }
+
+
+template_engine = TemplateRenderingEngine()
@@ -32,7 +32,9 @@ def main():
     
     # Check OpenAI API key
     openai_key = os.getenv("OPENAI_API_KEY")
-    if not openai_key:
+    if os.getenv("OPENAI_API_BASE"):
+        print(f"🧪 Using LLM endpoint: {os.getenv('OPENAI_API_BASE')}")
+    elif not openai_key:
         print("❌ Error: OPENAI_API_KEY environment variable not set")
         print("🔑 Please set your OpenAI API key in .env file")
         sys.exit(1)
@@ -41,7 +43,7 @@ def main():
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         print("⚠️  Warning: DATABASE_URL environment variable not set")
-        print("🗄️  Will use default SQLite database")
+        print("🗄️  Will use default SQLite database (WAL mode, single writer thread)")
         os.environ["DATABASE_URL"] = "sqlite:///./aibd_factorylink.db"
     
     # Create logs directory
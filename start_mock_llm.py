@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+AIBD-FactoryLink Mock LLM Server
+
+Runs a local OpenAI-compatible server with deterministic canned outputs so the
+agent pipeline can be load tested without spending API budget. Point the
+services at it with:
+
+    OPENAI_API_BASE=http://127.0.0.1:8100/v1
+"""
+
+import argparse
+import sys
+import uvicorn
+from pathlib import Path
+
+# Add project root directory to Python path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.core.mock_llm import MockLLMConfig, create_mock_llm_app
+
+
+def main():
+    """Main startup function"""
+    parser = argparse.ArgumentParser(description="AIBD-FactoryLink mock LLM server")
+    parser.add_argument("--host", default=settings.MOCK_LLM_HOST)
+    parser.add_argument("--port", type=int, default=settings.MOCK_LLM_PORT)
+    parser.add_argument("--latency-median-ms", type=float, default=settings.MOCK_LLM_LATENCY_MEDIAN_MS)
+    parser.add_argument("--latency-sigma", type=float, default=settings.MOCK_LLM_LATENCY_SIGMA)
+    parser.add_argument("--tokens-per-second", type=float, default=settings.MOCK_LLM_TOKENS_PER_SECOND)
+    parser.add_argument("--error-rate", type=float, default=settings.MOCK_LLM_ERROR_RATE)
+    parser.add_argument("--timeout-rate", type=float, default=settings.MOCK_LLM_TIMEOUT_RATE)
+    parser.add_argument("--seed", type=int, default=settings.MOCK_LLM_SEED)
+    args = parser.parse_args()
+
+    config = MockLLMConfig(
+        latency_median_ms=args.latency_median_ms,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed
+    )
+
+    print(f"🧪 Starting mock LLM server at http://{args.host}:{args.port}/v1")
+    print(f"💡 Set OPENAI_API_BASE=http://{args.host}:{args.port}/v1 to route services here")
+
+    uvicorn.run(
+        create_mock_llm_app(config),
+        host=args.host,
+        port=args.port,
+        log_level="warning"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@ from app.services.ai_agent import AIAgentService
 from app.services.web_analyzer import WebAnalyzer
 from app.services.lead_generator import LeadGenerator
 from app.services.content_creator import ContentCreator
+from app.core.config import settings
+from app.core.mock_llm import MockLLMServer
 
 
 async def test_web_analyzer():
@@ -136,11 +138,23 @@ async def run_all_tests():
         return False
 
 
+def start_mock_llm_if_needed():
+    """Use an in-process mock LLM server when no API key or API base is configured"""
+    if settings.OPENAI_API_KEY or settings.OPENAI_API_BASE:
+        return None
+    server = MockLLMServer()
+    settings.OPENAI_API_BASE = server.start()
+    settings.OPENAI_API_KEY = "mock"
+    print(f"🧪 No OPENAI_API_KEY configured, using mock LLM at {settings.OPENAI_API_BASE}")
+    return server
+
+
 def main():
     """Main function"""
     print("🚀 AIBD-FactoryLink System Test")
     print("=" * 50)
     
+    mock_server = start_mock_llm_if_needed()
     try:
         # Run async tests
         result = asyncio.run(run_all_tests())
@@ -158,6 +172,9 @@ def main():
     except Exception as e:
         print(f"\n💥 Error occurred during testing: {e}")
         sys.exit(1)
+    finally:
+        if mock_server is not None:
+            mock_server.stop()
 
 
 if __name__ == "__main__":
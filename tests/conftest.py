@@ -0,0 +1,133 @@
+"""测试公共夹具
+
+测试使用临时目录中的SQLite文件数据库和进程内的模拟LLM服务，不需要API密钥。
+应用的配置在导入时读取，因此环境变量必须在导入 app 之前设置。
+"""
+
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+_TEST_DIR = Path(tempfile.mkdtemp(prefix="aibd-tests-"))
+_TEST_DB = _TEST_DIR / "test.db"
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_TEST_DB}",
+    "DEBUG": "true",
+    "DB_QUERY_GUARD_ENABLED": "true",
+    "OPENAI_API_KEY": "test-key",
+    "OPENAI_API_BASE": "",
+    "FOLLOW_UP_SCHEDULER_ENABLED": "false",
+    "ANALYTICS_RECONCILE_INTERVAL_S": "0",
+    "LEAD_MODEL_PATH": str(_TEST_DIR / "lead_model.json"),
+    "LLM_BREAKER_COOLDOWN_S": "0.2",
+})
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.core.database import Base, engine, async_engine
+from app.core.sqlite_writer import sqlite_writer
+from app.core.mock_llm import MockLLMConfig, MockLLMServer
+from app.core import llm
+from app.core.circuit_breaker import circuit_breakers
+from app.core.semantic_cache import lead_prompt_cache, content_prompt_cache
+from app.models import factory as _factory_models  # noqa: F401  注册表结构
+from app.models import lead as _lead_models  # noqa: F401
+from app.services.blacklist import blacklist_registry
+from app.services.enrichment import enrichment_service
+from app.services.lead_dedup import lead_dedup_index
+from app.services.profile_repository import profile_repository
+from app.services.template_renderer import template_engine
+
+
+def run(coro):
+    """在新的事件循环中运行协程，结束前释放绑定在该循环上的异步连接和LLM客户端"""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+            client = llm._client
+            llm.reset_llm_client()
+            if client is not None:
+                await client.close()
+
+    return asyncio.run(main())
+
+
+class MockLLM:
+    """测试中访问模拟LLM服务的配置和统计"""
+
+    def __init__(self, server: MockLLMServer):
+        self.server = server
+        self.config = server.config
+        self.base_url = server.base_url
+
+    def stats(self):
+        return httpx.get(self.base_url.replace("/v1", "/mock/stats")).json()
+
+
+@pytest.fixture(scope="session")
+def mock_llm_server():
+    server = MockLLMServer(MockLLMConfig(latency_median_ms=0, latency_sigma=0, tokens_per_second=0,
+                                         error_rate=0, timeout_rate=0))
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def mock_llm(mock_llm_server, monkeypatch):
+    """指向模拟LLM服务的配置，每个测试开始时不注入错误"""
+    mock_llm_server.config.update({"error_rate": 0, "timeout_rate": 0})
+    monkeypatch.setattr(settings, "OPENAI_API_BASE", mock_llm_server.base_url)
+    llm.reset_llm_client()
+    yield MockLLM(mock_llm_server)
+    llm.reset_llm_client()
+
+
+def _reset_database():
+    sqlite_writer.stop()
+    engine.dispose()
+    asyncio.run(async_engine.dispose())
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{_TEST_DB}{suffix}").unlink(missing_ok=True)
+    Base.metadata.create_all(engine)
+
+
+def _reset_services():
+    lead_dedup_index.factories.clear()
+    lead_dedup_index.loaded_factories.clear()
+    blacklist_registry.matchers.clear()
+    template_engine.factory_templates.clear()
+    enrichment_service.cache.entries.clear()
+    enrichment_service.in_flight.clear()
+    circuit_breakers.breakers.clear()
+    llm.hedging_policy.trackers.clear()
+    for cache in (lead_prompt_cache, content_prompt_cache):
+        cache.__init__(cache.name, cache.threshold, cache.max_entries, cache.vectorizer.dim)
+    for profile_cache in (profile_repository.factories, profile_repository.leads):
+        profile_cache.__init__(profile_cache.model, profile_cache.fields, profile_cache.max_entries,
+                               profile_cache.refresh_s)
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """每个测试使用空数据库和空的进程内缓存"""
+    _reset_database()
+    _reset_services()
+    yield
+    sqlite_writer.stop()
+
+
+@pytest.fixture
+def db():
+    from app.core.database import SessionLocal
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from app.models.factory import Factory
+from app.services import blacklist as blacklist_module
+from app.services.blacklist import BlacklistMatcher, BlacklistUnavailableError, blacklist_registry
+from app.services.lead_generator import LeadGenerator
+
+from conftest import run
+
+
+def _add_factory(db, blacklist):
+    factory = Factory(name="测试工厂", website="https://factory.example.com", blacklisted_companies=blacklist)
+    db.add(factory)
+    db.commit()
+    return factory
+
+
+class BrokenSession:
+    async def __aenter__(self):
+        raise RuntimeError("连接失败")
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def _no_sync_session():
+    raise AssertionError("事件循环中不应使用同步会话")
+
+
+def test_matcher_matches_domains_names_and_emails():
+    matcher = BlacklistMatcher(["competitor.com", "Acme Corp", "buyer@rival.example.org", "华强电子"])
+
+    assert matcher.match({"website": "https://shop.competitor.com/products"}) == "competitor.com"
+    assert matcher.match({"company_name": "ACME Corp."}) == "Acme Corp"
+    assert matcher.match({"contact_email": "sales@rival.example.org"}) == "buyer@rival.example.org"
+    assert matcher.match({"company_name": "深圳华强电子有限公司"}) == "华强电子"
+    assert matcher.match({"company_name": "Acmeology Ltd"}) is None
+
+
+def test_async_lookup_uses_async_session(db, monkeypatch):
+    _add_factory(db, ["Acme Corp"])
+    monkeypatch.setattr(blacklist_module, "get_db_sync", _no_sync_session)
+
+    leads = [{"company_name": "Acme Corp"}, {"company_name": "Globex"}]
+    allowed = run(blacklist_registry.filter_leads_async(1, leads))
+
+    assert allowed == [{"company_name": "Globex"}]
+    assert run(blacklist_registry.check_lead_async(1, {"company_name": "Acme Corp"})) == "Acme Corp"
+    assert list(blacklist_registry.matchers) == [1]
+
+
+def test_async_lookup_recompiles_after_update(db, monkeypatch):
+    factory = _add_factory(db, ["Acme Corp"])
+    monkeypatch.setattr(blacklist_registry, "refresh_s", 0.0)
+
+    async def lookups():
+        first = await blacklist_registry.check_lead_async(1, {"company_name": "Globex"})
+        factory.blacklisted_companies = ["Globex"]
+        await asyncio.to_thread(db.commit)
+        second = await blacklist_registry.check_lead_async(1, {"company_name": "Globex"})
+        return first, second
+
+    assert run(lookups()) == (None, "Globex")
+
+
+def test_load_failure_keeps_previous_matcher(db, monkeypatch):
+    _add_factory(db, ["Acme Corp"])
+    assert run(blacklist_registry.check_lead_async(1, {"company_name": "Acme Corp"})) == "Acme Corp"
+
+    monkeypatch.setattr(blacklist_registry, "refresh_s", 0.0)
+    monkeypatch.setattr(blacklist_module, "AsyncSessionLocal", BrokenSession)
+
+    assert run(blacklist_registry.check_lead_async(1, {"company_name": "Acme Corp"})) == "Acme Corp"
+
+
+def test_load_failure_without_cache_fails_closed(db, monkeypatch):
+    _add_factory(db, ["Acme Corp"])
+    monkeypatch.setattr(blacklist_module, "AsyncSessionLocal", BrokenSession)
+
+    # 从未加载成功时不能当作没有黑名单放行
+    with pytest.raises(BlacklistUnavailableError):
+        run(blacklist_registry.check_lead_async(1, {"company_name": "Globex"}))
+    assert blacklist_registry.matchers == {}
+
+
+def test_stream_filters_blacklist_before_scoring(mock_llm, monkeypatch):
+    generator = LeadGenerator()
+    scored = []
+    score_leads = generator.scoring_engine.score_leads
+
+    def recording_score_leads(leads):
+        scored.append(len(leads))
+        return score_leads(leads)
+
+    monkeypatch.setattr(generator.scoring_engine, "score_leads", recording_score_leads)
+
+    async def collect():
+        return [batch async for batch in generator.stream_leads(1, {"target_markets": ["北美"]})]
+
+    async def keep_first(factory_id, leads):
+        return leads[:1]
+
+    monkeypatch.setattr(blacklist_registry, "filter_leads_async", keep_first)
+    batches = run(collect())
+    assert batches and set(scored) == {1}
+    assert all("lead_score" in lead for batch in batches for lead in batch)
+
+    # 黑名单不可用时跳过整批，不评分也不产出
+    async def unavailable(factory_id, leads):
+        raise BlacklistUnavailableError("黑名单加载失败")
+
+    scored.clear()
+    monkeypatch.setattr(blacklist_registry, "filter_leads_async", unavailable)
+    assert run(collect()) == []
+    assert scored == []
@@ -0,0 +1,96 @@
+import time
+
+import openai
+import pytest
+
+from app.core.circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError, circuit_breakers
+)
+from app.core.config import settings
+from app.core.llm import chat_completion
+
+from conftest import run
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def _breaker(**overrides):
+    options = dict(name="test", window_size=10, min_requests=4, error_rate_threshold=0.5,
+                   slow_rate_threshold=0.5, latency_slo_s=1.0, cooldown_s=0.05, half_open_probes=2)
+    options.update(overrides)
+    return CircuitBreaker(**options)
+
+
+def test_opens_on_error_rate_and_recovers_after_probes():
+    breaker = _breaker()
+    for _ in range(2):
+        breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.is_open() and not breaker.allow_request()
+
+    time.sleep(0.06)
+    # 冷却后只放行 half_open_probes 个探测请求
+    assert [breaker.allow_request() for _ in range(3)] == [True, True, False]
+    assert breaker.state == STATE_HALF_OPEN
+
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.get_metrics()["window_requests"] == 0
+    assert breaker.get_metrics()["rejected"] == 2
+
+
+def test_opens_on_slow_rate():
+    breaker = _breaker()
+    for latency in (2.0, 0.1, 2.0, 0.1):
+        breaker.record_success(latency)
+    assert breaker.state == STATE_OPEN
+
+
+def test_failed_probe_reopens():
+    breaker = _breaker(min_requests=1)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.get_metrics()["times_opened"] == 2
+
+
+def test_cancelled_probe_returns_slot():
+    breaker = _breaker(min_requests=1, half_open_probes=1)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_cancelled()
+    assert breaker.allow_request()
+
+
+def test_breaker_opens_against_failing_mock(mock_llm):
+    mock_llm.config.update({"error_rate": 1})
+    for _ in range(settings.LLM_BREAKER_MIN_REQUESTS):
+        with pytest.raises(openai.APIError):
+            run(chat_completion(MESSAGES))
+
+    breaker = circuit_breakers.get(mock_llm.base_url, settings.OPENAI_MODEL)
+    assert breaker.state == STATE_OPEN
+
+    # 打开期间请求不会发往服务端
+    requests = mock_llm.stats()["requests"]
+    with pytest.raises(CircuitOpenError):
+        run(chat_completion(MESSAGES))
+    assert mock_llm.stats()["requests"] == requests
+
+    # 冷却后探测请求成功即恢复
+    mock_llm.config.update({"error_rate": 0})
+    time.sleep(settings.LLM_BREAKER_COOLDOWN_S)
+    for _ in range(settings.LLM_BREAKER_HALF_OPEN_PROBES):
+        assert run(chat_completion(MESSAGES)).choices[0].message.content
+    assert breaker.state == STATE_CLOSED
@@ -0,0 +1,70 @@
+from app.models.factory import Factory
+from app.services import content_creator as content_creator_module
+from app.services.content_creator import ContentCreator
+from app.services.template_renderer import template_engine
+
+from conftest import run
+
+LEAD = {
+    "company_name": "Nordic Parts AB",
+    "industry": "汽车零部件",
+    "business_needs": "寻找稳定的精密铸件供应商",
+    "contact_name": "Anna",
+    "location": "瑞典",
+    "product_requirements": ["铝合金压铸件"],
+}
+
+
+def _add_factory(db):
+    db.add(Factory(
+        name="宁波精工",
+        website="https://precision.example.com",
+        description="二十年精密铸造经验的出口工厂",
+        main_products=["铝合金压铸件"],
+        core_advantages=["交期稳定"],
+    ))
+    db.commit()
+
+
+def test_compile_factory_falls_back_to_profile_fields():
+    template_engine.compile_factory(1, {
+        "name": "宁波精工",
+        "description": "二十年精密铸造经验的出口工厂",
+        "main_products": ["铝合金压铸件"],
+        "core_advantages": ["交期稳定"],
+    }, [
+        {"type": "company", "subtype": "introduction", "content": None},
+        {"type": "product", "subtype": "overview", "content": ""},
+    ])
+
+    content = template_engine.render(1, LEAD)
+
+    assert "二十年精密铸造经验的出口工厂" in content["email_content"]
+    assert content["product_recommendation"].endswith("可重点针对铝合金压铸件提供样品与技术参数。")
+
+
+def test_failed_generation_is_not_rendered_into_emails(db, monkeypatch):
+    _add_factory(db)
+
+    async def failing_completion(*args, **kwargs):
+        raise RuntimeError("LLM不可用")
+
+    monkeypatch.setattr(content_creator_module, "chat_completion", failing_completion)
+
+    templates = run(ContentCreator().create_content_templates(1))
+    content = template_engine.render(1, LEAD)
+
+    assert templates == []
+    assert "抱歉" not in content["email_content"]
+    assert "二十年精密铸造经验的出口工厂" in content["email_content"]
+
+
+def test_generated_introduction_is_used(db, mock_llm):
+    _add_factory(db)
+
+    templates = run(ContentCreator().create_content_templates(1))
+    intro = next(t["content"] for t in templates if (t["type"], t["subtype"]) == ("company", "introduction"))
+    content = template_engine.render(1, LEAD)
+
+    assert len(templates) == 9
+    assert intro in content["email_content"]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.core.config import settings
+from app.core.database import (
+    _engine_options, engine, get_async_database_url, get_db, get_pool_status, init_db, is_sqlite_file
+)
+from app.models.lead import Lead
+
+from conftest import run
+
+
+def test_async_driver_urls():
+    assert get_async_database_url("postgresql://u:p@db/aibd") == "postgresql+asyncpg://u:p@db/aibd"
+    assert get_async_database_url("postgresql+psycopg2://u:p@db/aibd") == "postgresql+asyncpg://u:p@db/aibd"
+    assert get_async_database_url("sqlite:///./aibd.db") == "sqlite+aiosqlite:///./aibd.db"
+
+
+def test_engine_options_by_database():
+    assert _engine_options("sqlite:///:memory:")["poolclass"] is StaticPool
+    assert "poolclass" not in _engine_options("sqlite:///./aibd.db")
+    assert not is_sqlite_file("sqlite://")
+
+    options = _engine_options("postgresql://u:p@db/aibd")
+    assert options == {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_S,
+        "pool_recycle": settings.DB_POOL_RECYCLE_S,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def test_postgres_pool_is_sized_from_settings(monkeypatch):
+    pytest.importorskip("psycopg2")
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 3)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 4)
+
+    # 创建引擎不会连接数据库
+    pg_engine = create_engine("postgresql://u:p@localhost/aibd", **_engine_options("postgresql://u:p@localhost/aibd"))
+
+    assert isinstance(pg_engine.pool, QueuePool)
+    assert (pg_engine.pool.size(), pg_engine.pool._max_overflow) == (3, 4)
+    assert pg_engine.pool._pre_ping is settings.DB_POOL_PRE_PING
+
+
+def test_sqlite_file_connections_use_wal():
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar().lower() == settings.SQLITE_JOURNAL_MODE.lower()
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == settings.SQLITE_BUSY_TIMEOUT_MS
+    assert set(get_pool_status()) == {"sync", "async"}
+
+
+def test_get_db_yields_independent_async_sessions(db):
+    db.add(Lead(factory_id=1, company_name="Acme", qualification_status="unqualified"))
+    db.commit()
+
+    async def query():
+        dependency = get_db()
+        session = await dependency.__anext__()
+        try:
+            assert isinstance(session, AsyncSession)
+            return session, (await session.execute(select(Lead.company_name))).scalar_one()
+        finally:
+            await dependency.aclose()
+
+    async def concurrent_queries():
+        # 与应用启动时一样先由 init_db 建立首个连接，再并发使用连接池
+        await init_db()
+        return await asyncio.gather(*(query() for _ in range(10)))
+
+    results = run(concurrent_queries())
+    assert [name for _, name in results] == ["Acme"] * 10
+    assert len({id(session) for session, _ in results}) == 10
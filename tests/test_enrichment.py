@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from app.services.enrichment import EnrichmentProvider, EnrichmentService, FileEnrichmentProvider, enrichment_service
+from app.services.lead_generator import LeadGenerator
+
+from conftest import run
+
+
+class CountingProvider(EnrichmentProvider):
+    name = "counting"
+
+    def __init__(self, records, delay_s=0.0, fail=False):
+        self.records = records
+        self.delay_s = delay_s
+        self.fail = fail
+        self.calls = []
+
+    async def lookup_many(self, domains):
+        self.calls.append(list(domains))
+        await asyncio.sleep(self.delay_s)
+        if self.fail:
+            raise RuntimeError("数据源不可用")
+        return {domain: self.records.get(domain) for domain in domains}
+
+
+def _service(provider, **overrides):
+    options = dict(ttl_s=60.0, negative_ttl_s=60.0, max_entries=100, batch_size=2)
+    options.update(overrides)
+    return EnrichmentService(provider, **options)
+
+
+def test_batches_misses_and_caches_results():
+    provider = CountingProvider({"acme.com": {"revenue_range": "1M-10M"}})
+    service = _service(provider)
+
+    first = run(service.enrich_domains(["ACME.com", "globex.com", "initech.com", "acme.com"]))
+    second = run(service.enrich_domains(["acme.com", "globex.com"]))
+
+    assert first == {"acme.com": {"revenue_range": "1M-10M"}, "globex.com": None, "initech.com": None}
+    assert second == {"acme.com": {"revenue_range": "1M-10M"}, "globex.com": None}
+    # 未命中的域名按 batch_size 分批查询，查不到的域名也被缓存
+    assert provider.calls == [["acme.com", "globex.com"], ["initech.com"]]
+    assert service.get_metrics()["hits"] == 2
+
+
+def test_concurrent_lookups_are_coalesced():
+    provider = CountingProvider({"acme.com": {"revenue_range": "1M-10M"}}, delay_s=0.05)
+    service = _service(provider)
+
+    async def lookups():
+        return await asyncio.gather(*(service.enrich_domain("acme.com") for _ in range(5)))
+
+    assert run(lookups()) == [{"revenue_range": "1M-10M"}] * 5
+    assert provider.calls == [["acme.com"]]
+    assert service.get_metrics()["coalesced"] == 4
+
+
+def test_expired_entries_and_failures_are_refetched():
+    provider = CountingProvider({}, fail=True)
+    service = _service(provider, negative_ttl_s=0.0)
+
+    assert run(service.enrich_domain("acme.com")) is None
+    provider.fail = False
+    assert run(service.enrich_domain("acme.com")) is None
+    assert run(service.enrich_domain("acme.com")) is None
+
+    # 失败不写缓存；负缓存过期后重新查询
+    assert len(provider.calls) == 3
+    assert service.get_metrics()["provider_errors"] == 1
+
+
+def test_file_provider_reloads_on_change(tmp_path):
+    path = tmp_path / "companies.jsonl"
+    path.write_text(json.dumps({"domain": "Acme.com", "revenue_range": "1M-10M"}) + "\n", encoding="utf-8")
+    provider = FileEnrichmentProvider(str(path))
+
+    assert run(provider.lookup_many(["acme.com"])) == {"acme.com": {"revenue_range": "1M-10M"}}
+
+    path.write_text(json.dumps({"domain": "acme.com", "revenue_range": "10M-100M"}) + "\n", encoding="utf-8")
+    provider.loaded_mtime = -1.0
+    assert run(provider.lookup_many(["acme.com"])) == {"acme.com": {"revenue_range": "10M-100M"}}
+
+
+def test_enrich_leads_uses_shared_cache(monkeypatch):
+    provider = CountingProvider({"acme.com": {"revenue_range": "1M-10M"}})
+    monkeypatch.setattr(enrichment_service, "provider", provider)
+    leads = [
+        {"company_name": "Acme", "website": "https://www.acme.com/about"},
+        {"company_name": "Acme Sales", "contact_email": "sales@acme.com"},
+        {"company_name": "Unknown"},
+    ]
+
+    enriched = run(LeadGenerator().enrich_leads(leads))
+    run(LeadGenerator().enrich_leads(leads[:1]))
+
+    assert [lead.get("enriched_data") for lead in enriched] == [{"revenue_range": "1M-10M"}] * 2 + [None]
+    assert provider.calls == [["acme.com"]]
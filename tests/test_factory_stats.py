@@ -0,0 +1,160 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from app.main import app
+from app.models.factory import Factory, FactoryStats, FactoryStatsBucket
+from app.models.lead import Lead, LeadSource
+from app.services import factory_stats
+from app.services.factory_stats import factory_stats_service
+from app.services.interaction_log import interaction_log
+from app.services.lead_persistence import lead_persistence
+
+
+def _lead(factory_id, name, **values):
+    return {"factory_id": factory_id, "company_name": name, "qualification_status": "unqualified",
+            "industry": "汽车", "lead_source": "ai_generated", **values}
+
+
+def _store(db):
+    leads = [
+        _lead(1, "Acme", qualification_status="hot", is_converted=True),
+        _lead(1, "Globex", industry="电子"),
+        _lead(2, "Initech", qualification_status="qualified"),
+    ]
+    lead_persistence.write_leads(db, leads)
+    interaction_log.record_many(db, [{"lead_id": leads[0]["id"], "interaction_method": "outbound",
+                                      "response_received": True}])
+    return leads
+
+
+def _counters(db, factory_id):
+    db.expire_all()
+    stats = db.get(FactoryStats, factory_id)
+    return stats.total_leads, stats.qualified_leads, stats.hot_leads, stats.conversions, stats.total_interactions
+
+
+def _source(db, name):
+    db.expire_all()
+    source = db.execute(select(LeadSource).where(LeadSource.name == name)).scalar_one()
+    return source.total_leads, source.converted_leads, round(source.conversion_rate, 4)
+
+
+def _buckets(db, factory_id):
+    return dict(db.execute(
+        select(FactoryStatsBucket.value, FactoryStatsBucket.lead_count)
+        .where(FactoryStatsBucket.factory_id == factory_id, FactoryStatsBucket.dimension == "industry")
+    ).all())
+
+
+@pytest.mark.parametrize("upsert", [True, False])
+def test_reconcile_corrects_drifted_stats(db, monkeypatch, upsert):
+    if not upsert:
+        # 不支持 upsert 的数据库先查出修正量再逐行累加
+        monkeypatch.setattr(factory_stats, "UPSERT_DIALECTS", ())
+    _store(db)
+    expected = _counters(db, 1)
+    assert expected == (2, 1, 1, 1, 1)
+
+    db.execute(update(FactoryStats).values(total_leads=99, hot_leads=0, total_interactions=7))
+    db.add(FactoryStatsBucket(factory_id=1, dimension="industry", value="玩具", lead_count=3))
+    db.add(FactoryStats(factory_id=3, total_leads=5))
+    db.execute(update(LeadSource).values(total_leads=0, converted_leads=0, conversion_rate=0.0))
+    db.commit()
+
+    assert factory_stats_service.reconcile(db) == 3
+    assert _counters(db, 1) == expected
+    assert _counters(db, 2) == (1, 1, 0, 0, 0)
+    assert _counters(db, 3) == (0, 0, 0, 0, 0)
+    assert _buckets(db, 1) == {"汽车": 1, "电子": 1, "玩具": 0}
+    source = db.execute(select(LeadSource).where(LeadSource.name == "ai_generated")).scalar_one()
+    assert (source.total_leads, source.converted_leads, round(source.conversion_rate, 4)) == (3, 1, 0.3333)
+
+    # 没有偏差时重算不改变任何计数
+    factory_stats_service.reconcile(db)
+    assert _counters(db, 1) == expected
+
+
+def test_reconcile_single_factory(db):
+    _store(db)
+    db.execute(update(FactoryStats).values(total_leads=99))
+    db.commit()
+
+    assert factory_stats_service.reconcile(db, factory_id=1) == 1
+    assert _counters(db, 1)[0] == 2
+    assert _counters(db, 2)[0] == 99
+    assert db.get(FactoryStats, 2).reconciled_at is None
+
+
+def test_summary_for_missing_factory_returns_404(db):
+    db.add(Factory(name="测试工厂", website="https://factory.example.com"))
+    db.commit()
+    _store(db)
+
+    with TestClient(app) as client:
+        found = client.get("/api/v1/analytics/summary", params={"factory_id": 1})
+        missing = client.get("/api/v1/analytics/summary", params={"factory_id": 42})
+        overall = client.get("/api/v1/analytics/summary")
+
+    assert found.status_code == 200
+    assert found.json()["data"]["total_factories"] == 1
+    assert found.json()["data"]["total_leads"] == 2
+    assert missing.status_code == 404
+    assert missing.json() == {"error": "工厂 42 不存在", "status_code": 404}
+    assert overall.json()["data"]["total_factories"] == 1
+    assert overall.json()["data"]["total_leads"] == 3
+
+
+def test_bulk_writes_maintain_source_stats(db):
+    db.add(LeadSource(name="trade_show", source_type="event"))
+    db.commit()
+    _store(db)
+    lead_persistence.write_leads(db, [_lead(1, "Hooli", lead_source="trade_show", is_converted=True)])
+
+    # 首次出现的来源自动创建，类型为 other
+    assert _source(db, "ai_generated") == (3, 1, 0.3333)
+    assert _source(db, "trade_show") == (1, 1, 1.0)
+    types = dict(db.execute(select(LeadSource.name, LeadSource.source_type)).all())
+    assert types == {"ai_generated": factory_stats.DEFAULT_SOURCE_TYPE, "trade_show": "event"}
+
+
+def test_orm_changes_update_source_and_factory_stats(db):
+    leads = _store(db)
+
+    globex = db.get(Lead, leads[1]["id"])
+    globex.is_converted = True
+    globex.qualification_status = "hot"
+    db.commit()
+    assert _source(db, "ai_generated") == (3, 2, 0.6667)
+    assert _counters(db, 1)[1:4] == (2, 2, 2)
+
+    # 修改来源时从旧来源移到新来源
+    db.get(Lead, leads[0]["id"]).lead_source = "referral"
+    db.add(Lead(factory_id=2, company_name="Hooli", qualification_status="unqualified", lead_source="referral"))
+    db.commit()
+    assert _source(db, "ai_generated") == (2, 1, 0.5)
+    assert _source(db, "referral") == (2, 1, 0.5)
+    assert _counters(db, 2)[0] == 2
+
+    db.delete(globex)
+    db.commit()
+    assert _source(db, "ai_generated") == (1, 0, 0.0)
+    assert _counters(db, 1)[:4] == (1, 1, 1, 1)
+    assert _buckets(db, 1) == {"汽车": 1, "电子": 0}
+
+
+def test_source_stats_endpoints(db):
+    _store(db)
+    lead_persistence.write_leads(db, [_lead(1, "Hooli", lead_source="referral")])
+
+    with TestClient(app) as client:
+        sources = client.get("/api/v1/analytics/sources")
+        source = client.get("/api/v1/analytics/sources/referral")
+        missing = client.get("/api/v1/analytics/sources/unknown")
+
+    assert [(item["name"], item["total_leads"]) for item in sources.json()["data"]] == [
+        ("ai_generated", 3), ("referral", 1)
+    ]
+    assert source.json()["data"]["conversion_rate"] == 0.0
+    assert missing.status_code == 404
+    assert missing.json() == {"error": "客户来源 unknown 不存在", "status_code": 404}
@@ -0,0 +1,244 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.sqlite_writer import sqlite_writer
+from app.models.factory import FactoryStats
+from app.models.lead import FollowUpTask, Lead, LeadInteraction
+from app.services.factory_stats import factory_stats_service
+from app.services.follow_up_scheduler import FollowUpScheduler, TimingWheel, sequence_tasks
+from app.services.lead_persistence import lead_persistence
+
+from conftest import run
+
+SEQUENCE = [
+    {"step_number": 1, "timing": "3天后", "method": "email", "content": "跟进一", "goal": "确认需求"},
+    {"step_number": 2, "timing": "7天后", "method": "email", "content": "跟进二", "goal": "报价"},
+]
+
+
+def _store_lead(db):
+    leads = [{"factory_id": 1, "company_name": "Acme", "qualification_status": "qualified"}]
+    lead_persistence.write_leads(db, leads)
+    return leads[0]["id"]
+
+
+def _schedule(scheduler, lead_id, start):
+    async def schedule():
+        async with AsyncSessionLocal() as db:
+            return await scheduler.schedule(db, sequence_tasks(1, lead_id, SEQUENCE, start=start))
+
+    return run(schedule())
+
+
+async def _sent(tasks):
+    return {task["id"]: {"status": "sent"} for task in tasks}
+
+
+async def _error(tasks):
+    return {task["id"]: {"status": "error", "error": "SMTP不可用"} for task in tasks}
+
+
+def _tasks(db):
+    db.expire_all()
+    return {task.step_number: task for task in db.execute(select(FollowUpTask)).scalars()}
+
+
+def _utc_due(task):
+    return task.due_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture(params=[True, False], ids=["write_queue", "direct"])
+def write_queue(request):
+    enabled = sqlite_writer.enabled
+    sqlite_writer.enabled = request.param
+    yield request.param
+    sqlite_writer.enabled = enabled
+
+
+def test_claim_and_complete_go_through_write_queue(db, write_queue):
+    lead_id = _store_lead(db)
+    scheduler = FollowUpScheduler(tick_s=1.0, horizon_s=60.0)
+    # 第一步已到期，第二步在四天后
+    _schedule(scheduler, lead_id, datetime.now(timezone.utc) - timedelta(days=3, seconds=1))
+    jobs = sqlite_writer.jobs
+
+    assert run(scheduler.run_once(_sent, now_ts=time.time())) == 1
+
+    # 认领和写回各是一次写队列中的写操作
+    assert sqlite_writer.jobs - jobs == (2 if write_queue else 0)
+    db.expire_all()
+    statuses = dict(db.execute(select(FollowUpTask.step_number, FollowUpTask.status)).all())
+    assert statuses == {1: "done", 2: "pending"}
+    interaction = db.execute(select(LeadInteraction)).scalar_one()
+    assert (interaction.subject, interaction.interaction_method) == ("确认需求", "outbound")
+    assert db.get(Lead, lead_id).next_follow_up_date is not None
+    assert scheduler.get_metrics()["completed"] == 1
+
+
+def test_background_reconcile_goes_through_write_queue(db, write_queue):
+    _store_lead(db)
+    db.get(FactoryStats, 1).total_leads = 5
+    db.commit()
+    jobs = sqlite_writer.jobs
+
+    factory_stats_service._reconcile_all()
+
+    assert sqlite_writer.jobs - jobs == (1 if write_queue else 0)
+    db.expire_all()
+    assert db.get(FactoryStats, 1).total_leads == 1
+
+
+def test_sequence_timing_is_parsed_from_steps():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    tasks = sequence_tasks(1, 2, [{"timing": "3-5天后"}, {"timing": "尽快"}], start=start)
+
+    assert [task["due_at"] - start for task in tasks] == [
+        timedelta(days=3), timedelta(days=2 * settings.FOLLOW_UP_INTERVAL_DAYS)
+    ]
+    assert [task["step_number"] for task in tasks] == [1, 2]
+    assert all(task["method"] == "email" and task["status"] == "pending" for task in tasks)
+
+
+def test_timing_wheel_releases_tasks_by_tick():
+    wheel = TimingWheel(tick_s=1.0, slots=10)
+    now = wheel.current_tick * 1.0
+
+    assert wheel.add(1, now + 2.5)
+    assert wheel.add(2, now - 100)  # 已过期的任务放入当前刻度
+    assert not wheel.add(3, now + 10)  # 超出覆盖范围
+    assert wheel.add(4, now + 5)
+    assert wheel.add(4, now + 3)  # 重新加入时移到新的刻度
+
+    assert wheel.advance(now) == [2]
+    assert sorted(wheel.advance(now + 3)) == [1, 4]
+    assert len(wheel) == 0
+
+    # 落后超过一圈时不会遗漏任务
+    assert wheel.add(5, now + 12)
+    assert wheel.advance(now + 50) == [5]
+
+
+def test_schedule_sequences_replaces_pending_steps(db):
+    lead_id = _store_lead(db)
+    scheduler = FollowUpScheduler()
+
+    async def schedule_twice():
+        async with AsyncSessionLocal() as session:
+            sequences = {lead_id: {"factory_id": 1, "sequence": SEQUENCE}}
+            await scheduler.schedule_sequences(session, sequences)
+            return await scheduler.schedule_sequences(session, sequences)
+
+    assert run(schedule_twice()) == 2
+    statuses = db.execute(select(FollowUpTask.status, func.count()).group_by(FollowUpTask.status)).all()
+    assert dict(statuses) == {"cancelled": 2, "pending": 2}
+    assert db.get(Lead, lead_id).next_follow_up_date is not None
+
+
+def test_concurrent_schedulers_claim_each_task_once(db):
+    lead_id = _store_lead(db)
+    first, second = FollowUpScheduler(), FollowUpScheduler()
+    _schedule(first, lead_id, datetime.now(timezone.utc) - timedelta(days=10))
+    now = datetime.now(timezone.utc)
+
+    async def claim_both():
+        task_ids = list(_tasks(db)[step].id for step in (1, 2))
+        async with AsyncSessionLocal() as session:
+            claimed = await first._claim(session, task_ids, now)
+            missed = await second._claim(session, task_ids, now)
+        return claimed, missed
+
+    (_, claimed), (_, missed) = run(claim_both())
+
+    assert len(claimed) == 2 and missed == []
+    assert second.get_metrics()["claim_misses"] == 2
+
+
+def test_expired_lease_is_reclaimed(db):
+    lead_id = _store_lead(db)
+    crashed = FollowUpScheduler(lease_s=60.0)
+    _schedule(crashed, lead_id, datetime.now(timezone.utc) - timedelta(days=3, seconds=1))
+    task_id = _tasks(db)[1].id
+    now = datetime.now(timezone.utc)
+
+    async def claim():
+        async with AsyncSessionLocal() as session:
+            return await crashed._claim(session, [task_id], now)
+
+    lease_owner, tasks = run(claim())
+
+    # 租约期间其他进程认领不到，租约过期后的下一次装载重新认领执行
+    other = FollowUpScheduler(horizon_s=60.0, lease_s=60.0)
+    assert run(other.run_once(_sent, now_ts=now.timestamp() + 30)) == 0
+    assert run(other.run_once(_sent, now_ts=now.timestamp() + 61)) == 1
+
+    async def complete_late():
+        async with AsyncSessionLocal() as session:
+            await crashed._complete(session, lease_owner, tasks, {task_id: {"status": "error", "error": "超时"}})
+
+    run(complete_late())
+    assert crashed.get_metrics()["lost_leases"] == 1
+    assert _tasks(db)[1].status == "done"
+    assert _tasks(db)[1].attempts == 2
+
+
+def test_failures_retry_with_backoff_until_max_attempts(db):
+    lead_id = _store_lead(db)
+    scheduler = FollowUpScheduler(horizon_s=60.0, max_attempts=2, retry_backoff_s=100.0)
+    _schedule(scheduler, lead_id, datetime.now(timezone.utc) - timedelta(days=3, seconds=1))
+    now_ts = time.time()
+
+    assert run(scheduler.run_once(_error, now_ts=now_ts)) == 1
+    task = _tasks(db)[1]
+    assert (task.status, task.attempts, task.last_error) == ("pending", 1, "SMTP不可用")
+    assert _utc_due(task) == pytest.approx(now_ts + 100.0, abs=1.0)
+
+    # 退避时间内不会重试
+    assert run(scheduler.run_once(_error, now_ts=now_ts + 50)) == 0
+    assert run(scheduler.run_once(_error, now_ts=now_ts + 101)) == 1
+    task = _tasks(db)[1]
+    assert (task.status, task.attempts) == ("failed", 2)
+    assert scheduler.get_metrics()["retried"] == 1
+    assert scheduler.get_metrics()["failed"] == 1
+    assert db.execute(select(LeadInteraction)).first() is None
+
+
+def test_retried_tasks_return_to_the_wheel(db):
+    lead_id = _store_lead(db)
+    scheduler = FollowUpScheduler(horizon_s=3600.0, retry_backoff_s=10.0)
+    _schedule(scheduler, lead_id, datetime.now(timezone.utc) - timedelta(days=3, seconds=1))
+    now_ts = time.time()
+
+    assert run(scheduler.run_once(_error, now_ts=now_ts)) == 1
+    loaded = scheduler.get_metrics()["loaded"]
+
+    # 下次装载在半个覆盖范围之后，重试只能来自时间轮
+    assert run(scheduler.run_once(_error, now_ts=now_ts + 11)) == 1
+    assert scheduler.get_metrics()["loaded"] == loaded
+    assert _tasks(db)[1].attempts == 2
+
+
+def test_dispatcher_errors_and_blocked_leads(db):
+    lead_id = _store_lead(db)
+    scheduler = FollowUpScheduler(horizon_s=60.0, retry_backoff_s=10.0)
+    _schedule(scheduler, lead_id, datetime.now(timezone.utc) - timedelta(days=10))
+    now_ts = time.time()
+
+    calls = []
+
+    async def dispatch(tasks):
+        calls.append(tasks)
+        if len(calls) == 1:
+            raise RuntimeError("发送服务不可用")
+        return {task["id"]: {"status": "blocked"} for task in tasks}
+
+    assert run(scheduler.run_once(dispatch, now_ts=now_ts)) == 2
+    assert scheduler.get_metrics()["retried"] == 2
+    assert {task.last_error for task in _tasks(db).values()} == {"发送服务不可用"}
+
+    assert run(scheduler.run_once(dispatch, now_ts=now_ts + 31)) == 2
+    assert {task.status for task in _tasks(db).values()} == {"cancelled"}
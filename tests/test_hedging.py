@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm import HedgingPolicy, LatencyTracker, chat_completion, hedging_policy
+
+from conftest import run
+
+MESSAGES = [{"role": "system", "content": "你是一个B2B客户画像分析师"}, {"role": "user", "content": "生成客户画像"}]
+
+
+@pytest.fixture
+def hedging(mock_llm, monkeypatch):
+    """开启对冲，一个延迟样本即可对冲，预算不受之前测试的计数影响"""
+    monkeypatch.setattr(settings, "LLM_HEDGING_ENABLED", True)
+    monkeypatch.setattr(hedging_policy, "min_samples", 1)
+    monkeypatch.setattr(hedging_policy, "min_delay_s", 0.0)
+    monkeypatch.setattr(hedging_policy, "budget_ratio", 1.0)
+    return mock_llm
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker(window_size=100)
+    assert tracker.percentile(95) is None
+
+    for latency in range(1, 101):
+        tracker.record(latency / 100)
+
+    assert tracker.percentile(50) == 0.51
+    assert tracker.percentile(95) == 0.96
+    assert tracker.percentile(100) == 1.0
+
+
+def test_hedge_delay_requires_samples():
+    policy = HedgingPolicy(percentile=95, budget_ratio=0.1, min_delay_s=0.5, min_samples=3, window_size=10)
+    policy.record_latency("gpt", 0.1)
+    policy.record_latency("gpt", 0.2)
+    assert policy.hedge_delay("gpt") is None
+
+    policy.record_latency("gpt", 2.0)
+    assert policy.hedge_delay("gpt") == 2.0
+    assert policy.hedge_delay("other") is None
+
+
+def test_budget_limits_hedges():
+    policy = HedgingPolicy(percentile=95, budget_ratio=0.1, min_delay_s=0.0, min_samples=1, window_size=10)
+    policy.eligible_requests = 20
+
+    assert [policy.try_acquire_budget() for _ in range(3)] == [True, True, False]
+    assert policy.get_metrics()["budget_rejections"] == 1
+
+
+def test_hedge_wins_when_primary_stalls(hedging, monkeypatch):
+    monkeypatch.setattr(hedging.config, "timeout_delay_s", 2.0)
+    hedging_policy.record_latency(settings.OPENAI_MODEL, 0.5)
+    before = hedging.stats()
+    issued, wins = hedging_policy.hedges_issued, hedging_policy.hedge_wins
+
+    async def hedged_request():
+        # 主请求被模拟服务挂起，到达服务端后关闭注入，对冲请求正常返回
+        hedging.config.update({"timeout_rate": 1})
+        request = asyncio.ensure_future(chat_completion(MESSAGES, hedge=True))
+        while (await asyncio.to_thread(hedging.stats))["timeouts"] == before["timeouts"]:
+            await asyncio.sleep(0.01)
+        hedging.config.update({"timeout_rate": 0})
+        return await request
+
+    started = time.monotonic()
+    response = run(hedged_request())
+
+    assert response.choices[0].message.content
+    assert time.monotonic() - started < 2.0
+    assert hedging_policy.hedges_issued == issued + 1
+    assert hedging_policy.hedge_wins == wins + 1
+    assert hedging.stats()["requests"] == before["requests"] + 2
+
+
+def test_fast_primary_is_not_hedged(hedging):
+    hedging_policy.record_latency(settings.OPENAI_MODEL, 5.0)
+    before = hedging.stats()["requests"]
+    eligible, issued = hedging_policy.eligible_requests, hedging_policy.hedges_issued
+
+    assert run(chat_completion(MESSAGES, hedge=True)).choices[0].message.content
+
+    assert hedging_policy.eligible_requests == eligible + 1
+    assert hedging_policy.hedges_issued == issued
+    assert hedging.stats()["requests"] == before + 1
+
+
+def test_batch_calls_are_not_hedged(hedging):
+    eligible = hedging_policy.eligible_requests
+
+    run(chat_completion(MESSAGES))
+
+    assert hedging_policy.eligible_requests == eligible
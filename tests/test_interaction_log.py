@@ -0,0 +1,150 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select, text
+
+from app.core.database import AsyncSessionLocal, Base, engine
+from app.main import app
+from app.models.factory import FactoryStats
+from app.models.lead import Lead, LeadSource, SQLITE_SEARCH_TABLES
+from app.services.interaction_log import interaction_log
+from app.services.lead_persistence import lead_persistence
+from app.services.lead_search import lead_search
+from app.services.schema_upgrade import schema_upgrade
+
+from conftest import run
+
+HISTORY = [
+    {"type": "email", "method": "outbound", "subject": "产品介绍", "content": "您好"},
+    {"type": "email", "method": "inbound", "content": "请报价", "response_received": True},
+]
+
+# 本系列改动之前的版本创建的表（SQLite）
+BASELINE_SCHEMA = [
+    """CREATE TABLE factories (
+        id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, website VARCHAR(500) NOT NULL, description TEXT,
+        location VARCHAR(255), established_year INTEGER, employee_count VARCHAR(100), main_products JSON,
+        product_categories JSON, core_advantages JSON, competitive_position VARCHAR(100), certifications JSON,
+        quality_system VARCHAR(255), ideal_customer_profile JSON, target_markets JSON, target_industries JSON,
+        contact_person VARCHAR(255), contact_title VARCHAR(255), blacklisted_companies JSON, is_active BOOLEAN,
+        profile_completed BOOLEAN, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (website)
+    )""",
+    """CREATE TABLE lead_sources (
+        id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, description TEXT, source_type VARCHAR(100) NOT NULL,
+        is_active BOOLEAN, total_leads INTEGER, conversion_rate FLOAT,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME, PRIMARY KEY (id), UNIQUE (name)
+    )""",
+    """CREATE TABLE leads (
+        id INTEGER NOT NULL, factory_id INTEGER NOT NULL, company_name VARCHAR(255) NOT NULL, website VARCHAR(500),
+        industry VARCHAR(255), company_size VARCHAR(100), location VARCHAR(255), contact_name VARCHAR(255),
+        contact_title VARCHAR(255), contact_email VARCHAR(255), contact_phone VARCHAR(100),
+        linkedin_profile VARCHAR(500), business_needs TEXT, product_requirements JSON, budget_range VARCHAR(100),
+        timeline VARCHAR(100), lead_score FLOAT, qualification_status VARCHAR(50), engagement_level VARCHAR(50),
+        communication_history JSON, last_contact_date DATETIME, next_follow_up_date DATETIME,
+        lead_source VARCHAR(100), discovery_method VARCHAR(100), is_active BOOLEAN, is_converted BOOLEAN,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(factory_id) REFERENCES factories (id)
+    )""",
+    "CREATE INDEX ix_leads_factory_id ON leads (factory_id)",
+    "CREATE INDEX ix_leads_company_name ON leads (company_name)",
+    """CREATE TABLE lead_interactions (
+        id INTEGER NOT NULL, lead_id INTEGER NOT NULL, interaction_type VARCHAR(100) NOT NULL,
+        interaction_method VARCHAR(100) NOT NULL, subject VARCHAR(255), content TEXT, response_received BOOLEAN,
+        response_content TEXT, response_sentiment VARCHAR(50), follow_up_required BOOLEAN, follow_up_date DATETIME,
+        follow_up_notes TEXT, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+        PRIMARY KEY (id), FOREIGN KEY(lead_id) REFERENCES leads (id)
+    )""",
+    "CREATE INDEX ix_lead_interactions_lead_id ON lead_interactions (lead_id)",
+]
+
+
+@pytest.fixture
+def legacy_db(db):
+    """用旧版本的表结构和数据替换测试数据库"""
+    with engine.begin() as connection:
+        for _, fts_name in SQLITE_SEARCH_TABLES:
+            connection.execute(text(f"DROP TABLE IF EXISTS {fts_name}"))
+        Base.metadata.drop_all(connection)
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+
+        connection.execute(text(
+            "INSERT INTO factories (id, name, website) VALUES (1, '宁波精工', 'https://precision.example.com')"
+        ))
+        connection.execute(text(
+            "INSERT INTO lead_sources (name, source_type, total_leads, conversion_rate) "
+            "VALUES ('trade_show', 'event', 0, 0.0)"
+        ))
+        connection.execute(text(
+            "INSERT INTO leads (id, factory_id, company_name, business_needs, lead_score, qualification_status, "
+            "lead_source, is_converted, communication_history) VALUES "
+            "(1, 1, 'Acme Industrial', '采购精密铸件', 80, 'qualified', 'trade_show', 1, :history), "
+            "(2, 1, 'ACME Industrial', NULL, 40, 'unqualified', 'trade_show', 0, NULL)"
+        ), {"history": json.dumps(HISTORY)})
+        connection.execute(text(
+            "INSERT INTO lead_interactions (lead_id, interaction_type, interaction_method, content, "
+            "response_received, response_sentiment, created_at) "
+            "VALUES (1, 'phone', 'outbound', '电话沟通', 1, 'positive', '2020-01-01 00:00:00')"
+        ))
+    return db
+
+
+def test_startup_upgrades_baseline_schema_and_migrates_history(legacy_db):
+    db = legacy_db
+
+    with TestClient(app) as client:
+        detail = client.get("/api/v1/leads/1")
+        leads = client.get("/api/v1/leads", params={"factory_id": 1})
+
+    assert detail.status_code == 200
+    data = detail.json()["data"]
+    assert sorted(i["content"] for i in data["interactions"]) == sorted(["您好", "请报价", "电话沟通"])
+    assert (data["interaction_count"], data["response_count"]) == (3, 2)
+    assert data["last_response_sentiment"] == "positive"
+    assert [lead["id"] for lead in leads.json()["data"]] == [1, 2]
+    assert db.execute(text("SELECT communication_history FROM leads WHERE id = 1")).scalar() is None
+
+    # 新增的统计表和来源计数由明细表重算得出
+    stats = db.get(FactoryStats, 1)
+    assert (stats.total_leads, stats.qualified_leads, stats.conversions, stats.total_interactions) == (2, 1, 1, 3)
+    source = db.execute(select(LeadSource).where(LeadSource.name == "trade_show")).scalar_one()
+    assert (source.total_leads, source.converted_leads, source.conversion_rate) == (2, 1, 0.5)
+
+
+def test_upgraded_leads_support_search_and_dedup(legacy_db):
+    db = legacy_db
+    schema_upgrade.upgrade()
+
+    async def search(query):
+        async with AsyncSessionLocal() as session:
+            return await lead_search.search(session, query)
+
+    assert [lead["id"] for lead in run(search("铸件"))[0]] == [1]
+
+    # 旧数据中的重复客户只有最早一条保留去重键，新写入的同名客户合并到这一条
+    keys = dict(db.execute(select(Lead.id, Lead.company_key)).all())
+    assert keys == {1: "acmeindustrial", 2: None}
+    leads = [{"factory_id": 1, "company_name": "Acme Industrial"}]
+    lead_persistence.write_leads(db, leads)
+    assert leads[0]["id"] == 1
+    assert db.execute(select(func.count()).select_from(Lead)).scalar() == 2
+
+
+def test_upgrade_is_idempotent(legacy_db):
+    first = schema_upgrade.upgrade()
+    second = schema_upgrade.upgrade()
+
+    assert "search_text" in first["columns"]["leads"]
+    assert "ix_leads_factory_company_key" in first["indexes"]
+    assert first["search_rebuilt"]
+    assert second == {"columns": {}, "indexes": [], "search_rebuilt": False}
+
+
+def test_migration_is_idempotent(legacy_db):
+    schema_upgrade.upgrade()
+
+    assert interaction_log.migrate_communication_history(chunk_size=1) == 2
+    assert interaction_log.migrate_communication_history() == 0
+    assert legacy_db.execute(text("SELECT COUNT(*) FROM lead_interactions")).scalar() == 3
@@ -0,0 +1,74 @@
+from sqlalchemy import select
+
+from app.models.lead import Lead
+from app.services.lead_dedup import LeadDedupIndex, lead_dedup_index
+from app.services.lead_generator import LeadGenerator
+from app.services.lead_persistence import lead_persistence
+
+from conftest import run
+
+MARKET_ANALYSIS = {"target_markets": ["欧洲"], "market_trends": ["轻量化"]}
+
+
+def _lead(name, website=None, **values):
+    return {"factory_id": 1, "company_name": name, "website": website, **values}
+
+
+def test_deduplicate_matches_name_domain_and_similar_names():
+    index = LeadDedupIndex(num_perm=64, bands=8, similarity=0.8)
+    first = index.deduplicate(1, [
+        _lead("Acme Industrial GmbH", "https://acme.example.com"),
+        _lead("ACME Industrial", product_requirements=["齿轮"]),
+        _lead("Other Co", "https://www.acme.example.com/about"),
+        _lead("Borealis Precision Manufacturing Ltd"),
+    ])
+
+    assert [lead["company_name"] for lead in first] == ["Acme Industrial GmbH", "Borealis Precision Manufacturing Ltd"]
+    # 本批内的重复记录合并到先出现的记录
+    assert first[0]["product_requirements"] == ["齿轮"]
+
+    second = index.deduplicate(1, [_lead("Borealis Precision Manufacturing Limited"), _lead("Acme Industrial GmbH")])
+    assert second == []
+    assert index.deduplicate(2, [_lead("Acme Industrial GmbH")])
+
+
+def test_forget_leads_allows_them_again():
+    index = LeadDedupIndex(num_perm=64, bands=8, similarity=0.8)
+    leads = index.deduplicate(1, [_lead("Acme Industrial GmbH", "https://acme.example.com")])
+
+    assert index.forget_leads(1, leads) == 1
+    assert len(index.deduplicate(1, [_lead("Acme Industrial GmbH", "https://acme.example.com")])) == 1
+
+
+def test_forget_leads_keeps_stored_leads(db):
+    lead_persistence.write_leads(db, [_lead("Acme Industrial GmbH")])
+    lead_dedup_index.load_stored_leads(db, 1)
+
+    assert lead_dedup_index.forget_leads(1, [_lead("Acme Industrial GmbH")]) == 0
+    assert lead_dedup_index.deduplicate(1, [_lead("Acme Industrial GmbH")]) == []
+
+
+def test_failed_persist_does_not_block_retry(db, mock_llm):
+    generator = LeadGenerator()
+
+    def failing_persist(leads):
+        raise RuntimeError("database is locked")
+
+    generator._persist_leads = failing_persist
+    assert run(generator.generate_and_store_leads(1, MARKET_ANALYSIS)) == 0
+
+    del generator._persist_leads
+    stored = run(generator.generate_and_store_leads(1, MARKET_ANALYSIS))
+
+    assert stored > 0
+    assert len(db.execute(select(Lead.id)).all()) == stored
+
+
+def test_generate_leads_without_storing_does_not_index(mock_llm):
+    generator = LeadGenerator()
+
+    first = run(generator.generate_leads(1, MARKET_ANALYSIS))
+    second = run(generator.generate_leads(1, MARKET_ANALYSIS))
+
+    assert first
+    assert sorted(lead["company_name"] for lead in first) == sorted(lead["company_name"] for lead in second)
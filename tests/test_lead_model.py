@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+from sqlalchemy import select, func
+
+from app.models.factory import FactoryStats
+from app.models.lead import Lead, LeadInteraction
+from app.services.lead_model import (
+    LeadFeatureEncoder, LeadScoringModel, _auc, _fit_logistic_regression, score_factory_leads, train_lead_model
+)
+from app.services.lead_persistence import lead_persistence
+
+
+def _leads(count):
+    leads = []
+    for index in range(count):
+        large = index % 2 == 0
+        leads.append({
+            "factory_id": 1,
+            "company_name": f"Company {index}",
+            "contact_email": f"buyer@company{index}.example.com",
+            "industry": "汽车" if large else "玩具",
+            "company_size": "500+" if large else "10-50",
+            "budget_range": "高" if large else "中等",
+            "timeline": "3-6个月",
+            "qualification_status": "unqualified",
+            "lead_source": "ai_generated",
+        })
+    return leads
+
+
+def _store_with_responses(db, count=40, responds=lambda index, lead: lead["company_size"] == "500+"):
+    leads = _leads(count)
+    lead_persistence.write_leads(db, leads)
+    db.add_all([
+        LeadInteraction(lead_id=lead["id"], interaction_type="email", interaction_method="outbound",
+                        response_received=responds(index, lead), response_sentiment="positive")
+        for index, lead in enumerate(leads)
+    ])
+    db.commit()
+    return leads
+
+
+def test_irls_converges_to_stationary_point():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(500, 3))
+    true_weights = np.array([1.5, -2.0, 0.5])
+    y = (rng.uniform(size=500) < 1 / (1 + np.exp(-(X @ true_weights - 0.3)))).astype(np.float64)
+
+    weights, bias = _fit_logistic_regression(X, y, l2=1.0)
+
+    # 正则化目标的梯度在解处为零
+    p = 1 / (1 + np.exp(-(X @ weights + bias)))
+    assert np.abs(X.T @ (p - y) + weights).max() < 1e-6
+    assert abs(np.sum(p - y)) < 1e-6
+    assert np.sign(weights).tolist() == np.sign(true_weights).tolist()
+
+
+def test_auc():
+    y = np.array([0, 0, 1, 1], dtype=np.float64)
+    assert _auc(y, np.array([0.1, 0.2, 0.8, 0.9])) == 1.0
+    assert _auc(y, np.array([0.9, 0.8, 0.2, 0.1])) == 0.0
+    assert _auc(np.ones(3), np.array([0.1, 0.2, 0.3])) is None
+
+
+def test_model_artifact_round_trip(tmp_path, db):
+    _store_with_responses(db)
+    model = train_lead_model(db, factory_id=1)
+    path = tmp_path / "model.json"
+    model.save(str(path))
+
+    loaded = LeadScoringModel.load(str(path))
+    columns = {
+        "company_size": ["500+", "10-50"], "budget_range": ["高", ""], "timeline": ["", ""],
+        "industry": ["汽车", "其他"], "contact_email": ["a@b.com", None], "contact_phone": [None, None],
+        "linkedin_profile": [None, None], "website": [None, None],
+    }
+
+    assert loaded.metadata == model.metadata
+    assert loaded.metadata["train_auc"] == 1.0
+    np.testing.assert_allclose(loaded.predict_proba(columns), model.predict_proba(columns), atol=1e-5)
+
+
+def test_load_rejects_mismatched_features(tmp_path):
+    path = tmp_path / "model.json"
+    encoder = LeadFeatureEncoder(["汽车"])
+    LeadScoringModel(encoder, np.zeros(len(encoder.feature_names)), 0.0, {}).save(str(path))
+    path.write_text(path.read_text(encoding="utf-8").replace("has_website", "has_fax"), encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        LeadScoringModel.load(str(path))
+
+    # 没有资格阈值的旧模型文件需要重新训练
+    LeadScoringModel(encoder, np.zeros(len(encoder.feature_names)), 0.0, {}).save(str(path))
+    with pytest.raises(ValueError):
+        LeadScoringModel.load(str(path))
+
+
+def test_score_factory_leads_updates_status_and_stats(db):
+    _store_with_responses(db)
+    model = train_lead_model(db, factory_id=1)
+
+    assert score_factory_leads(db, model, factory_id=1) == 40
+    db.expire_all()
+
+    rows = db.execute(select(Lead.company_size, Lead.lead_score, Lead.qualification_status)).all()
+    assert {status for size, _, status in rows if size == "500+"} == {"qualified"}
+    assert {status for size, _, status in rows if size == "10-50"} == {"unqualified"}
+    assert all(score > 60 for size, score, _ in rows if size == "500+")
+
+    qualified = db.execute(
+        select(func.count()).select_from(Lead).where(Lead.qualification_status == "qualified")
+    ).scalar_one()
+    assert db.get(FactoryStats, 1).qualified_leads == qualified == 20
+
+
+def test_model_cutoff_follows_positive_rate(db):
+    # 大客户中只有一半回复，正样本比例 25%，模型概率远低于规则分数线 60
+    _store_with_responses(db, responds=lambda index, lead: index % 4 == 0)
+    model = train_lead_model(db, factory_id=1)
+
+    assert model.metadata["positive_rate"] == 0.25
+    assert model.min_qualified_score < 60
+
+    score_factory_leads(db, model, factory_id=1)
+    db.expire_all()
+
+    rows = db.execute(select(Lead.company_size, Lead.lead_score, Lead.qualification_status)).all()
+    assert all(score < 60 for _, score, _ in rows)
+    assert {status for size, _, status in rows if size == "500+"} == {"qualified"}
+    assert {status for size, _, status in rows if size == "10-50"} == {"unqualified"}
+    assert db.get(FactoryStats, 1).qualified_leads == 20
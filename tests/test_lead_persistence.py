@@ -0,0 +1,86 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from app.core.database import AsyncSessionLocal, Base
+from app.models.factory import FactoryStats
+from app.models.lead import Lead, lead_search_text
+from app.services.lead_persistence import LeadPersistence, lead_persistence
+from app.services.lead_search import lead_search
+
+from conftest import run
+
+# 设置为可写的PostgreSQL地址时运行COPY路径的测试（会创建并清空表）
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+def _lead(name, **values):
+    return {"factory_id": 1, "company_name": name, "qualification_status": "unqualified", **values}
+
+
+def test_write_leads_backfills_ids_and_counts_new_leads(db):
+    leads = [_lead("Acme Industrial"), _lead("Globex"), _lead("ACME Industrial", contact_email="a@acme.com")]
+
+    assert lead_persistence.write_leads(db, leads) == 2
+    assert leads[0]["id"] and leads[1]["id"]
+    assert db.get(Lead, leads[0]["id"]).contact_email == "a@acme.com"
+    assert db.get(FactoryStats, 1).total_leads == 2
+
+    # 与已有记录合并的不重复计数，评分取较高值
+    lead_persistence.write_leads(db, [_lead("Acme Industrial", lead_score=80.0)])
+    db.expire_all()
+    assert db.get(FactoryStats, 1).total_leads == 2
+    assert db.get(Lead, leads[0]["id"]).lead_score == 80.0
+
+
+def test_upsert_recomputes_search_text_from_merged_values(db):
+    lead_persistence.write_leads(db, [_lead("Acme Industrial")])
+    lead_persistence.write_leads(db, [_lead("Acme Industrial", business_needs="精密铸件", product_requirements=["齿轮"])])
+    db.expire_all()
+
+    lead = db.execute(select(Lead)).scalar_one()
+    assert lead.business_needs == "精密铸件"
+    assert lead.search_text == lead_search_text(lead)
+
+    async def search():
+        async with AsyncSessionLocal() as session:
+            return await lead_search.search(session, "铸件", factory_id=1)
+
+    results, _ = run(search())
+    assert [result["company_name"] for result in results] == ["Acme Industrial"]
+
+
+@pytest.fixture
+def postgres_session():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("未设置 TEST_POSTGRES_URL")
+    pytest.importorskip("psycopg2")
+    engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+def test_copy_path_merges_and_recomputes_search_text(postgres_session):
+    persistence = LeadPersistence(batch_size=100, copy_threshold=1)
+    session = postgres_session
+    session.execute(text("INSERT INTO factories (id, name, website) VALUES (1, 'f', 'https://f.example.com')"))
+
+    # 同一事务中连续两次COPY，第二次不能带上第一次留在临时表中的行
+    persistence.write_leads(session, [_lead("Acme Industrial"), _lead("Globex")], commit=False)
+    persistence.write_leads(session, [_lead("Acme Industrial", business_needs="precision castings")], commit=False)
+    session.commit()
+
+    assert persistence.get_metrics()["copy"]["batches"] == 2
+    rows = session.execute(select(Lead.company_name, Lead.business_needs, Lead.search_text).order_by(Lead.id)).all()
+    assert [(name, needs) for name, needs, _ in rows] == [("Acme Industrial", "precision castings"), ("Globex", None)]
+    assert "castings" in rows[0].search_text.split()
+    assert session.get(FactoryStats, 1).total_leads == 2
@@ -0,0 +1,88 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.database import AsyncSessionLocal
+from app.main import app
+from app.services.lead_persistence import lead_persistence
+from app.services.lead_repository import InvalidCursorError, decode_cursor, encode_cursor, lead_repository
+
+from conftest import run
+
+
+@pytest.fixture
+def leads(db):
+    leads = [
+        {"factory_id": 1, "company_name": f"Company {i}", "lead_score": float(i % 4) * 10,
+         "qualification_status": "qualified" if i % 2 else "unqualified", "engagement_level": "high" if i % 3 else "low"}
+        for i in range(10)
+    ]
+    leads.append({"factory_id": 2, "company_name": "Other Factory Lead", "lead_score": 99.0,
+                  "qualification_status": "qualified"})
+    lead_persistence.write_leads(db, leads)
+    return leads
+
+
+def _list_all(**filters):
+    async def pages():
+        collected, cursor, page_sizes = [], None, []
+        async with AsyncSessionLocal() as session:
+            while True:
+                page, cursor = await lead_repository.list_leads(session, limit=3, cursor=cursor, **filters)
+                collected += page
+                page_sizes.append(len(page))
+                if cursor is None:
+                    return collected, page_sizes
+
+    return run(pages())
+
+
+def _expected(leads, **filters):
+    matching = [lead for lead in leads if all(lead.get(key) == value for key, value in filters.items())]
+    return sorted(matching, key=lambda lead: (lead["lead_score"], lead["id"]), reverse=True)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42.5, 7)) == (42.5, 7)
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("not-a-cursor")
+
+
+def test_pages_follow_score_then_id_order(leads):
+    collected, page_sizes = _list_all(factory_id=1)
+
+    assert [lead["id"] for lead in collected] == [lead["id"] for lead in _expected(leads, factory_id=1)]
+    # 相同评分的客户跨页时不重复也不遗漏
+    assert page_sizes == [3, 3, 3, 1]
+
+
+def test_filters_apply_across_pages(leads):
+    collected, _ = _list_all(factory_id=1, qualification_status="qualified", engagement_level="high")
+
+    expected = _expected(leads, factory_id=1, qualification_status="qualified", engagement_level="high")
+    assert [lead["id"] for lead in collected] == [lead["id"] for lead in expected]
+
+
+def test_filtered_listing_uses_composite_index(db, leads):
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM leads WHERE factory_id = 1 AND qualification_status = 'qualified' "
+        "ORDER BY lead_score DESC, id DESC LIMIT 3"
+    )).all()
+
+    details = " ".join(row[-1] for row in plan)
+    assert "ix_leads_factory_status_score_id" in details
+    assert "TEMP B-TREE" not in details
+
+
+def test_leads_endpoint_paginates_and_rejects_bad_cursor(leads):
+    with TestClient(app) as client:
+        first = client.get("/api/v1/leads", params={"factory_id": 1, "limit": 4}).json()
+        second = client.get("/api/v1/leads", params={
+            "factory_id": 1, "limit": 4, "cursor": first["pagination"]["next_cursor"]
+        }).json()
+        invalid = client.get("/api/v1/leads", params={"cursor": "not-a-cursor"})
+
+    expected = [lead["id"] for lead in _expected(leads, factory_id=1)]
+    assert [lead["id"] for lead in first["data"] + second["data"]] == expected[:8]
+    assert first["pagination"]["has_more"] and second["pagination"]["has_more"]
+    assert invalid.status_code == 400
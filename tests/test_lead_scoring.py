@@ -0,0 +1,98 @@
+import json
+import sys
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.factory import Factory
+from app.models.lead import Lead
+from app.services import lead_scoring
+from app.services.lead_generator import LeadGenerator
+from app.services.lead_scoring import DEFAULT_SCORING_RULES, EncodedLeads, LeadScoringEngine, load_scoring_rules
+
+from conftest import run
+
+MARKET_ANALYSIS = {"target_markets": ["北美", "欧洲"], "market_trends": ["自动化"]}
+
+
+def _lead(**values):
+    lead = {
+        "factory_id": 1,
+        "company_name": "Acme",
+        "contact_email": "buyer@acme.example.com",
+        "industry": "汽车",
+        "company_size": "500+",
+        "budget_range": "高",
+        "timeline": "3-6个月",
+        "qualification_status": "unqualified",
+    }
+    lead.update(values)
+    return lead
+
+
+def _stored_scores(db):
+    return dict(db.execute(select(Lead.id, Lead.lead_score)).all())
+
+
+def test_score_matches_rules():
+    engine = LeadScoringEngine()
+    scores = engine.score_leads([
+        _lead(),
+        _lead(company_size="10-50", budget_range="中等", timeline="12个月以上"),
+        _lead(company_size="", budget_range="", timeline=""),
+    ])
+
+    assert scores.tolist() == [100.0, 60.0, 50.0]
+
+
+def test_qualify_requires_contact_score_and_industry():
+    engine = LeadScoringEngine()
+    leads = [_lead(), _lead(contact_email=None), _lead(industry="玩具"), _lead(company_size="", timeline="")]
+
+    assert engine.qualify(EncodedLeads.from_leads(leads)).tolist() == [True, False, False, True]
+
+
+def test_rescore_with_identical_rules_keeps_scores(db, mock_llm):
+    db.add(Factory(name="测试工厂", website="https://factory.example.com"))
+    db.commit()
+
+    stored = run(LeadGenerator().generate_and_store_leads(1, MARKET_ANALYSIS))
+    before = _stored_scores(db)
+    assert stored and len(before) == stored
+    assert all(lead.expected_order_size for lead in db.execute(select(Lead)).scalars())
+
+    LeadScoringEngine(DEFAULT_SCORING_RULES).rescore_stored_leads(db, factory_id=1)
+    db.expire_all()
+
+    assert _stored_scores(db) == before
+
+
+def test_rescore_applies_new_rules_and_keeps_hot(db):
+    db.add_all([
+        Lead(**_lead(company_name="A")),
+        Lead(**_lead(company_name="B", qualification_status="hot")),
+    ])
+    db.commit()
+
+    rules = {**DEFAULT_SCORING_RULES, "base_score": 0.0, "min_qualified_score": 90.0}
+    assert LeadScoringEngine(rules).rescore_stored_leads(db) == 2
+    db.expire_all()
+
+    rows = db.execute(select(Lead.company_name, Lead.lead_score, Lead.qualification_status)).all()
+    assert sorted(rows) == [("A", 50.0, "unqualified"), ("B", 50.0, "hot")]
+
+
+def test_rescore_cli_loads_rules_file(db, tmp_path, monkeypatch, capsys):
+    db.add(Lead(**_lead()))
+    db.commit()
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"base_score": 10.0}), encoding="utf-8")
+
+    monkeypatch.setattr(settings, "LEAD_SCORING_RULES_PATH", str(rules_path))
+    monkeypatch.setattr(sys, "argv", ["lead_scoring", "--factory-id", "1"])
+    lead_scoring.main()
+    db.expire_all()
+
+    assert load_scoring_rules(str(rules_path))["fields"] == DEFAULT_SCORING_RULES["fields"]
+    assert db.execute(select(Lead.lead_score)).scalar_one() == 60.0
+    assert "已重新评分 1 个潜在客户" in capsys.readouterr().out
@@ -0,0 +1,101 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.database import AsyncSessionLocal
+from app.core.text_search import build_search_text, query_tokens, search_tokens
+from app.main import app
+from app.models.lead import Lead
+from app.services.interaction_log import interaction_log
+from app.services.lead_persistence import lead_persistence
+from app.services.lead_search import InvalidSearchQueryError, lead_search
+
+from conftest import run
+
+
+@pytest.fixture
+def leads(db):
+    leads = [
+        {"factory_id": 1, "company_name": "Acme Gearworks", "business_needs": "采购精密齿轮"},
+        {"factory_id": 1, "company_name": "Globex", "product_requirements": ["齿轮箱", "轴承"]},
+        {"factory_id": 1, "company_name": "Initech", "business_needs": "办公家具"},
+        {"factory_id": 2, "company_name": "Umbrella", "business_needs": "齿轮"},
+    ]
+    for lead in leads:
+        lead["qualification_status"] = "unqualified"
+    lead_persistence.write_leads(db, leads)
+    interaction_log.record_many(db, [{"lead_id": leads[2]["id"], "type": "email", "content": "询问齿轮报价"}])
+    return {lead["company_name"]: lead["id"] for lead in leads}
+
+
+def _search(query, **kwargs):
+    async def search():
+        async with AsyncSessionLocal() as session:
+            return await lead_search.search(session, query, **kwargs)
+
+    return run(search())
+
+
+def _names(results):
+    return [result["company_name"] for result in results]
+
+
+def test_tokens_split_cjk_into_bigrams():
+    assert search_tokens("Acme 汽车零件, 铸") == ["acme", "汽车", "车零", "零件", "铸"]
+    assert build_search_text("齿轮", ["Gear", {"note": "箱"}], None) == "齿轮 gear 箱"
+    assert query_tokens("齿轮 齿轮") == ["齿轮"]
+
+
+def test_matches_lead_fields_and_interactions(leads):
+    results, cursor = _search("齿轮", factory_id=1)
+
+    assert set(_names(results)) == {"Acme Gearworks", "Globex", "Initech"}
+    # 只在互动记录中命中的客户排在最后
+    assert _names(results)[-1] == "Initech"
+    assert cursor is None
+    scores = [result["search_score"] for result in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_prefix_match_and_factory_filter(leads):
+    results, _ = _search("gear")
+    assert _names(results) == ["Acme Gearworks"]
+
+    results, _ = _search("齿轮", factory_id=2, fields=["company_name"])
+    assert results == [{"company_name": "Umbrella", "search_score": results[0]["search_score"]}]
+
+
+def test_pages_do_not_repeat_results(leads):
+    first, cursor = _search("齿轮", limit=2)
+    second, last_cursor = _search("齿轮", limit=2, cursor=cursor)
+
+    assert len(first) == 2 and last_cursor is None
+    assert sorted(_names(first + second)) == ["Acme Gearworks", "Globex", "Initech", "Umbrella"]
+
+
+def test_index_follows_updates_and_deletes(db, leads):
+    lead = db.get(Lead, leads["Initech"])
+    lead.business_needs = "数控机床"
+    db.commit()
+    db.delete(db.get(Lead, leads["Globex"]))
+    db.commit()
+
+    assert _names(_search("机床")[0]) == ["Initech"]
+    assert _names(_search("家具")[0]) == []
+    assert "Globex" not in _names(_search("轴承")[0])
+
+
+def test_rebuild_restores_index(db, leads):
+    assert lead_search.rebuild(db) == len(leads) + 1
+    assert set(_names(_search("齿轮")[0])) == {"Acme Gearworks", "Globex", "Initech", "Umbrella"}
+
+
+def test_empty_query_is_rejected(leads):
+    with pytest.raises(InvalidSearchQueryError):
+        _search("!!!")
+
+    with TestClient(app) as client:
+        response = client.get("/api/v1/leads/search", params={"q": "!!!"})
+        found = client.get("/api/v1/leads/search", params={"q": "gear", "fields": "company_name"})
+
+    assert response.status_code == 400
+    assert [lead["company_name"] for lead in found.json()["data"]] == ["Acme Gearworks"]
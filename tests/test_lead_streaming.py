@@ -0,0 +1,94 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.websocket import manager
+from app.main import app
+from app.models.lead import Lead
+from app.services.lead_generator import LeadGenerator
+
+from conftest import run
+
+MARKET_ANALYSIS = {"target_markets": ["北美", "欧洲"], "market_trends": ["自动化"]}
+
+
+class RecordingWebSocket:
+    """记录推送消息的WebSocket替身"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_text(self, message: str):
+        self.messages.append(json.loads(message))
+
+
+def test_stream_yields_each_profile_as_it_completes(mock_llm):
+    async def collect():
+        return [batch async for batch in LeadGenerator().stream_leads(1, MARKET_ANALYSIS)]
+
+    batches = run(collect())
+
+    assert len(batches) > 1
+    assert all(batch and all(lead["factory_id"] == 1 for lead in batch) for batch in batches)
+    names = [lead["company_name"] for batch in batches for lead in batch]
+    assert len(names) == len(set(names))
+
+
+def test_closing_stream_cancels_pending_profiles(mock_llm):
+    async def first_batch():
+        stream = LeadGenerator().stream_leads(1, MARKET_ANALYSIS)
+        batch = await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return batch, pending
+
+    batch, pending = run(first_batch())
+
+    assert batch
+    assert all(task.done() for task in pending)
+
+
+def test_store_pushes_micro_batches_to_subscribers(db, mock_llm, monkeypatch):
+    monkeypatch.setattr(settings, "LEAD_STREAM_BATCH_SIZE", 2)
+    subscriber, other = RecordingWebSocket(), RecordingWebSocket()
+    manager.subscribe(subscriber, 1)
+    manager.subscribe(other, 2)
+    try:
+        stored = run(LeadGenerator().generate_and_store_leads(1, MARKET_ANALYSIS))
+    finally:
+        manager.disconnect(subscriber)
+        manager.disconnect(other)
+
+    assert stored == db.execute(select(func.count()).select_from(Lead)).scalar()
+    events = subscriber.messages
+    batches = [event["data"] for event in events if event["type"] == "leads_generated"]
+    assert all(0 < len(batch["leads"]) <= 2 for batch in batches)
+    assert all(lead["id"] for batch in batches for lead in batch["leads"])
+    assert [batch["total"] for batch in batches] == sorted(batch["total"] for batch in batches)
+    assert events[-1] == {**events[-1], "type": "lead_generation_completed", "data": {"total": stored}}
+    assert other.messages == []
+
+
+def test_websocket_subscription_lifecycle():
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws/ws/client-1") as websocket:
+            assert websocket.receive_json()["type"] == "connection_established"
+
+            websocket.send_json({"type": "subscribe_factory", "factory_id": 7})
+            assert websocket.receive_json() == {"type": "subscribe_factory_ok", "factory_id": 7}
+            assert len(manager.factory_subscriptions[7]) == 1
+
+            websocket.send_json({"type": "subscribe_factory"})
+            assert websocket.receive_json()["type"] == "error"
+
+        # 服务端收到断开消息后清理连接和订阅
+        deadline = time.monotonic() + 2.0
+        while manager.active_connections and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert manager.active_connections == []
+        assert 7 not in manager.factory_subscriptions
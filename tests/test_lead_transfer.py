@@ -0,0 +1,65 @@
+import sys
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import lead_transfer
+from app.services.lead_persistence import lead_persistence
+
+
+def _store(db):
+    lead_persistence.write_leads(db, [
+        {"factory_id": 1, "company_name": name, "qualification_status": "unqualified",
+         "product_requirements": ["齿轮"]}
+        for name in ("Acme", "Globex", "Initech")
+    ])
+
+
+def test_ndjson_export_streams_all_leads(db):
+    _store(db)
+
+    with TestClient(app) as client:
+        response = client.get("/api/v1/leads/export", params={"format": "ndjson", "fields": "company_name"})
+
+    assert response.status_code == 200
+    rows = [orjson.loads(line) for line in response.content.splitlines()]
+    assert [row["company_name"] for row in rows] == ["Acme", "Globex", "Initech"]
+
+
+def test_parquet_export_without_pyarrow_returns_400(db, monkeypatch):
+    _store(db)
+    monkeypatch.setattr(lead_transfer.importlib.util, "find_spec", lambda name: None)
+
+    with TestClient(app) as client:
+        response = client.get("/api/v1/leads/export", params={"format": "parquet"})
+
+    assert response.status_code == 400
+    assert "pyarrow" in response.json()["error"]
+
+
+def test_parquet_cli_without_pyarrow_exits_with_message(tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    monkeypatch.setattr(sys, "argv", ["lead_transfer", "export", "--format", "parquet",
+                                      "--output", str(tmp_path / "leads.parquet")])
+
+    with pytest.raises(SystemExit):
+        lead_transfer.main()
+
+    assert "pyarrow" in capsys.readouterr().out
+
+
+def test_parquet_export(db, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    _store(db)
+
+    with TestClient(app) as client:
+        response = client.get("/api/v1/leads/export", params={"format": "parquet"})
+
+    assert response.status_code == 200
+    path = tmp_path / "leads.parquet"
+    path.write_bytes(response.content)
+    table = pq.read_table(str(path))
+    assert table.column("company_name").to_pylist() == ["Acme", "Globex", "Initech"]
+    assert orjson.loads(table.column("product_requirements")[0].as_py()) == ["齿轮"]
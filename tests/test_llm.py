@@ -0,0 +1,50 @@
+from app.core.config import settings
+from app.core.llm import chat_completion, get_llm_client, reset_llm_client
+from app.models.factory import Factory
+from app.services.lead_generator import LeadGenerator
+
+from conftest import run
+
+MARKET_ANALYSIS = {
+    "target_markets": ["北美", "欧洲"],
+    "opportunity_score": 85,
+    "market_trends": ["数字化转型", "可持续发展"]
+}
+
+
+def test_client_uses_configured_base_url(mock_llm):
+    client = get_llm_client()
+    assert str(client.base_url).rstrip("/") == mock_llm.base_url
+    assert client.api_key == settings.OPENAI_API_KEY
+    assert get_llm_client() is client
+
+    reset_llm_client()
+    assert get_llm_client() is not client
+
+
+def test_chat_completion_against_mock(mock_llm):
+    before = mock_llm.stats()["requests"]
+
+    response = run(chat_completion([
+        {"role": "system", "content": "你是一个B2B客户画像分析师"},
+        {"role": "user", "content": "生成客户画像"}
+    ]))
+
+    assert response.choices[0].message.content
+    assert response.usage.total_tokens > 0
+    assert mock_llm.stats()["requests"] == before + 1
+
+
+def test_generate_leads_end_to_end(mock_llm, db):
+    db.add(Factory(name="测试工厂", website="https://factory.example.com"))
+    db.commit()
+    before = mock_llm.stats()
+
+    leads = run(LeadGenerator().generate_leads(factory_id=1, market_analysis=MARKET_ANALYSIS))
+
+    after = mock_llm.stats()
+    assert leads
+    assert all(lead["factory_id"] == 1 and lead["company_name"] for lead in leads)
+    assert after["requests"] > before["requests"]
+    assert after["by_prompt_type"].get("customer_profiles", 0) > before["by_prompt_type"].get("customer_profiles", 0)
+    assert after["by_prompt_type"].get("leads_for_profile", 0) > before["by_prompt_type"].get("leads_for_profile", 0)
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from app.core.llm import chat_completion
+from app.core.llm_scheduler import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, LLMDeadlineExceeded, LLMRequestScheduler,
+    llm_request_context, llm_scheduler
+)
+
+from conftest import run
+
+DEADLINES = {PRIORITY_INTERACTIVE: 30.0, PRIORITY_NORMAL: 60.0, PRIORITY_BATCH: 60.0}
+
+
+def _scheduler(max_concurrency, interactive_reserved=0):
+    return LLMRequestScheduler(max_concurrency, interactive_reserved, DEADLINES)
+
+
+async def _hold(scheduler, release, **kwargs):
+    async with scheduler.slot(**kwargs):
+        await release.wait()
+
+
+async def _record(scheduler, order, name, **kwargs):
+    async with scheduler.slot(**kwargs):
+        order.append(name)
+        await asyncio.sleep(0)
+
+
+def test_interactive_uses_reserved_slot():
+    async def scenario():
+        scheduler = _scheduler(max_concurrency=2, interactive_reserved=1)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(scheduler, release, priority=PRIORITY_BATCH))
+        await asyncio.sleep(0)
+
+        order = []
+        batch = asyncio.ensure_future(_record(scheduler, order, "batch", priority=PRIORITY_BATCH))
+        interactive = asyncio.ensure_future(_record(scheduler, order, "interactive", priority=PRIORITY_INTERACTIVE))
+        await interactive
+        # 批量请求只能使用预留之外的槽位，需要等待
+        assert order == ["interactive"]
+        assert scheduler.get_metrics()["queue_depth"][PRIORITY_BATCH] == 1
+
+        release.set()
+        await asyncio.gather(holder, batch)
+        return order
+
+    assert run(scenario()) == ["interactive", "batch"]
+
+
+def test_flows_share_capacity_by_weight():
+    async def scenario():
+        scheduler = _scheduler(max_concurrency=1)
+        scheduler.set_flow_weight("b", 2.0)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(scheduler, release, flow="warmup"))
+        await asyncio.sleep(0)
+
+        order = []
+        requests = [asyncio.ensure_future(_record(scheduler, order, "a", flow="a")) for _ in range(4)]
+        requests += [asyncio.ensure_future(_record(scheduler, order, "b", flow="b")) for _ in range(4)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *requests)
+        return order
+
+    # 先入队的工厂 a 不会独占，权重为2的工厂 b 分到两倍的份额
+    assert run(scenario()) == ["b", "a", "b", "b", "a", "b", "a", "a"]
+
+
+def test_expired_requests_are_dropped():
+    async def scenario():
+        scheduler = _scheduler(max_concurrency=1)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(scheduler, release))
+        await asyncio.sleep(0)
+
+        order = []
+        expired = asyncio.ensure_future(_record(scheduler, order, "expired", deadline_s=0.01))
+        waiting = asyncio.ensure_future(_record(scheduler, order, "waiting"))
+        await asyncio.sleep(0.05)
+        release.set()
+        await holder
+        with pytest.raises(LLMDeadlineExceeded):
+            await expired
+        await waiting
+        return order, scheduler.get_metrics()
+
+    order, metrics = run(scenario())
+    assert order == ["waiting"]
+    assert metrics["dropped"][PRIORITY_NORMAL] == 1
+    assert metrics["in_flight"][PRIORITY_NORMAL] == 0
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        scheduler = _scheduler(max_concurrency=1)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(scheduler, release))
+        await asyncio.sleep(0)
+
+        cancelled = asyncio.ensure_future(_record(scheduler, [], "cancelled"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+        await holder
+
+        order = []
+        await asyncio.wait_for(_record(scheduler, order, "next"), timeout=1.0)
+        return order, scheduler.in_flight
+
+    assert run(scenario()) == (["next"], 0)
+
+
+def test_request_context_sets_priority(mock_llm):
+    dispatched = llm_scheduler.get_metrics()["dispatched"][PRIORITY_INTERACTIVE]
+
+    async def interactive_call():
+        with llm_request_context(priority=PRIORITY_INTERACTIVE, factory_id=1):
+            return await chat_completion([{"role": "user", "content": "你好"}])
+
+    assert run(interactive_call()).choices[0].message.content
+    assert llm_scheduler.get_metrics()["dispatched"][PRIORITY_INTERACTIVE] == dispatched + 1
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models.factory import Factory
+from app.services.ai_agent import AIAgentService
+from app.services.content_creator import ContentCreator
+from app.services.lead_persistence import lead_persistence
+from app.services.profile_repository import (
+    FACTORY_PROFILE_FIELDS, ProfileCache, ProfileNotFoundError, profile_repository
+)
+from app.services.template_renderer import template_engine
+
+from conftest import run
+
+FACTORY = {
+    "name": "宁波精工",
+    "website": "https://precision.example.com",
+    "description": "二十年精密铸造经验的出口工厂",
+    "main_products": ["铝合金压铸件"],
+    "core_advantages": ["交期稳定"],
+    "ideal_customer_profile": {"industries": ["汽车零部件"]},
+}
+
+
+@pytest.fixture
+def factory_id(db):
+    factory = Factory(**FACTORY)
+    db.add(factory)
+    db.commit()
+    return factory.id
+
+
+def _cache(**overrides):
+    options = dict(max_entries=10, refresh_s=60.0)
+    options.update(overrides)
+    return ProfileCache(Factory, FACTORY_PROFILE_FIELDS, **options)
+
+
+def test_reads_through_and_returns_copies(factory_id):
+    cache = _cache()
+
+    async def read_twice():
+        first = await cache.get(factory_id)
+        first["name"] = "已修改"
+        return await cache.get(factory_id), await cache.get(factory_id + 1)
+
+    factory, missing = run(read_twice())
+
+    assert factory["name"] == "宁波精工"
+    assert set(factory) == set(FACTORY_PROFILE_FIELDS)
+    assert missing is None
+    assert cache.get_metrics() == {"cached": 1, "hits": 1, "coalesced": 0, "version_checks": 0, "loads": 2}
+
+
+def test_concurrent_reads_are_coalesced(factory_id):
+    cache = _cache()
+
+    async def reads():
+        return await asyncio.gather(*(cache.get(factory_id) for _ in range(5)))
+
+    assert [factory["name"] for factory in run(reads())] == ["宁波精工"] * 5
+    assert cache.loads == 1
+    assert cache.coalesced == 4
+
+
+def test_version_check_reloads_only_updated_profiles(db, factory_id):
+    cache = _cache(refresh_s=0.0)
+    run(cache.get(factory_id))
+
+    # 版本未变时只查询 updated_at
+    assert run(cache.get(factory_id))["name"] == "宁波精工"
+    assert (cache.version_checks, cache.loads) == (1, 1)
+
+    # 其他进程更新档案后 updated_at 变化，重新读取整行
+    db.get(Factory, factory_id).name = "宁波精工集团"
+    db.commit()
+    assert run(cache.get(factory_id))["name"] == "宁波精工集团"
+    assert (cache.version_checks, cache.loads) == (2, 2)
+
+
+def test_least_recently_used_profiles_are_evicted(db):
+    db.add_all([Factory(name=f"工厂{i}", website=f"https://f{i}.example.com") for i in range(3)])
+    db.commit()
+    cache = _cache(max_entries=2)
+
+    async def reads():
+        await cache.get_many([1, 2])
+        await cache.get(1)
+        await cache.get(3)
+
+    run(reads())
+    assert list(cache.entries) == [1, 3]
+
+
+def test_confirm_profile_saves_and_invalidates(factory_id):
+    run(profile_repository.get_factory(factory_id))
+    template_engine.compile_factory(factory_id, FACTORY)
+
+    result = run(AIAgentService().confirm_factory_profile({**FACTORY, "name": "宁波精工集团"}))
+
+    # 按网站匹配到已有工厂并更新，缓存和已编译模板失效
+    assert result["status"] == "success"
+    assert result["factory"]["id"] == factory_id
+    assert template_engine.get_factory_templates(factory_id) is None
+    assert run(profile_repository.get_factory(factory_id))["name"] == "宁波精工集团"
+    assert profile_repository.factories.loads == 2
+
+    created = run(AIAgentService().confirm_factory_profile({**FACTORY, "website": "https://new.example.com"}))
+    assert created["factory"]["id"] != factory_id
+    assert created["factory"]["profile_completed"] is True
+
+
+def test_campaign_loads_each_profile_once(db, factory_id, mock_llm):
+    leads = [
+        {"factory_id": factory_id, "company_name": f"Nordic Parts {i}", "industry": "汽车零部件",
+         "contact_name": "Anna", "business_needs": "寻找稳定的精密铸件供应商", "qualification_status": "qualified"}
+        for i in range(5)
+    ]
+    lead_persistence.write_leads(db, leads)
+    lead_ids = [lead["id"] for lead in leads]
+
+    async def campaign():
+        await profile_repository.get_leads(lead_ids)
+        creator = ContentCreator()
+        return [await creator.create_personalized_content(factory_id, lead_id) for lead_id in lead_ids]
+
+    contents = run(campaign())
+
+    assert [content["lead_id"] for content in contents] == lead_ids
+    assert profile_repository.factories.loads == 1
+    assert profile_repository.leads.loads == 1
+    with pytest.raises(ProfileNotFoundError):
+        run(profile_repository.get_lead(999))
+
+
+def test_factory_endpoint_returns_404_for_missing_factory(factory_id):
+    with TestClient(app) as client:
+        found = client.get(f"/api/v1/factories/{factory_id}")
+        missing = client.get("/api/v1/factories/999")
+
+    assert found.json()["data"]["name"] == "宁波精工"
+    assert missing.status_code == 404
+    assert missing.json() == {"error": "工厂 999 不存在", "status_code": 404}
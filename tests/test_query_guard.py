@@ -0,0 +1,71 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import TooManyQueriesError, count_queries
+from app.core.sqlite_writer import sqlite_writer
+from app.main import app
+from app.services.lead_persistence import lead_persistence
+
+from conftest import run
+
+
+@pytest.fixture
+def lead_id(db):
+    leads = [{"factory_id": 1, "company_name": "Acme", "qualification_status": "unqualified"}]
+    lead_persistence.write_leads(db, leads)
+    return leads[0]["id"]
+
+
+def test_guard_reports_query_count(lead_id):
+    with TestClient(app) as client:
+        response = client.get(f"/api/v1/leads/{lead_id}")
+
+    assert response.status_code == 200
+    assert 0 < int(response.headers["X-DB-Query-Count"]) <= settings.DB_QUERY_GUARD_MAX_QUERIES
+
+
+def test_guard_raises_in_debug(lead_id, monkeypatch):
+    monkeypatch.setattr(settings, "DB_QUERY_GUARD_MAX_QUERIES", 0)
+
+    with TestClient(app) as client:
+        with pytest.raises(TooManyQueriesError):
+            client.get(f"/api/v1/leads/{lead_id}")
+
+
+def test_guard_returns_500_without_debug(lead_id, monkeypatch):
+    monkeypatch.setattr(settings, "DB_QUERY_GUARD_MAX_QUERIES", 0)
+    monkeypatch.setattr(settings, "DEBUG", False)
+
+    with TestClient(app) as client:
+        response = client.get(f"/api/v1/leads/{lead_id}")
+
+    assert response.status_code == 500
+    assert "超过上限 0" in response.json()["error"]
+
+
+def test_guard_disabled(lead_id, monkeypatch):
+    monkeypatch.setattr(settings, "DB_QUERY_GUARD_ENABLED", False)
+
+    with TestClient(app) as client:
+        response = client.get(f"/api/v1/leads/{lead_id}")
+
+    assert response.status_code == 200
+    assert "X-DB-Query-Count" not in response.headers
+
+
+def test_count_includes_write_queue_jobs(db):
+    assert sqlite_writer.enabled
+
+    def job(session):
+        return session.execute(text("SELECT 1")).scalar()
+
+    with count_queries() as counter:
+        assert sqlite_writer.write(job) == 1
+        assert run(sqlite_writer.write_async(job)) == 1
+
+    # 写线程在调用方的上下文中执行，语句计入调用方；代码块之外的写操作不再计入
+    assert counter.count == 2
+    sqlite_writer.write(job)
+    assert counter.count == 2
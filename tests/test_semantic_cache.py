@@ -0,0 +1,54 @@
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.semantic_cache import SemanticCache, lead_prompt_cache
+from app.services import lead_generator as lead_generator_module
+from app.services.lead_generator import LeadGenerator, PROFILE_CACHE_SCOPE
+
+from conftest import run
+
+MARKET_ANALYSIS = {"target_markets": ["北美"], "market_trends": ["自动化"]}
+
+
+def test_lookup_is_isolated_by_scope():
+    cache = SemanticCache("test", threshold=0.9, max_entries=4, dim=256)
+    cache.store("行业类型: 汽车零部件 地理位置: 德国", "工厂1的结果", scope=1)
+
+    assert cache.lookup("行业类型: 汽车零部件 地理位置: 德国", scope=1)["value"] == "工厂1的结果"
+    assert cache.lookup("行业类型: 汽车零部件 地理位置: 德国", scope=2) is None
+
+
+def test_store_overwrites_oldest_entry_when_full():
+    cache = SemanticCache("test", threshold=0.99, max_entries=2, dim=256)
+    for index, text in enumerate(["第一条提示", "第二条提示", "第三条提示"]):
+        cache.store(text, index)
+
+    assert cache.lookup("第一条提示") is None
+    assert cache.lookup("第三条提示")["value"] == 2
+
+
+def test_customer_profiles_are_shared_across_factories(mock_llm):
+    generator = LeadGenerator()
+    before = mock_llm.stats()["by_prompt_type"].get("customer_profiles", 0)
+
+    first = run(generator._generate_customer_profiles(MARKET_ANALYSIS))
+    second = run(generator._generate_customer_profiles(MARKET_ANALYSIS))
+
+    assert first and first == second
+    assert mock_llm.stats()["by_prompt_type"]["customer_profiles"] == before + 1
+
+
+def test_leads_are_not_reused_across_factories(mock_llm, monkeypatch):
+    generator = LeadGenerator()
+    profiles = run(generator._generate_customer_profiles(MARKET_ANALYSIS))
+    factory_1_leads = run(generator._generate_leads_for_profile(1, profiles[0]))
+    assert factory_1_leads
+
+    async def circuit_open(*args, **kwargs):
+        raise CircuitOpenError("LLM熔断器已打开")
+
+    monkeypatch.setattr(lead_generator_module, "chat_completion", circuit_open)
+
+    # 熔断降级只复用同一工厂的结果
+    assert run(generator._generate_leads_for_profile(2, profiles[0])) == []
+    fallback = run(generator._generate_leads_for_profile(1, profiles[0]))
+    assert [lead["company_name"] for lead in fallback] == [lead["company_name"] for lead in factory_1_leads]
+    assert lead_prompt_cache.lookup(generator._market_cache_text(MARKET_ANALYSIS), scope=PROFILE_CACHE_SCOPE)
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.core.serialization import InvalidFieldsError, ModelSerializer, parse_fields
+from app.main import app
+from app.models.lead import Lead
+from app.services.interaction_log import interaction_log
+from app.services.lead_persistence import lead_persistence
+
+serializer = ModelSerializer(Lead, exclude=("search_text",))
+
+
+@pytest.fixture
+def lead_id(db):
+    leads = [{"factory_id": 1, "company_name": "Acme", "lead_score": 80.0, "qualification_status": "qualified",
+              "product_requirements": ["齿轮", "轴承"]}]
+    lead_persistence.write_leads(db, leads)
+    interaction_log.record_many(db, [
+        {"lead_id": leads[0]["id"], "type": "email", "method": "outbound", "subject": "产品介绍", "content": "您好"},
+        {"lead_id": leads[0]["id"], "type": "email", "method": "inbound", "content": "请报价"},
+    ])
+    return leads[0]["id"]
+
+
+def test_parse_fields():
+    assert parse_fields(None) is None
+    assert parse_fields(" , ") is None
+    assert parse_fields("id, company_name,id,") == ["id", "company_name"]
+
+
+def test_select_columns_validates_and_adds_required():
+    columns = serializer.select_columns(["company_name"], required=("lead_score", "id"))
+    assert [column.name for column in columns] == ["company_name", "lead_score", "id"]
+
+    with pytest.raises(InvalidFieldsError):
+        serializer.select_columns(["company_name", "password"])
+    # 排除的列不能通过 fields 取出
+    with pytest.raises(InvalidFieldsError):
+        serializer.select_columns(["search_text"])
+
+
+def test_rows_match_model_to_dict(db, lead_id):
+    rows = db.execute(select(*serializer.select_columns())).all()
+    lead = db.get(Lead, lead_id)
+
+    assert serializer.rows_to_dicts(rows) == [{name: getattr(lead, name) for name in serializer.field_names}]
+    # 只用于分页的列不会出现在结果中
+    sparse_rows = db.execute(select(*serializer.select_columns(["company_name"], required=("id",)))).all()
+    assert serializer.rows_to_dicts(sparse_rows, ["company_name"]) == [{"company_name": "Acme"}]
+    assert serializer.rows_to_dicts([]) == []
+
+
+def test_list_endpoint_encodes_like_to_dict(db, lead_id):
+    with TestClient(app) as client:
+        response = client.get("/api/v1/leads")
+
+    expected = json.loads(json.dumps(db.get(Lead, lead_id).to_dict()))
+    (data,) = response.json()["data"]
+    assert data == {name: expected[name] for name in data}
+    assert "search_text" not in data
+
+
+def test_sparse_fieldsets_on_list_endpoints(lead_id):
+    with TestClient(app) as client:
+        leads = client.get("/api/v1/leads", params={"fields": "company_name,lead_score"})
+        interactions = client.get(f"/api/v1/leads/{lead_id}/interactions", params={"fields": "content"})
+        invalid = client.get("/api/v1/leads", params={"fields": "company_name,password"})
+
+    assert leads.json()["data"] == [{"company_name": "Acme", "lead_score": 80.0}]
+    # 互动记录分页需要ID，因此总是返回 id
+    rows = interactions.json()["data"]
+    assert all(set(row) == {"id", "content"} for row in rows)
+    assert sorted(row["content"] for row in rows) == ["您好", "请报价"]
+    assert invalid.status_code == 400
+    assert "password" in invalid.json()["error"]